@@ -1,12 +1,21 @@
 const API_URL = 'http://localhost:5000/api';
 
-async function loadArchived() {
+// List cards show a thumbnail of each stored image; the full image opens on click
+function thumbnailUrl(url) {
+    return url.startsWith('/api/blobs/') ? `${url}/thumbnail` : url;
+}
+
+// Cursor for the next page of archived packages (null when there are no more)
+let archiveNextCursor = null;
+let archiveLoaded = [];
+
+async function loadArchived(append = false) {
     const searchTerm = document.getElementById('archiveFilter').value.toLowerCase();
     
     try {
-        const url = searchTerm 
-            ? `${API_URL}/packages/archived?search=${encodeURIComponent(searchTerm)}`
-            : `${API_URL}/packages/archived`;
+        let url = `${API_URL}/packages/archived?fields=all`;
+        if (searchTerm) url += `&search=${encodeURIComponent(searchTerm)}`;
+        if (append && archiveNextCursor) url += `&cursor=${encodeURIComponent(archiveNextCursor)}`;
             
         const response = await fetch(url);
         
@@ -15,7 +24,9 @@ async function loadArchived() {
         }
         
         const packages = await response.json();
-        displayArchivedPackages(packages);
+        archiveNextCursor = response.headers.get('X-Next-Cursor');
+        archiveLoaded = append ? archiveLoaded.concat(packages) : packages;
+        displayArchivedPackages(archiveLoaded);
     } catch (error) {
         console.error('Error loading archived packages:', error);
         document.getElementById('archiveList').innerHTML = 
@@ -33,7 +44,7 @@ function displayArchivedPackages(packages) {
     
     const html = packages.map(pkg => `
         <div class="package-card">
-            ${pkg.label_image ? `<img src="${pkg.label_image}" alt="Label" style="max-width: 200px; border-radius: 8px; margin-bottom: 10px;">` : ''}
+            ${pkg.label_image ? `<a href="${pkg.label_image}" target="_blank"><img src="${thumbnailUrl(pkg.label_image)}" alt="Label" loading="lazy" style="max-width: 200px; border-radius: 8px; margin-bottom: 10px;"></a>` : ''}
             <div class="package-info"><strong>Courier:</strong> ${pkg.courier}</div>
             <div class="package-info"><strong>Tracking:</strong> ${pkg.tracking}</div>
             <div class="package-info"><strong>Name:</strong> ${pkg.name}</div>
@@ -44,14 +55,16 @@ function displayArchivedPackages(packages) {
             ${pkg.signature_image ? `
                 <div class="package-info">
                     <strong>Signature:</strong><br>
-                    <img src="${pkg.signature_image}" alt="Signature" style="max-width: 300px; border: 2px solid #ddd; border-radius: 8px; margin-top: 10px;">
+                    <a href="${pkg.signature_image}" target="_blank"><img src="${thumbnailUrl(pkg.signature_image)}" alt="Signature" loading="lazy" style="max-width: 300px; border: 2px solid #ddd; border-radius: 8px; margin-top: 10px;"></a>
                 </div>
             ` : ''}
             <span class="status-badge status-signed">✅ Completed</span>
         </div>
     `).join('');
     
-    container.innerHTML = html;
+    container.innerHTML = html + (archiveNextCursor
+        ? '<button onclick="loadArchived(true)">⬇️ Load more</button>'
+        : '');
 }
 
 // Global variable to store all archived packages for filtering
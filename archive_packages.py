@@ -0,0 +1,46 @@
+"""Move packages signed or sent back long ago to the archive tier.
+
+Usage:
+    python archive_packages.py [--days ARCHIVE_AFTER_DAYS] [--database packages.db]
+
+Packages closed more than --days days ago (by signed_at, or created_at
+for sent-back ones) move from packages to packages_archive (see
+archive_tier.py). They still show in the archive list and search,
+tracking, customer history and exports. The move runs in short batches,
+so the server can stay up; run it nightly from cron or Task Scheduler.
+Running it again only moves what has aged since.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import archive_tier
+import server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=float, default=server.ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--database', default=server.DATABASE)
+    args = parser.parse_args()
+
+    server.DATABASE = args.database
+    server.init_db()
+    # Stored timestamps are SQLite's CURRENT_TIMESTAMP, which is UTC
+    closed_before = (datetime.now(timezone.utc) - timedelta(days=args.days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    pool = server.get_pool()
+    start = time.perf_counter()
+    moved = archive_tier.archive_packages(pool, closed_before)
+    db = pool.connect()
+    hot, archived = (db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                     for table in ('packages', 'packages_archive'))
+    db.close()
+    pool.close_all()
+
+    print(f'moved {moved} packages closed before {closed_before} UTC in {time.perf_counter() - start:.1f}s; '
+          f'{hot} in packages, {archived} archived')
+
+
+if __name__ == '__main__':
+    main()
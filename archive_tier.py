@@ -0,0 +1,119 @@
+"""Cold tier for old signed and sent-back packages.
+
+packages holds the working set: pending packages and recent history.
+archive_packages() moves packages closed (signed, or sent back) before a
+cutoff into packages_archive, a table with the same columns in the same
+database file, so the pending lists and tracking lookups walk tables and
+indexes that stay small while the history grows. (A separate attached
+database file would be lighter to back up, but SQLite doesn't commit
+across attached databases atomically in WAL mode, so a crash mid-move
+could lose or duplicate packages.)
+
+all_packages is a UNION ALL view of both tiers for the reads that cover
+history: the archive list and search, tracking, customer history and
+export. When the ORDER BY of a query on it names only columns the query
+selects, SQLite merges the two tiers' index scans rather than sorting
+(list_packages always selects its sort column and id).
+
+A moved package keeps its id (AUTOINCREMENT never hands one out again),
+its search index entry and its place in the dashboard counts: the FTS and
+package_stats triggers skip rows while packages_moving has a row.
+Archived packages are read-only; a write to one moves it back with
+restore() first.
+"""
+import package_search
+import package_stats
+
+# Every column of packages, in order
+COLUMNS = ('id, courier, name, tracking, phone, postal, label_image, signature_image, status, '
+           'created_at, address, signed_at, created_by, customer_id, pickup_id')
+
+# (status, the date a package with it was closed) for the packages that get archived
+CLOSED = [
+    ('signed', 'signed_at'),
+    ('sent_back', 'created_at'),
+]
+
+# Packages moved per transaction, so the server's writers never wait long
+BATCH_SIZE = 500
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS packages_archive (
+        id INTEGER PRIMARY KEY,
+        courier TEXT NOT NULL,
+        name TEXT NOT NULL,
+        tracking TEXT NOT NULL,
+        phone TEXT,
+        postal TEXT NOT NULL,
+        label_image TEXT,
+        signature_image TEXT,
+        status TEXT,
+        created_at TIMESTAMP,
+        address TEXT,
+        signed_at TIMESTAMP,
+        created_by TEXT,
+        customer_id INTEGER REFERENCES customers(id),
+        pickup_id INTEGER REFERENCES pickups(id)
+    )''',
+    # The same lookups as on packages (see migrations._package_list_indexes and _lookup_indexes)
+    'CREATE INDEX IF NOT EXISTS idx_archive_status_created ON packages_archive (status, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_archive_status_signed ON packages_archive (status, signed_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_archive_customer_status ON packages_archive (customer_id, status, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_archive_tracking ON packages_archive (tracking)',
+    'CREATE INDEX IF NOT EXISTS idx_archive_pickup ON packages_archive (pickup_id)',
+    'CREATE TABLE IF NOT EXISTS packages_moving (active INTEGER)',
+    f'''CREATE VIEW IF NOT EXISTS all_packages AS
+        SELECT {COLUMNS} FROM packages UNION ALL SELECT {COLUMNS} FROM packages_archive''',
+]
+
+
+def create_archive(db):
+    """Create the archive table, its indexes and the all_packages view, and make the
+    search index and count triggers skip moves"""
+    for statement in SCHEMA:
+        db.execute(statement)
+    package_search.ignore_tier_moves(db)
+    package_stats.ignore_tier_moves(db)
+
+
+def _move(db, source, target, ids):
+    placeholders = ','.join('?' * len(ids))
+    db.execute('INSERT INTO packages_moving (active) VALUES (1)')
+    db.execute(f'''INSERT INTO {target} ({COLUMNS})
+        SELECT {COLUMNS} FROM {source} WHERE id IN ({placeholders})''', ids)
+    db.execute(f'DELETE FROM {source} WHERE id IN ({placeholders})', ids)
+    db.execute('DELETE FROM packages_moving')
+
+
+def archive_packages(pool, closed_before, batch_size=BATCH_SIZE):
+    """Move packages closed before closed_before (YYYY-MM-DD HH:MM:SS) to the archive.
+
+    Runs one short write transaction per batch_size packages, so it can run
+    while the server is up. Returns how many packages were moved.
+    """
+    moved = 0
+    for status, closed_at in CLOSED:
+        while True:
+            with pool.transaction() as db:
+                ids = [row[0] for row in db.execute(f'''SELECT id FROM packages
+                    WHERE status = ? AND {closed_at} < ? LIMIT ?''', (status, closed_before, batch_size))]
+                if ids:
+                    _move(db, 'packages', 'packages_archive', ids)
+            moved += len(ids)
+            if len(ids) < batch_size:
+                break
+    return moved
+
+
+def restore(db, ids):
+    """Move any of the packages `ids` that are archived back to packages; returns how many.
+
+    Call it inside the write transaction that's about to change them.
+    """
+    if not ids:
+        return 0
+    archived = [row[0] for row in db.execute(f'''SELECT id FROM packages_archive
+        WHERE id IN ({','.join('?' * len(ids))})''', list(ids))]
+    if archived:
+        _move(db, 'packages_archive', 'packages', archived)
+    return len(archived)
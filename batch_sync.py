@@ -0,0 +1,158 @@
+"""Idempotent batches of scanning-station operations for POST /api/sync.
+
+A station that loses Wi-Fi queues its work locally and flushes it in one
+request when it's back:
+
+    {"operations": [
+        {"key": "st2-000481", "op": "create", "courier": "UPS", "name": "...", "tracking": "...", ...},
+        {"key": "st2-000482", "op": "sign", "package_key": "st2-000481", "signature": "data:..."},
+        {"key": "st2-000483", "op": "pickup", "customer_id": 7, "package_ids": [12],
+         "package_keys": ["st2-000470"], "pickup_signature": "data:..."}
+    ]}
+
+Each operation carries a key the station generates (a UUID or a station
+prefix and counter) and otherwise the body of the single-call endpoint:
+create is POST /api/packages, update is PUT /api/packages/<package_id>,
+sign is POST /api/packages/<package_id>/sign and pickup is POST
+/api/pickups/bulk. A package created offline has no id yet, so later
+operations can name it by its create's key with package_key (or
+package_keys for a pickup).
+
+The whole batch is applied in one write transaction, each operation under
+its own savepoint, so one that fails (a duplicate tracking number, a
+package already picked up) is rolled back and reported on its own while
+the rest go in. Each operation that succeeds is recorded in
+sync_operations under its key; sending the key again returns the
+recorded result with "replayed": true and changes nothing, so a station
+that never saw the response can resend the whole batch. Sending it with a
+different operation is refused with 422. Failures change nothing and
+aren't recorded, so a key that failed can be resent as is (say once the
+package it signs exists) or corrected. Keys are kept KEEP_DAYS days.
+
+A create finds its customer as POST /api/packages does, by phone or
+exact name, including a customer created earlier in the same batch.
+"""
+import hashlib
+import json
+import sqlite3
+
+OPERATIONS = ('create', 'update', 'sign', 'pickup')
+
+# Idempotency keys (and their results) older than this are forgotten
+KEEP_DAYS = 30
+
+
+class OperationError(Exception):
+    """An operation that can't be applied; status and body are what the endpoint returns"""
+
+    def __init__(self, status, body):
+        super().__init__(body.get('message', ''))
+        self.status = status
+        self.body = body
+
+
+class Operation:
+    def __init__(self, value):
+        """value is one entry of the request's operations list"""
+        value = value if isinstance(value, dict) else {}
+        self.key = value.get('key')
+        self.op = value.get('op')
+        # Over the operation as sent, so a resent key can be told from a reused one
+        self.fingerprint = hashlib.sha1(
+            json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self.data = {k: v for k, v in value.items() if k not in ('key', 'op')}
+
+    def error(self):
+        """Why the operation can't even be looked up, or None"""
+        if not isinstance(self.key, str) or not self.key:
+            return 'Every operation needs a string key'
+        if self.op not in OPERATIONS:
+            return f'op must be one of {", ".join(OPERATIONS)}'
+        return None
+
+
+def create_sync_log(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS sync_operations (
+        key TEXT PRIMARY KEY,
+        op TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        result TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_sync_operations_created ON sync_operations (created_at)')
+
+
+def applied_keys(db, operations):
+    """Keys of operations already recorded, so the caller can skip preparing them"""
+    keys = [op.key for op in operations if not op.error()]
+    applied = set()
+    # In chunks under SQLite's default limit of 999 parameters
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        applied.update(row[0] for row in db.execute(
+            f"SELECT key FROM sync_operations WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+    return applied
+
+
+def apply(db, operations, handlers):
+    """Apply operations in order inside db's open write transaction; returns their results.
+
+    handlers maps each op to handler(db, data), which returns the result dict
+    of a success or raises OperationError. package_key / package_keys in data
+    are resolved to package_id / package_ids first.
+    """
+    db.execute("DELETE FROM sync_operations WHERE created_at < datetime('now', ?)", (f'-{KEEP_DAYS} days',))
+    results = []
+    for operation in operations:
+        error = operation.error()
+        if error:
+            results.append({'key': operation.key, 'op': operation.op, 'status': 400,
+                            'success': False, 'message': error})
+            continue
+
+        recorded = db.execute('SELECT op, fingerprint, status, result FROM sync_operations WHERE key = ?',
+                              (operation.key,)).fetchone()
+        if recorded:
+            if recorded[1] != operation.fingerprint:
+                results.append({'key': operation.key, 'op': operation.op, 'status': 422, 'success': False,
+                                'message': f'Key {operation.key} was already used for a different {recorded[0]}'})
+            else:
+                results.append(dict(json.loads(recorded[3]), key=operation.key, op=recorded[0],
+                                    status=recorded[2], replayed=True))
+            continue
+
+        db.execute('SAVEPOINT sync_operation')
+        try:
+            _resolve_package_keys(db, operation.data)
+            status, body = 200, dict(handlers[operation.op](db, operation.data), success=True)
+        except OperationError as e:
+            status, body = e.status, dict(e.body, success=False)
+        except KeyError as e:
+            status, body = 400, {'success': False, 'message': f'{operation.op} needs {e.args[0]}'}
+        except (TypeError, ValueError, sqlite3.IntegrityError) as e:
+            status, body = 400, {'success': False, 'message': f'Invalid {operation.op}: {e}'}
+        if status == 200:
+            db.execute('INSERT INTO sync_operations (key, op, fingerprint, status, result) VALUES (?, ?, ?, ?, ?)',
+                       (operation.key, operation.op, operation.fingerprint, status, json.dumps(body)))
+        else:
+            db.execute('ROLLBACK TO sync_operation')
+        db.execute('RELEASE sync_operation')
+        results.append(dict(body, key=operation.key, op=operation.op, status=status))
+    return results
+
+
+def _created_package(db, key):
+    row = db.execute("SELECT status, result FROM sync_operations WHERE key = ? AND op = 'create'",
+                     (key,)).fetchone()
+    if row is None or row[0] != 200:
+        raise OperationError(409, {'message': f'No package was created by operation {key}'})
+    return json.loads(row[1])['id']
+
+
+def _resolve_package_keys(db, data):
+    if 'package_key' in data:
+        data['package_id'] = _created_package(db, data.pop('package_key'))
+    if 'package_keys' in data:
+        data['package_ids'] = list(data.get('package_ids') or []) + [
+            _created_package(db, key) for key in data.pop('package_keys')]
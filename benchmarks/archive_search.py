@@ -0,0 +1,75 @@
+"""Archive search latency: the old four-column LIKE scan vs. the FTS5 index.
+
+Usage:
+    python benchmarks/archive_search.py --packages 500000
+
+Seeds a temporary packages.db, then times each search term both ways and
+checks that FTS finds at least every package the LIKE query found for
+terms without separators.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+REPEAT = 3
+
+
+def like_search(db, search):
+    return db.execute('''SELECT * FROM packages
+        WHERE status = 'signed' AND
+        (name LIKE ? OR tracking LIKE ? OR phone LIKE ? OR postal LIKE ?)
+        ORDER BY signed_at DESC LIMIT 100''',
+        (f'%{search}%', f'%{search}%', f'%{search}%', f'%{search}%')).fetchall()
+
+
+def best_ms(fn):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packages', type=int, default=500000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        start = time.perf_counter()
+        seed_packages(server.DATABASE, args.packages)
+        print(f'seeded {args.packages} packages in {time.perf_counter() - start:.1f}s')
+
+        db = sqlite3.connect(server.DATABASE)
+        sample = db.execute("SELECT name, tracking, phone, postal FROM packages WHERE status = 'signed' LIMIT 1").fetchone()
+        name, tracking, phone, postal = sample
+        terms = [
+            name.split()[1], name, name.split()[0][:3], tracking, tracking[:6],
+            phone, f'{phone[:3]}-{phone[3:6]}-{phone[6:]}', phone[3:], postal, postal.replace(' ', ''),
+        ]
+
+        client = server.app.test_client()
+        print(f'{"search":<24} {"LIKE ms":>9} {"FTS ms":>9} {"LIKE rows":>10} {"FTS rows":>9}')
+        for term in terms:
+            like_ms = best_ms(lambda: like_search(db, term))
+            fts_ms = best_ms(lambda: client.get('/api/packages/archived', query_string={'search': term}))
+            like_rows = len(like_search(db, term))
+            fts_rows = len(client.get('/api/packages/archived', query_string={'search': term}).json)
+            print(f'{term:<24} {like_ms:>9.2f} {fts_ms:>9.2f} {like_rows:>10} {fts_rows:>9}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Pending list and tracking lookup latency before and after moving old packages to the archive tier.
+
+Usage:
+    python benchmarks/archive_tiering.py [--packages 300000] [--years 5] [--requests 300]
+
+Seeds a scratch packages.db with --packages packages spread over --years
+years, the newest 300 pending, and times through the Flask test client:
+
+  pending      GET /api/packages/pending
+  track new    GET /api/track/<tracking> of a package from the last month
+  track old    the same for a package from before ARCHIVE_AFTER_DAYS
+  archived     GET /api/packages/archived, the first page (both tiers)
+  customer     GET /api/customers/<id>/packages?status=signed (both tiers)
+
+then moves every package closed more than ARCHIVE_AFTER_DAYS days ago with
+archive_tier.archive_packages() and times them again. Also reports the
+size of packages and its indexes (where SQLite has the dbstat table) and
+checks that every response is the same before and after. Exits non-zero
+if one changed or the dashboard counts drifted.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import archive_tier  # noqa: E402
+import package_stats  # noqa: E402
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+
+def sample(db, where, count, rng):
+    rows = [row[0] for row in db.execute(f'SELECT tracking FROM packages WHERE {where}')]
+    return rng.sample(rows, min(count, len(rows)))
+
+
+def requests_to_time(db, count, rng):
+    """[(label, [urls])], the same urls before and after archiving"""
+    month_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+    old = (datetime.now() - timedelta(days=server.ARCHIVE_AFTER_DAYS + 30)).strftime('%Y-%m-%d %H:%M:%S')
+    customers = [row[0] for row in db.execute('SELECT id FROM customers ORDER BY random() LIMIT ?', (count,))]
+    return [
+        ('pending', ['/api/packages/pending'] * count),
+        ('track new', [f'/api/track/{t}' for t in sample(db, f"created_at > '{month_ago}'", count, rng)]),
+        ('track old', [f'/api/track/{t}' for t in sample(db, f"created_at < '{old}'", count, rng)]),
+        ('archived', ['/api/packages/archived'] * count),
+        ('customer', [f'/api/customers/{c}/packages?status=signed' for c in customers]),
+    ]
+
+
+def time_requests(client, urls):
+    """(median ms, p95 ms, responses)"""
+    times, responses = [], []
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url)
+        times.append((time.perf_counter() - start) * 1000)
+        responses.append(response.data)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95)], responses
+
+
+def table_bytes(db, table):
+    """Bytes in table and its indexes, or None without the dbstat table"""
+    try:
+        return db.execute('''SELECT SUM(pgsize) FROM dbstat WHERE name = ?
+            OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?)''',
+            (table, table)).fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packages', type=int, default=300000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=300, help='requests timed per endpoint')
+    args = parser.parse_args()
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        seed_packages(server.DATABASE, args.packages, years=args.years)
+        db = sqlite3.connect(server.DATABASE, isolation_level=None)
+        db.execute('ANALYZE')
+        requests = requests_to_time(db, args.requests, random.Random(1))
+        client = server.app.test_client()
+
+        results = {}
+        for phase in ('before', 'after'):
+            if phase == 'after':
+                closed_before = (datetime.now(timezone.utc) -
+                                 timedelta(days=server.ARCHIVE_AFTER_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+                start = time.perf_counter()
+                moved = archive_tier.archive_packages(server.get_pool(), closed_before)
+                print(f'archived {moved} packages closed more than {server.ARCHIVE_AFTER_DAYS} days ago '
+                      f'in {time.perf_counter() - start:.1f}s')
+                db.execute('ANALYZE')
+            for label, urls in requests:
+                client.get(urls[0])  # warm up
+                results[phase, label] = time_requests(client, urls)
+            results[phase, 'rows'] = db.execute('SELECT COUNT(*) FROM packages').fetchone()[0]
+            results[phase, 'bytes'] = table_bytes(db, 'packages')
+
+        print(f'\n{args.packages} packages over {args.years} years, {args.requests} requests per endpoint')
+        print(f'{"":<12} {"before p50":>11} {"p95":>8} {"after p50":>11} {"p95":>8}   ms')
+        for label, _ in requests:
+            before, after = results['before', label], results['after', label]
+            print(f'{label:<12} {before[0]:>11.3f} {before[1]:>8.3f} {after[0]:>11.3f} {after[1]:>8.3f}')
+            if before[2] != after[2]:
+                print(f'  {label}: responses changed')
+                ok = False
+        for phase in ('before', 'after'):
+            size = results[phase, 'bytes']
+            print(f'packages {phase}: {results[phase, "rows"]:,} rows'
+                  + (f', {size / 1e6:.1f} MB with indexes' if size is not None else ''))
+
+        db.execute('BEGIN')
+        drift = package_stats.drift(db)
+        db.execute('ROLLBACK')
+        db.close()
+        print(f'dashboard count drift: {len(drift)}')
+
+    if not ok or drift:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""A scanning station's queued work: 500 single calls against one POST /api/sync, and replays of it.
+
+Usage:
+    python benchmarks/batch_sync.py [--packages 250] [--rtt 30]
+
+A station that was offline has --packages scanned packages and their
+signatures queued, twice as many operations (500 by default). On a
+scratch packages.db each way of sending them is timed through the Flask
+test client:
+
+  single   POST /api/packages then POST /api/packages/<id>/sign per package
+  sync     one POST /api/sync with every create and sign, the signs naming
+           their package by the create's key
+
+Each request is also charged --rtt milliseconds of Wi-Fi round trip. Then
+the sync batch is sent again, whole and as a retry of its second half,
+and the database is compared before and after: a replay must return
+every recorded result with "replayed" and change nothing. Also checks
+both ways leave the same packages (not their customer links: see the
+note on fuzzy name matching in batch_sync.py). Exits non-zero if a replay changed
+anything, an operation failed, or the two ways disagree.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server  # noqa: E402
+
+NAMES = ['Marie Tremblay', 'Luc Gagnon', 'Sarah Chen', 'Wei Roy', 'Anne Cote', 'Tom Singh']
+
+
+def queued_packages(count):
+    return [{'courier': 'Purolator', 'name': f'{NAMES[i % len(NAMES)]} {i}', 'tracking': f'SYNC{i:08d}',
+             'phone': f'70555{i:05d}', 'postal': 'P5A 1X1', 'createdBy': 'station 2'} for i in range(count)]
+
+
+def send_single(client, packages):
+    """(requests, failures)"""
+    failures = 0
+    for package in packages:
+        response = client.post('/api/packages', json=package)
+        if response.status_code != 200:
+            failures += 1
+            continue
+        response = client.post(f"/api/packages/{response.json['id']}/sign", json={'signature': ''})
+        failures += response.status_code != 200
+    return 2 * len(packages), failures
+
+
+def operations(packages):
+    ops = []
+    for i, package in enumerate(packages):
+        ops.append(dict(package, key=f'st2-{i}-create', op='create'))
+        ops.append({'key': f'st2-{i}-sign', 'op': 'sign', 'package_key': f'st2-{i}-create', 'signature': ''})
+    return ops
+
+
+def snapshot():
+    """Every row a sync can write"""
+    db = server.get_db()
+    rows = {table: [tuple(row) for row in db.execute(f'SELECT * FROM {table} ORDER BY 1')]
+            for table in ('packages', 'customers', 'pickups', 'sync_operations', 'events')}
+    db.close()
+    return rows
+
+
+def packages_written():
+    db = server.get_db()
+    rows = [tuple(row) for row in db.execute('''SELECT courier, name, tracking, phone, postal, status,
+        signed_at IS NOT NULL FROM packages ORDER BY tracking''')]
+    db.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packages', type=int, default=250, help='queued packages, each a create and a sign')
+    parser.add_argument('--rtt', type=float, default=30, help='milliseconds of round trip charged per request')
+    args = parser.parse_args()
+
+    packages = queued_packages(args.packages)
+    server.SYNC_MAX_OPERATIONS = max(server.SYNC_MAX_OPERATIONS, 2 * args.packages)
+    ok = True
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for method in ('single', 'sync'):
+            server.DATABASE = os.path.join(tmp, f'{method}.db')
+            server.init_db()
+            client = server.app.test_client()
+
+            start = time.perf_counter()
+            if method == 'single':
+                requests, failures = send_single(client, packages)
+            else:
+                response = client.post('/api/sync', json={'operations': operations(packages)})
+                requests = 1
+                failures = sum(not r['success'] for r in response.json['results'])
+            elapsed = time.perf_counter() - start
+            results[method] = (requests, elapsed, elapsed + requests * args.rtt / 1000, failures)
+            results[method, 'packages'] = packages_written()
+            ok = ok and not failures
+
+        print(f'{args.packages} queued packages, {2 * args.packages} operations, {args.rtt:g} ms per round trip')
+        print(f'{"method":<8} {"requests":>9} {"server s":>9} {"with rtt s":>10} {"failed":>7}')
+        for method in ('single', 'sync'):
+            requests, elapsed, with_rtt, failures = results[method]
+            print(f'{method:<8} {requests:>9} {elapsed:>9.2f} {with_rtt:>10.2f} {failures:>7}')
+        if results['single', 'packages'] != results['sync', 'packages']:
+            print('single calls and the sync wrote different packages')
+            ok = False
+
+        # Replays, on the sync database: the whole batch, then a retry of the second half
+        ops = operations(packages)
+        before = snapshot()
+        for label, batch in (('whole batch', ops), ('second half', ops[len(ops) // 2:])):
+            start = time.perf_counter()
+            response = client.post('/api/sync', json={'operations': batch})
+            elapsed = time.perf_counter() - start
+            replayed = sum(bool(r.get('replayed')) for r in response.json['results'])
+            unchanged = snapshot() == before
+            print(f'replay {label}: {replayed}/{len(batch)} replayed in {elapsed:.2f}s, '
+                  f'database {"unchanged" if unchanged else "CHANGED"}')
+            ok = ok and unchanged and replayed == len(batch)
+        server.get_pool().close_all()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
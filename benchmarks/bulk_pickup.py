@@ -0,0 +1,172 @@
+"""Bulk pickup of many packages: one signature linked by pickup_id against a copy per package.
+
+Usage:
+    python benchmarks/bulk_pickup.py [--pickups 40] [--packages 50]
+
+Gives each of --pickups customers --packages pending packages on a scratch
+packages.db, then releases each customer's packages in one POST of a
+freshly drawn signature, three ways:
+
+  inline    the handler before the blob store: the base64 data URL is
+            written to the pickup and copied into every package
+  copied    the handler before pickup_id: the signature goes to the blob
+            store and its URL is copied into every package
+  pickup_id POST /api/pickups/bulk as it is now: the signature is written
+            once, on the pickup, and the packages point at it
+
+The two old handlers are registered on the app under /bench/ for the run.
+Reports the median and p95 latency of a pickup and how much each grows
+the database (and the blob directory). Exits non-zero if any pickup fails,
+a released package doesn't show the signature, or pickup_id grows the
+database more than copied does.
+"""
+import argparse
+import base64
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from flask import jsonify, request  # noqa: E402
+
+import server  # noqa: E402
+
+
+def legacy_pickup(store):
+    """The bulk pickup handler as it was, storing the signature with `store`"""
+    def handler():
+        data = request.json
+        package_ids = data.get('package_ids', [])
+        pickup_signature = store(data.get('pickup_signature', ''))
+        with server.transaction() as db:
+            pickup_id = db.execute('''INSERT INTO pickups
+                (customer_id, pickup_name, pickup_id_type, pickup_id_number, pickup_signature)
+                VALUES (?, ?, ?, ?, ?)''',
+                (data.get('customer_id'), data.get('pickup_name', ''), '', '', pickup_signature)).lastrowid
+            placeholders = ','.join('?' * len(package_ids))
+            db.execute(f'''UPDATE packages
+                SET status = 'signed', signed_at = CURRENT_TIMESTAMP, signature_image = ?
+                WHERE id IN ({placeholders})''', [pickup_signature] + package_ids)
+        return jsonify({'success': True, 'pickup_id': pickup_id})
+    return handler
+
+
+server.app.add_url_rule('/bench/pickups/inline', 'bench_pickup_inline', legacy_pickup(lambda value: value),
+                        methods=['POST'])
+server.app.add_url_rule('/bench/pickups/copied', 'bench_pickup_copied',
+                        legacy_pickup(lambda value: server.blobs.store_image(value)), methods=['POST'])
+
+METHODS = [
+    ('inline', '/bench/pickups/inline'),
+    ('copied', '/bench/pickups/copied'),
+    ('pickup_id', '/api/pickups/bulk'),
+]
+
+
+def signature(rng):
+    """A canvas signature as signatures.html sends it: a PNG data URL of a few strokes"""
+    canvas = np.full((200, 600), 255, np.uint8)
+    for _ in range(rng.randint(3, 6)):
+        points = np.cumsum([[rng.randint(20, 120), rng.randint(60, 140)]] +
+                           [[rng.randint(3, 15), rng.randint(-12, 12)] for _ in range(40)], axis=0)
+        cv2.polylines(canvas, [points.astype(np.int32)], False, 0, 2, cv2.LINE_AA)
+    return 'data:image/png;base64,' + base64.b64encode(cv2.imencode('.png', canvas)[1].tobytes()).decode()
+
+
+def seed(pickups, per_pickup):
+    """Customers with pending packages; returns [(customer_id, package ids)]"""
+    db = sqlite3.connect(server.DATABASE)
+    batches = []
+    for c in range(pickups):
+        customer_id = db.execute('INSERT INTO customers (name, phone) VALUES (?, ?)',
+                                 (f'Pickup Customer {c}', f'249{c:07d}')).lastrowid
+        ids = []
+        for p in range(per_pickup):
+            ids.append(db.execute('''INSERT INTO packages (courier, name, tracking, phone, postal, status, customer_id)
+                VALUES ('UPS', ?, ?, ?, 'P5A 1X1', 'pending', ?)''',
+                (f'Pickup Customer {c}', f'1ZPICK{c:04d}{p:04d}', f'249{c:07d}', customer_id)).lastrowid)
+        batches.append((customer_id, ids))
+    db.commit()
+    db.close()
+    return batches
+
+
+def all_signed(client, expected):
+    """Whether every released package shows up in the archive with a signature"""
+    seen = 0
+    query = {'fields': 'id,signature_image', 'limit': server.MAX_PAGE_SIZE}
+    while True:
+        response = client.get('/api/packages/archived', query_string=query)
+        if not all(p['signature_image'] for p in response.json):
+            return False
+        seen += len(response.json)
+        if 'X-Next-Cursor' not in response.headers:
+            return seen == expected
+        query['cursor'] = response.headers['X-Next-Cursor']
+
+
+def database_bytes():
+    server.get_pool().close_all()
+    db = sqlite3.connect(server.DATABASE)
+    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    size = db.execute('PRAGMA page_count').fetchone()[0] * db.execute('PRAGMA page_size').fetchone()[0]
+    db.close()
+    return size
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pickups', type=int, default=40)
+    parser.add_argument('--packages', type=int, default=50, help='packages released per pickup')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    signatures = [signature(rng) for _ in range(args.pickups)]
+    print(f'{args.pickups} pickups of {args.packages} packages, '
+          f'signatures of {sum(map(len, signatures)) // len(signatures):,} bytes as data URLs')
+    print(f'{"method":<10} {"p50 ms":>8} {"p95 ms":>8} {"db grew":>12} {"blobs grew":>12} {"per pickup":>12}')
+
+    ok = True
+    grew = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        client = server.app.test_client()
+        for method, url in METHODS:
+            server.DATABASE = os.path.join(tmp, f'{method}.db')
+            server.blobs.root = os.path.join(tmp, f'{method}-blobs')
+            server.init_db()
+            batches = seed(args.pickups, args.packages)
+            db_before, blobs_before = database_bytes(), directory_bytes(server.blobs.root)
+
+            latencies = []
+            for (customer_id, ids), sig in zip(batches, signatures):
+                start = time.perf_counter()
+                response = client.post(url, json={'customer_id': customer_id, 'package_ids': ids,
+                                                  'pickup_name': 'Bench', 'pickup_signature': sig})
+                latencies.append((time.perf_counter() - start) * 1000)
+                ok = ok and response.status_code == 200
+
+            ok = ok and all_signed(client, args.pickups * args.packages)
+
+            db_grew = database_bytes() - db_before
+            blobs_grew = directory_bytes(server.blobs.root) - blobs_before
+            grew[method] = db_grew
+            latencies.sort()
+            print(f'{method:<10} {latencies[len(latencies) // 2]:>8.2f} {latencies[int(len(latencies) * 0.95)]:>8.2f} '
+                  f'{db_grew:>12,} {blobs_grew:>12,} {(db_grew + blobs_grew) // args.pickups:>12,}')
+
+    if not ok or grew['pickup_id'] > grew['copied']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
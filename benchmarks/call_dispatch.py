@@ -0,0 +1,118 @@
+"""Bulk customer notification calls: the old in-request loop against the background dispatcher.
+
+Usage:
+    python benchmarks/call_dispatch.py [--customers 30] [--latency 0.5] [--failure-rate 0.1]
+
+Both run against benchmarks/fake_grandstream.py on a scratch packages.db:
+
+  sequential     one requests.post per customer inside the request, the way
+                 /api/call/bulk used to work; the request blocks until the
+                 last call is placed and a failed dial is simply lost
+  dispatcher     POST /api/call/bulk queues the calls and returns; the time
+                 until every call has finished is measured by polling
+                 /api/calls?batch=<id>, as the dashboard does
+
+Retry backoff is shortened so the run takes seconds. Exits non-zero if the
+dispatcher exceeds server.CALL_WORKERS concurrent dial requests, spaces
+them closer than server.CALL_MIN_INTERVAL, or leaves any call failed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests  # noqa: E402
+
+import call_dispatcher  # noqa: E402
+import server  # noqa: E402
+from fake_grandstream import FakeGrandstream  # noqa: E402
+
+
+def add_customers(count):
+    db = server.get_db()
+    ids = [db.execute('INSERT INTO customers (name, phone) VALUES (?, ?)',
+                      (f'Customer {i}', f'705-555-{i:04d}')).lastrowid for i in range(count)]
+    db.commit()
+    db.close()
+    return ids
+
+
+def sequential(fake, ids):
+    db = server.get_db()
+    failed = 0
+    start = time.perf_counter()
+    for customer_id in ids:
+        phone = db.execute('SELECT phone FROM customers WHERE id = ?', (customer_id,)).fetchone()[0]
+        try:
+            response = requests.post(f'http://{fake.address}/api/make_call', auth=('admin', 'admin'),
+                                     json={'extension': '8000', 'destination': phone.replace('-', ''),
+                                           'recording_id': '1'}, timeout=10)
+            failed += response.status_code != 200
+        except requests.exceptions.RequestException:
+            failed += 1
+    db.close()
+    return time.perf_counter() - start, failed
+
+
+def dispatched(client, ids):
+    start = time.perf_counter()
+    response = client.post('/api/call/bulk', json={'customer_ids': ids})
+    request_seconds = time.perf_counter() - start
+    batch_id = response.json['batch_id']
+
+    while True:
+        counts = client.get(f'/api/calls?batch={batch_id}').json['counts']
+        if not counts.get('queued') and not counts.get('dialing'):
+            break
+        time.sleep(0.05)
+    return request_seconds, time.perf_counter() - start, counts.get('failed', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.5, help='fake PBX seconds per dial request')
+    parser.add_argument('--failure-rate', type=float, default=0.1, help='fake PBX chance of a 503')
+    args = parser.parse_args()
+
+    call_dispatcher.BACKOFF_SECONDS = 0.2
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        ids = add_customers(args.customers)
+
+        fake = FakeGrandstream(latency=args.latency, failure_rate=args.failure_rate,
+                               trunks=server.CALL_WORKERS).start()
+        seconds, seq_failed = sequential(fake, ids)
+
+        fake.requests.clear()
+        fake.connections.clear()
+        fake.peak_in_flight = 0
+        server.GRANDSTREAM_IP = fake.address
+        request_seconds, total_seconds, failed = dispatched(server.app.test_client(), ids)
+        stats = server.get_call_dispatcher().stats()
+        fake.shutdown()
+
+    starts = sorted(started for _, _, started, _ in fake.requests)
+    min_gap = min((b - a for a, b in zip(starts, starts[1:])), default=0)
+
+    print(f'{args.customers} customers, {args.latency}s per dial, {args.failure_rate:.0%} failures, '
+          f'{server.CALL_WORKERS} workers, {server.CALL_MIN_INTERVAL}s min interval')
+    print(f'{"":<12} {"request s":>10} {"all done s":>11} {"failed":>7}')
+    print(f'{"sequential":<12} {seconds:>10.2f} {seconds:>11.2f} {seq_failed:>7}')
+    print(f'{"dispatcher":<12} {request_seconds:>10.3f} {total_seconds:>11.2f} {failed:>7}')
+    print(f'dial requests {len(fake.requests)} ({stats["retried"]} calls retried), '
+          f'peak concurrent {fake.peak_in_flight}, closest spacing {min_gap:.3f}s, '
+          f'{len(fake.connections)} connections')
+
+    # Allow for timer granularity on the spacing check
+    if fake.peak_in_flight > server.CALL_WORKERS or min_gap < server.CALL_MIN_INTERVAL * 0.95 or failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Bulk CSV import speed: POST /api/import/<kind> against one add_customer call per row.
+
+Usage:
+    python benchmarks/csv_import.py [--rows 100000] [--legacy-rows 2000]
+
+Generates a customers CSV and a packages CSV of --rows rows each on a
+scratch packages.db. About 1% of rows are deliberately bad (missing name,
+a phone repeated in another format, a bad date, a tracking number seen
+before) and must come back as per-row errors while the rest import.
+The legacy path, POST /api/customers once per row, is timed on the first
+--legacy-rows customers and extrapolated. Exits non-zero if the counts
+are off or an import takes longer than --max-seconds.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server  # noqa: E402
+from seed import COURIERS, FIRST_NAMES, LAST_NAMES, STREETS, random_postal  # noqa: E402
+
+BAD_EVERY = 100
+
+
+def customers_csv(rows, rng):
+    """CSV text and the number of rows that should be rejected"""
+    out = io.StringIO()
+    out.write('Name,Phone,Email,Street,Postal\n')
+    bad = 0
+    for i in range(rows):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        phone = f'705-{i // 10000:03d}-{i % 10000:04d}'
+        if i % BAD_EVERY == 1:
+            name, bad = '', bad + 1
+        elif i % BAD_EVERY == 2:
+            # An earlier row's phone, written differently
+            phone, bad = f'(705) {(i - 2) // 10000:03d} {(i - 2) % 10000:04d}', bad + 1
+        out.write(f'{name},{phone},,{rng.randint(1, 999)} {rng.choice(STREETS)},'
+                  f'{random_postal(rng).replace(" ", "").lower()}\n')
+    return out.getvalue(), bad
+
+
+def packages_csv(rows, rng):
+    out = io.StringIO()
+    out.write('courier,name,tracking,phone,postal,address,status,created_at,signed_at\n')
+    bad = 0
+    for i in range(rows):
+        created = f'2024-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00'
+        tracking = f'{10 ** 11 + i}'
+        if i % BAD_EVERY == 1:
+            created, bad = '2024-13-45', bad + 1
+        elif i % BAD_EVERY == 2:
+            tracking, bad = f'{10 ** 11 + i - 2}', bad + 1
+        # Half the phones belong to imported customers, the rest are new
+        phone = f'705{i % (rows // 2):07d}' if i % 2 else f'249{i:07d}'
+        out.write(f'{rng.choice(COURIERS)},{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)},{tracking},'
+                  f'{phone},{random_postal(rng)[4:]},"{rng.randint(1, 999)} {rng.choice(STREETS)}",'
+                  f'signed,{created},{created}\n')
+    return out.getvalue(), bad
+
+
+def timed_import(client, kind, text):
+    start = time.perf_counter()
+    response = client.post(f'/api/import/{kind}', data=text.encode(), content_type='text/csv')
+    return time.perf_counter() - start, response.json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--legacy-rows', type=int, default=2000, help='0 to skip the legacy comparison')
+    parser.add_argument('--max-seconds', type=float, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        client = server.app.test_client()
+
+        if args.legacy_rows:
+            server.DATABASE = os.path.join(tmp, 'legacy.db')
+            server.init_db()
+            text, _ = customers_csv(args.legacy_rows, rng)
+            rows = [line.split(',') for line in text.splitlines()[1:]]
+            start = time.perf_counter()
+            for name, phone, _, street, postal in rows:
+                client.post('/api/customers', json={'name': name, 'phone': phone, 'street': street,
+                                                    'postal': postal})
+            legacy = (time.perf_counter() - start) / len(rows)
+            print(f'legacy add_customer: {legacy * 1e3:.2f} ms/row '
+                  f'(~{legacy * args.rows:.0f}s for {args.rows} rows)')
+
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        print(f'{"import":<10} {"rows":>8} {"seconds":>8} {"rows/s":>9} {"imported":>9} {"skipped":>8} {"expected":>9}')
+        for kind, make in [('customers', customers_csv), ('packages', packages_csv)]:
+            text, bad = make(args.rows, rng)
+            seconds, result = timed_import(client, kind, text)
+            print(f'{kind:<10} {args.rows:>8} {seconds:>8.2f} {args.rows / seconds:>9,.0f} '
+                  f'{result["imported"]:>9} {result["skipped"]:>8} {bad:>9}')
+            if result['skipped'] != bad or result['imported'] != args.rows - bad or seconds > args.max_seconds:
+                ok = False
+            if kind == 'packages':
+                print(f'customers created (no match by phone or name): {result["customers_created"]}')
+            for error in result['errors'][:3]:
+                print(f'  e.g. line {error["row"]}: {error["error"]}')
+
+        # Importing the same customers again must add nothing
+        text, _ = customers_csv(args.rows, random.Random(1))
+        seconds, result = timed_import(client, 'customers', text)
+        print(f're-import of the customer file: {result["imported"]} imported, {result["skipped"]} skipped '
+              f'in {seconds:.2f}s')
+        ok = ok and result['imported'] == 0
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""How well the OCR cache fingerprint tells re-sent photos from different labels.
+
+Usage:
+    python benchmarks/duplicate_scans.py [--labels 40] [--folder path/to/label/images]
+
+Without --folder, synthetic labels are drawn on one shared courier template
+(same logo, sender and layout; different recipient, street and tracking),
+which is the hardest case for a perceptual match. Each label is
+"photographed" once (small rotation, scale, shift, lighting and sensor
+noise), then compared with:
+
+  re-sent        the same photo resized, re-encoded and slightly brightened,
+                 as a browser or a second upload would produce
+  re-photo       a second, independent photo of the same label
+  different      photos of every other label
+
+Prints the similarity range of each group and how many pairs clear
+scan_cache.MIN_SIMILARITY, plus fingerprint and lookup timings with a full
+cache. Exits non-zero if any pair of different labels would share a cache entry.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from scan_cache import MIN_SIMILARITY, OCRCache, fingerprint  # noqa: E402
+
+NAMES = ['JOHN SMITH', 'MARIE TREMBLAY', 'LUC GAGNON', 'SARAH CHEN', 'WEI ROY', 'ANNE COTE',
+         'TOM SINGH', 'LISE LEBLANC', 'DENIS NGUYEN', 'PRIYA LAVOIE']
+STREETS = ['MAIN ST', 'HILLSIDE DR N', 'ONTARIO AVE', 'SPINE RD', 'TIMMINS AVE', 'DIEPPE AVE']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def draw_label(rng):
+    img = np.full((1050, 700, 3), 255, np.uint8)
+    text = lambda s, y, scale, thick: cv2.putText(img, s, (40, y), cv2.FONT_HERSHEY_SIMPLEX,
+                                                  scale, (0, 0, 0), thick)
+    cv2.rectangle(img, (20, 20), (680, 1030), (0, 0, 0), 3)
+    cv2.putText(img, 'PUROLATOR', (40, 95), cv2.FONT_HERSHEY_DUPLEX, 2.2, (0, 0, 0), 5)
+    cv2.line(img, (20, 125), (680, 125), (0, 0, 0), 2)
+    text('FROM / DE', 170, 0.7, 2)
+    text('AMAZON.CA 6363 MILLCREEK DR', 205, 0.7, 2)
+    text('TO / A', 280, 0.9, 2)
+    text(rng.choice(NAMES), 335, 1.4, 3)
+    text(f'{rng.randint(1, 399)} {rng.choice(STREETS)}', 390, 1.1, 2)
+    text('ELLIOT LAKE ON P5A 1X1', 440, 1.1, 2)
+    x = 40
+    while x < 650:
+        width = rng.randint(2, 7)
+        cv2.rectangle(img, (x, 560), (x + width, 770), (0, 0, 0), -1)
+        x += width + rng.randint(2, 7)
+    text(''.join(rng.choice('0123456789') for _ in range(12)), 840, 1.4, 3)
+    return img
+
+
+def photograph(img, rng, noise):
+    """A camera shot of a label: slight rotation, scale and shift, lighting and sensor noise"""
+    h, w = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), rng.uniform(-1, 1), rng.uniform(0.98, 1.02))
+    matrix[:, 2] += (rng.uniform(-0.015, 0.015) * w, rng.uniform(-0.015, 0.015) * h)
+    shot = cv2.warpAffine(img, matrix, (w, h), borderValue=(200, 200, 200)).astype(np.float32)
+    shot = shot * rng.uniform(0.85, 1.1) + noise.normal(0, 8, shot.shape)
+    return encode(np.clip(shot, 0, 255).astype(np.uint8), 90)
+
+
+def resend(photo_bytes, rng):
+    """The same photo after a browser resize / re-encode"""
+    img = cv2.imdecode(np.frombuffer(photo_bytes, np.uint8), cv2.IMREAD_COLOR)
+    scale = rng.choice([1, 0.75, 0.5])
+    if scale != 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    img = np.clip(img.astype(np.float32) * rng.uniform(0.97, 1.03), 0, 255).astype(np.uint8)
+    return encode(img, rng.randint(50, 95))
+
+
+def print_of(img_bytes):
+    return fingerprint(cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR))
+
+
+def encode(img, quality):
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def summarize(name, similarities):
+    matches = sum(s >= MIN_SIMILARITY for s in similarities)
+    print(f'{name:<10} {len(similarities):>6} {min(similarities):>9.5f} {max(similarities):>9.5f} '
+          f'{matches:>8} ({matches / len(similarities):.0%})')
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--labels', type=int, default=40, help='synthetic labels to draw')
+    parser.add_argument('--folder', help='use real label photos instead of synthetic labels')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    noise = np.random.default_rng(1)
+
+    if args.folder:
+        photos = []
+        for filename in sorted(os.listdir(args.folder)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(args.folder, filename), 'rb') as f:
+                    photos.append(f.read())
+        rephotos = []
+    else:
+        labels = [draw_label(rng) for _ in range(args.labels)]
+        photos = [photograph(label, rng, noise) for label in labels]
+        rephotos = [photograph(label, rng, noise) for label in labels]
+    if len(photos) < 2:
+        sys.exit('Need at least two labels')
+
+    prints = [print_of(photo) for photo in photos]
+    resent = [float(fp @ print_of(resend(photo, rng))) for photo, fp in zip(photos, prints)]
+    different = [float(prints[i] @ prints[j]) for i in range(len(prints)) for j in range(i)]
+
+    print(f'{len(photos)} labels, MIN_SIMILARITY {MIN_SIMILARITY}')
+    print(f'{"pairs":<10} {"count":>6} {"min":>9} {"max":>9} {"matched":>8}')
+    summarize('re-sent', resent)
+    if rephotos:
+        summarize('re-photo', [float(fp @ print_of(photo)) for photo, fp in zip(rephotos, prints)])
+    false_matches = summarize('different', different)
+
+    # Timings against a full cache
+    cache = OCRCache()
+    for i in range(cache.max_entries):
+        cache.put(prints[i % len(prints)] + noise.normal(0, 0.05, prints[0].shape).astype(np.float32), i)
+    start = time.perf_counter()
+    for photo in photos:
+        print_of(photo)
+    fingerprint_ms = (time.perf_counter() - start) / len(photos) * 1000
+    start = time.perf_counter()
+    for fp in prints:
+        cache.get(fp)
+    lookup_ms = (time.perf_counter() - start) / len(prints) * 1000
+    print(f'decode + fingerprint {fingerprint_ms:.2f} ms/image, lookup in {cache.max_entries}-entry cache '
+          f'{lookup_ms:.2f} ms')
+
+    if false_matches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Delivery latency and cost of /api/events with many counter stations subscribed.
+
+Usage:
+    python benchmarks/event_stream.py [--subscribers 200] [--events 100] [--pending 300]
+
+Serves the app with werkzeug's threaded server and the event streams with
+event_server.py on a scratch packages.db seeded with --pending pending
+packages, opens --subscribers event streams through /api/events (which
+redirects to the event listener), then creates --events packages through
+POST /api/packages and records when each stream receives each
+package.created event. Reports:
+
+  latency        publish to receipt, over every (event, subscriber) pair
+  idle polls     reads of the events table during a quiet period, which
+                 stay at one per POLL_INTERVAL however many streams are open
+  threads        server threads the open streams started: only the event
+                 tail, as one event server thread writes them all
+  bytes          per station per change: one event against re-fetching the
+                 pending list, which is what the dashboard did before
+
+Exits non-zero if any stream misses an event.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import event_bus  # noqa: E402
+import event_server  # noqa: E402
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+IDLE_SECONDS = 3
+
+
+def subscribe(url, received, ready, stop):
+    """Record (event id, receive time, size) for each package.created on one stream"""
+    with requests.get(url, stream=True, timeout=60) as response:
+        ready.release()
+        event_type = event_id = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith('id: '):
+                event_id = int(line[4:])
+            elif line.startswith('event: '):
+                event_type = line[7:]
+            elif line.startswith('data: ') and event_type == 'package.created':
+                received.append((event_id, time.perf_counter(), len(line)))
+            if stop.is_set():
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=200)
+    parser.add_argument('--events', type=int, default=100)
+    parser.add_argument('--pending', type=int, default=300)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # Frequent keepalives so the subscriber threads notice `stop` soon after the run
+    event_server.KEEPALIVE_SECONDS = 1
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        seed_packages(server.DATABASE, args.pending, pending=args.pending)
+
+        httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{httpd.server_port}'
+        server.EVENTS_BIND = '127.0.0.1:0'
+        server.EVENTS_URL = f'http://127.0.0.1:{server.start_event_server().listener.getsockname()[1]}/api/events'
+        threads_before = threading.active_count()
+
+        streams = [[] for _ in range(args.subscribers)]
+        ready = threading.Semaphore(0)
+        stop = threading.Event()
+        for received in streams:
+            threading.Thread(target=subscribe, args=(f'{base}/api/events', received, ready, stop),
+                             daemon=True).start()
+        for _ in streams:
+            ready.acquire()
+        time.sleep(0.5)
+
+        stats = requests.get(f'{base}/api/events/stats').json()
+        time.sleep(IDLE_SECONDS)
+        idle_polls = requests.get(f'{base}/api/events/stats').json()['polls'] - stats['polls']
+
+        sent = {}
+        session = requests.Session()
+        for i in range(args.events):
+            start = time.perf_counter()
+            package_id = session.post(f'{base}/api/packages', json={
+                'courier': 'UPS', 'name': f'Event Test {i}', 'tracking': f'1ZEVENT{i:06d}',
+                'phone': f'249555{i:04d}', 'postal': 'P5A 1X1'}).json()['id']
+            sent[package_id] = start
+        time.sleep(1)
+
+        list_bytes = len(session.get(f'{base}/api/packages/pending').content)
+        server_threads = threading.active_count() - threads_before - args.subscribers
+        stop.set()
+        httpd.shutdown()
+        server.close_event_streams()
+
+    created = {}
+    for received in streams:
+        for event_id, at, size in received:
+            created.setdefault(event_id, []).append((at, size))
+    # Event ids aren't package ids; match them in order
+    latencies = []
+    event_bytes = []
+    for (event_id, receipts), start in zip(sorted(created.items()), [sent[k] for k in sorted(sent)]):
+        latencies += [(at - start) * 1000 for at, _ in receipts]
+        event_bytes += [size for _, size in receipts]
+    latencies.sort()
+    missing = args.subscribers * args.events - len(latencies)
+
+    print(f'{args.subscribers} subscribers, {args.events} events, {args.pending} pending packages')
+    if latencies:
+        print(f'latency ms (POST start to receipt): p50 {latencies[len(latencies) // 2]:.1f}  '
+              f'p95 {latencies[int(len(latencies) * 0.95)]:.1f}  max {latencies[-1]:.1f}')
+    print(f'missed deliveries: {missing}')
+    print(f'events table reads during {IDLE_SECONDS}s idle: {idle_polls} '
+          f'(poll interval {event_bus.POLL_INTERVAL}s, independent of subscriber count)')
+    print(f'server threads started by {args.subscribers} streams: {server_threads} '
+          f'(the event tail; the event server thread writes them all)')
+    print(f'bytes per station per change: event ~{sum(event_bytes) / max(1, len(event_bytes)):.0f}, '
+          f'pending list re-fetch {list_bytes}')
+
+    if missing:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
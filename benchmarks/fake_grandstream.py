@@ -0,0 +1,103 @@
+"""Local stand-in for the Grandstream UCM's /api/make_call, for exercising the call dispatcher.
+
+Usage:
+    python benchmarks/fake_grandstream.py [--port 8088] [--latency 0.3] [--failure-rate 0.2] [--trunks 2]
+
+Point server.GRANDSTREAM_IP at 127.0.0.1:<port>. Each dial request takes
+--latency seconds (plus up to 50% jitter), then answers 503 with a
+--failure-rate chance, 503 if more than --trunks requests are in flight
+(all lines busy), and 200 otherwise. A request whose destination isn't
+digits gets 400. Every request is logged with its start and end times so
+callers can check concurrency and spacing.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGrandstream(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.3, failure_rate=0.0, trunks=2, seed=1):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.trunks = trunks
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = []  # (destination, status, started, finished)
+        self.connections = set()
+
+    @property
+    def address(self):
+        return f'127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-grandstream', daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        started = time.monotonic()
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+            busy = server.in_flight > server.trunks
+            fail = server.random.random() < server.failure_rate
+            delay = server.latency * (1 + server.random.random() / 2)
+
+        try:
+            time.sleep(delay)
+            if self.path != '/api/make_call':
+                status = 404
+            elif not str(body.get('destination', '')).isdigit():
+                status = 400
+            elif busy or fail:
+                status = 503
+            else:
+                status = 200
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+                server.requests.append((body.get('destination'), status, started, time.monotonic()))
+
+        payload = json.dumps({'status': 'ok' if status == 200 else 'error'}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds per dial request')
+    parser.add_argument('--failure-rate', type=float, default=0.2, help='chance of a 503')
+    parser.add_argument('--trunks', type=int, default=2, help='concurrent calls before answering 503')
+    args = parser.parse_args()
+
+    server = FakeGrandstream(args.port, args.latency, args.failure_rate, args.trunks)
+    print(f'fake Grandstream listening on {server.address}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Image storage per package and archive page transfer, with uploads kept as sent and re-encoded.
+
+Usage:
+    python benchmarks/image_storage.py [--packages 10] [--width 3024] [--height 4032]
+
+Makes --packages phone-sized photos of synthetic labels (a label from
+duplicate_scans.py on cardboard, with sensor noise, as a --width x
+--height JPEG) and 800x200 transparent signature canvases as PNGs, as the
+browser sends them. For each mode it creates the packages through
+POST /api/packages, signs each through /api/packages/<id>/sign, and
+loads the first archive page as archive.js does:
+
+  as sent     IMAGE_OPTIONS['compress'] off; the cards load the full images
+  re-encoded  labels downsampled to 1600px WebP, signatures cropped 1-bit
+              PNGs (see image_pipeline.py); the cards load thumbnails
+
+Both modes store uploads as sent; the re-encoding runs afterwards on the
+image job workers (see image_jobs.py), which are waited for before the
+store is measured. Reports blob store bytes per package, the archive
+page's transfer (the JSON plus every image a card loads), the upload time
+per package and the background time per image. Exits non-zero if an image
+doesn't decode or re-encoding saves nothing.
+"""
+import argparse
+import base64
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+import server  # noqa: E402
+from duplicate_scans import draw_label  # noqa: E402
+
+
+def label_photo(rng, noise, width, height):
+    """A phone photo of a label lying on cardboard"""
+    photo = np.empty((height, width, 3), np.uint8)
+    photo[:] = (90, 140, 180)
+    label = draw_label(rng)
+    scale = 0.7 * min(width / label.shape[1], height / label.shape[0])
+    label = cv2.resize(label, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    top, left = (height - label.shape[0]) // 2, (width - label.shape[1]) // 2
+    photo[top:top + label.shape[0], left:left + label.shape[1]] = label
+    photo = np.clip(photo + noise.normal(0, 6, photo.shape), 0, 255).astype(np.uint8)
+    return cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+
+
+def signature_canvas(rng):
+    """An 800x200 canvas with a few antialiased strokes on a transparent background"""
+    canvas = np.zeros((200, 800, 4), np.uint8)
+    for _ in range(rng.randint(2, 4)):
+        x, y = rng.randint(60, 500), rng.randint(60, 140)
+        points = []
+        for _ in range(rng.randint(10, 25)):
+            x += rng.randint(5, 25)
+            y = min(190, max(10, y + rng.randint(-30, 30)))
+            points.append((x, y))
+        cv2.polylines(canvas, [np.array(points, np.int32)], False, (0, 0, 0, 255), 3, cv2.LINE_AA)
+    return cv2.imencode('.png', canvas)[1].tobytes()
+
+
+def data_url(data, mimetype):
+    return f'data:{mimetype};base64,' + base64.b64encode(data).decode('ascii')
+
+
+def thumbnail_url(url):
+    """archive.js's thumbnailUrl()"""
+    return url + '/thumbnail' if url.startswith('/api/blobs/') else url
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run(labels, signatures, compress, thumbnails):
+    """(blob bytes, archive page bytes, upload seconds per package, background seconds per image,
+    undecodable images)"""
+    client = server.app.test_client()
+    server.IMAGE_OPTIONS = dict(server.IMAGE_OPTIONS, compress=compress)
+    upload_times = []
+    for i, (label, signature) in enumerate(zip(labels, signatures)):
+        start = time.perf_counter()
+        package_id = client.post('/api/packages', json={
+            'courier': 'Purolator', 'name': f'Customer {i}', 'tracking': f'IMG{i:08d}',
+            'phone': f'70555{i:05d}', 'postal': 'P5A 1X1', 'labelImage': data_url(label, 'image/jpeg')}).json['id']
+        client.post(f'/api/packages/{package_id}/sign', json={'signature': data_url(signature, 'image/png')})
+        upload_times.append(time.perf_counter() - start)
+    jobs = server.get_image_jobs()
+    jobs.wait()
+    stored = directory_size(server.blobs.root)
+
+    page = client.get('/api/packages/archived?fields=all')
+    transfer, unreadable = len(page.data), 0
+    for package in page.json:
+        for field in ('label_image', 'signature_image'):
+            url = thumbnail_url(package[field]) if thumbnails else package[field]
+            image = client.get(url).data
+            transfer += len(image)
+            if cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_UNCHANGED) is None:
+                unreadable += 1
+    return stored, transfer, statistics.median(upload_times), jobs.stats()['avg_run_seconds'], unreadable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packages', type=int, default=10)
+    parser.add_argument('--width', type=int, default=3024)
+    parser.add_argument('--height', type=int, default=4032)
+    args = parser.parse_args()
+
+    rng, noise = random.Random(1), np.random.default_rng(1)
+    labels = [label_photo(rng, noise, args.width, args.height) for _ in range(args.packages)]
+    signatures = [signature_canvas(rng) for _ in range(args.packages)]
+    print(f'{args.packages} packages: {args.width}x{args.height} label photos of '
+          f'{statistics.mean(map(len, labels)) / 1e3:.0f} KB, signatures of '
+          f'{statistics.mean(map(len, signatures)) / 1e3:.1f} KB (as sent, before base64)')
+
+    results = {}
+    for mode, compress in (('as sent', False), ('re-encoded', True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            server.DATABASE = os.path.join(tmp, 'packages.db')
+            server.blobs.root = os.path.join(tmp, 'blobs')
+            server.init_db()
+            results[mode] = run(labels, signatures, compress, thumbnails=compress)
+            server.image_jobs.stop()
+            server.image_jobs = None
+            server.get_pool().close_all()
+
+    print(f'{"mode":<12} {"stored/package":>15} {"archive page":>13} {"upload ms":>10} {"background ms":>14}')
+    for mode, (stored, transfer, upload, background, _) in results.items():
+        print(f'{mode:<12} {stored / args.packages / 1e3:>12.1f} KB {transfer / 1e3:>10.1f} KB '
+              f'{upload * 1000:>10.0f} {background * 1000:>14.0f}')
+    (before, before_page, _, _, bad_before), (after, after_page, _, _, bad_after) = results.values()
+    print(f'storage {before / after:.1f}x smaller, archive page {before_page / after_page:.1f}x smaller')
+
+    if bad_before or bad_after:
+        print(f'{bad_before + bad_after} images did not decode')
+    if bad_before or bad_after or after >= before or after_page >= before_page:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Requests per second and p99 latency of the main endpoints, dev server against production serving.
+
+Usage:
+    python benchmarks/load_test.py [--modes dev,waitress,gunicorn] [--seconds 5] [--concurrency 16]
+                                   [--packages 50000]
+
+Seeds a scratch packages.db with --packages packages, then for each mode
+starts the server as a subprocess on a free port, configured through
+PACKAGES_* environment variables (see settings.py):
+
+  dev       app.run(debug=True), which is what `python server.py` runs
+            (less the reloader, which doesn't touch requests)
+  waitress  python wsgi.py
+  gunicorn  gunicorn -c gunicorn.conf.py wsgi:app (not on Windows)
+
+and drives each endpoint below with --concurrency client threads for
+--seconds: the pending list, an archive search, a customer name match, a
+tracking lookup and package creation. OCR isn't exercised; a scan's time
+is the model's, whichever server runs it. Each server is then stopped
+with SIGTERM and the time it takes to exit is reported. Modes whose
+server isn't installed are skipped. Exits non-zero if any request fails.
+"""
+import argparse
+import itertools
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests  # noqa: E402
+
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+STARTUP_SECONDS = 60
+
+_created = itertools.count()
+
+
+def create_package(session, base, tracking_numbers):
+    i = next(_created)
+    return session.post(f'{base}/api/packages', json={
+        'courier': 'UPS', 'name': f'Load Test {i}', 'tracking': f'1ZLOAD{i:08d}',
+        'phone': f'249{i:07d}', 'postal': 'P5A 1X1'})
+
+
+ENDPOINTS = [
+    ('GET /api/packages/pending', lambda session, base, _: session.get(f'{base}/api/packages/pending')),
+    ('GET /api/packages/archived?search=', lambda session, base, _: session.get(
+        f'{base}/api/packages/archived', params={'search': 'Tremblay'})),
+    ('GET /api/customers/match', lambda session, base, _: session.get(
+        f'{base}/api/customers/match', params={'name': 'Mary Gagnon'})),
+    ('GET /api/track/<tracking>', lambda session, base, tracking: session.get(
+        f'{base}/api/track/{tracking[next(_created) % len(tracking)]}')),
+    ('POST /api/packages', create_package),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def command(mode, port):
+    if mode == 'dev':
+        return [sys.executable, '-c', 'import server; server.init_db(); '
+                f'server.app.run(host="127.0.0.1", port={port}, debug=True, use_reloader=False)']
+    if mode == 'waitress':
+        return [sys.executable, 'wsgi.py']
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+
+
+def available(mode):
+    try:
+        if mode == 'waitress':
+            import waitress  # noqa: F401
+        elif mode == 'gunicorn':
+            if sys.platform == 'win32':
+                return False
+            import gunicorn  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def start(mode, tmp, log):
+    port = free_port()
+    env = dict(os.environ, PACKAGES_DATABASE=os.path.join(tmp, 'packages.db'),
+               PACKAGES_BLOB_DIR=os.path.join(tmp, 'blobs'), PACKAGES_BIND=f'127.0.0.1:{port}')
+    # Its own process group on Windows, so stop() can send it CTRL_BREAK
+    flags = subprocess.CREATE_NEW_PROCESS_GROUP if sys.platform == 'win32' else 0
+    process = subprocess.Popen(command(mode, port), cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               creationflags=flags)
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + STARTUP_SECONDS
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            if requests.get(f'{base}/api/packages/pending', timeout=5).ok:
+                return process, base
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start (see {log.name})')
+
+
+def drive(base, request, tracking, seconds, concurrency):
+    """Run `request` from `concurrency` threads for `seconds`; returns (req/s, errors, sorted latencies ms)"""
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = request(session, base, tracking)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors.append(1)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, len(errors), sorted(latencies)
+
+
+def stop(process):
+    """SIGTERM the server; returns seconds until it exited"""
+    start = time.perf_counter()
+    process.send_signal(signal.SIGTERM if sys.platform != 'win32' else signal.CTRL_BREAK_EVENT)
+    try:
+        process.wait(server.GRACEFUL_TIMEOUT + 10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='dev,waitress,gunicorn')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--packages', type=int, default=50000)
+    args = parser.parse_args()
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        seed_packages(server.DATABASE, args.packages)
+        server.get_pool().close_all()
+        db = sqlite3.connect(server.DATABASE)
+        tracking = [row[0] for row in db.execute('SELECT tracking FROM packages ORDER BY random() LIMIT 1000')]
+        db.close()
+        print(f'{args.packages} packages, {args.concurrency} client threads, {args.seconds:g}s per endpoint')
+
+        for mode in args.modes.split(','):
+            if not available(mode):
+                print(f'\n{mode}: not installed, skipped')
+                continue
+            with open(os.path.join(tmp, f'{mode}.log'), 'w') as log:
+                process, base = start(mode, tmp, log)
+                print(f'\n{mode}')
+                print(f'  {"endpoint":<36} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+                for name, request in ENDPOINTS:
+                    rate, errors, latencies = drive(base, request, tracking, args.seconds, args.concurrency)
+                    failed += errors
+                    p50 = latencies[len(latencies) // 2] if latencies else 0
+                    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+                    print(f'  {name:<36} {rate:>8.0f} {p50:>8.1f} {p99:>8.1f} {errors:>7}')
+                print(f'  stopped {stop(process):.1f}s after SIGTERM')
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
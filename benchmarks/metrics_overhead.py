@@ -0,0 +1,116 @@
+"""Cost of the /metrics instrumentation, per observation and per request.
+
+Usage:
+    python benchmarks/metrics_overhead.py [--requests 4000] [--rounds 40] [--max-overhead 5]
+
+Times the pieces on their own (a histogram observe(), a stage timer, a
+pooled-connection query against the same query on a plain sqlite3
+connection), then serves --requests requests to each of a few endpoints
+through the Flask test client with recording on and off, alternating
+in --rounds short rounds so drift hits both alike, and reports the median
+difference per request. The "off" runs
+still pay for the timer calls themselves, so the micro-benchmarks are the
+bound on the full cost. Exits non-zero if recording adds more than
+--max-overhead percent to any endpoint.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import metrics  # noqa: E402
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+MICRO_ITERATIONS = 200000
+
+
+def per_call_ns(fn, iterations=MICRO_ITERATIONS):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def micro(db_path):
+    histogram = metrics.Histogram('bench', 'benchmark', ('stage',))
+
+    def timed_block():
+        with metrics.stage('bench'):
+            pass
+
+    pooled = server.get_db()
+    plain = sqlite3.connect(db_path)
+    results = [
+        ('Histogram.observe()', per_call_ns(lambda: histogram.observe(0.003, 'x'))),
+        ('with metrics.stage()', per_call_ns(timed_block)),
+        ('SELECT 1 on plain sqlite3', per_call_ns(lambda: plain.execute('SELECT 1').fetchone())),
+        ('SELECT 1 on pooled (timed)', per_call_ns(lambda: pooled.execute('SELECT 1').fetchone())),
+    ]
+    pooled.close()
+    plain.close()
+    metrics.REGISTRY.histograms.pop('bench', None)
+    return results
+
+
+def serve(client, url, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--rounds', type=int, default=40)
+    parser.add_argument('--max-overhead', type=float, default=5, help='percent')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        seed_packages(server.DATABASE, 20000)
+        db = server.get_db()
+        tracking = db.execute('SELECT tracking FROM packages LIMIT 1').fetchone()[0]
+        db.close()
+
+        for name, ns in micro(server.DATABASE):
+            print(f'{name:<28} {ns:>8.0f} ns')
+
+        client = server.app.test_client()
+        urls = [f'/api/track/{tracking}', '/api/packages/pending?limit=20', '/api/customers/match?name=Mary+Roy']
+        worst = 0
+        print(f'\n{"endpoint":<34} {"off us":>8} {"on us":>8} {"overhead":>9}')
+        for url in urls:
+            serve(client, url, args.requests // 10)  # warm up
+            offs, diffs = [], []
+            for i in range(args.rounds):
+                timings = {}
+                # Swap which goes first each round, so warming or slowing down favours neither
+                for enabled in (False, True) if i % 2 else (True, False):
+                    metrics.REGISTRY.enabled = enabled
+                    timings[enabled] = serve(client, url, args.requests // args.rounds)
+                offs.append(timings[False])
+                diffs.append(timings[True] - timings[False])
+            off = statistics.median(offs)
+            on = off + statistics.median(diffs)
+            overhead = (on - off) / off * 100
+            worst = max(worst, overhead)
+            print(f'{url[:34]:<34} {off:>8.1f} {on:>8.1f} {overhead:>8.1f}%')
+        metrics.REGISTRY.enabled = True
+
+        print(f'\n/metrics body after the run: {len(client.get("/metrics").data)} bytes')
+
+    if worst > args.max_overhead:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
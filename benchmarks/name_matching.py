@@ -0,0 +1,111 @@
+"""Fuzzy customer matching under synthetic OCR noise: precision, recall, latency.
+
+Usage:
+    python benchmarks/name_matching.py --customers 50000 --queries 2000
+
+Builds a NameMatcher over synthetic customers, then queries it with
+their names after OCR-style damage (look-alike characters, "Last, First",
+dropped letters, case changes) and with names of people who aren't
+customers. Precision and recall are for auto-fill decisions at the given
+threshold and margin; top-5 recall is for the ranked candidate list.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from name_matcher import NameMatcher, confident_match, normalize  # noqa: E402
+
+FIRST_NAMES = ['John', 'Mary', 'Robert', 'Linda', 'Michael', 'Susan', 'David', 'Karen', 'James',
+               'Lisa', 'Daniel', 'Nancy', 'Paul', 'Sandra', 'Mark', 'Donna', 'Luc', 'Chantal',
+               'Pierre', 'Isabelle', 'Kevin', 'Heather', 'Brian', 'Amanda', 'Denis', 'Monique']
+SYLLABLES = ['mac', 'don', 'ald', 'tre', 'blay', 'gag', 'non', 'le', 'blanc', 'ber', 'ger', 'son',
+             'wil', 'kin', 'ro', 'bert', 'mar', 'tin', 'cote', 'pel', 'let', 'ier', 'sto', 'ne',
+             'hill', 'man', 'rich', 'ard', 'bou', 'cher', 'lav', 'oie', 'fitz', 'pat', 'rick']
+
+# Substitutions OCR makes on printed labels
+NOISE = {'i': ['l', '1'], 'l': ['i', '1', 'I'], 'o': ['0', 'c'], 'e': ['c'], 'm': ['rn'],
+         's': ['5'], 'b': ['8', 'h'], 'g': ['6'], 'n': ['m'], 'u': ['v'], 't': ['f']}
+
+
+def random_surname(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def ocr_noise(name, rng, errors):
+    first, last = name.split(' ', 1)
+    if rng.random() < 0.3:
+        name = f'{last}, {first}'
+    chars = list(name.upper() if rng.random() < 0.5 else name)
+    for _ in range(errors):
+        positions = [i for i, c in enumerate(chars) if c.lower() in NOISE]
+        if positions and rng.random() < 0.8:
+            i = rng.choice(positions)
+            chars[i] = rng.choice(NOISE[chars[i].lower()])
+        elif len(chars) > 4:
+            del chars[rng.randrange(1, len(chars) - 1)]
+    return ''.join(chars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--threshold', type=float, default=0.92)
+    parser.add_argument('--margin', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = {}
+    while len(names) < args.customers:
+        name = f'{rng.choice(FIRST_NAMES)} {random_surname(rng)}'
+        names.setdefault(normalize(name), name)
+    customers = list(names.values())
+
+    matcher = NameMatcher()
+    start = time.perf_counter()
+    for customer_id, name in enumerate(customers):
+        matcher.add(customer_id, name)
+    print(f'indexed {len(customers)} customers in {time.perf_counter() - start:.2f}s')
+
+    strangers = []
+    while len(strangers) < args.queries // 4:
+        name = f'{rng.choice(FIRST_NAMES)} {random_surname(rng)}'
+        if normalize(name) not in names:
+            strangers.append(name)
+
+    print(f'{"noise":<10} {"queries":>8} {"auto-fill":>10} {"precision":>10} {"recall":>8} '
+          f'{"top-5":>7} {"avg ms":>7} {"p99 ms":>7}')
+    for errors in (0, 1, 2):
+        latencies = []
+        filled = correct = top5 = 0
+        for _ in range(args.queries):
+            truth = rng.randrange(len(customers))
+            query = ocr_noise(customers[truth], rng, errors)
+            start = time.perf_counter()
+            matches = matcher.match(query, limit=5)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            top5 += any(customer_id == truth for customer_id, _ in matches)
+            match = confident_match(matches, args.threshold, args.margin)
+            if match:
+                filled += 1
+                correct += match[0] == truth
+        latencies.sort()
+        print(f'{errors} errors{"":<2} {args.queries:>8} {filled / args.queries:>10.1%} '
+              f'{correct / filled if filled else 0:>10.1%} {correct / args.queries:>8.1%} '
+              f'{top5 / args.queries:>7.1%} {sum(latencies) / len(latencies):>7.2f} '
+              f'{latencies[int(len(latencies) * 0.99)]:>7.2f}')
+
+    false_fills = sum(1 for name in strangers
+                      if confident_match(matcher.match(ocr_noise(name, rng, 1), limit=2),
+                                         args.threshold, args.margin))
+    print(f'non-customers auto-filled: {false_fills}/{len(strangers)} ({false_fills / len(strangers):.1%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Server cold start and first-scan latency, with the model loaded eagerly or in the background.
+
+Usage:
+    python benchmarks/ocr_startup.py path/to/label.jpg [--runs 3]
+
+Every measurement runs in a fresh Python process so nothing is cached:
+
+  eager import     import server plus PaddleOCR(...) on the import path, the
+                   way server.py used to start; nothing is served until it ends
+  lazy import      import server as it is now; the login page can be served
+                   as soon as this returns
+  ready            lazy import, then ocr_engine.start() until /api/health is 200
+  first scan       latency of the first and second label after the model has
+                   loaded, without and with the warm-up inference
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+EAGER_IMPORT = '''
+import time
+start = time.perf_counter()
+import server
+from paddleocr import PaddleOCR
+PaddleOCR(**server.OCR_OPTIONS)
+print(time.perf_counter() - start)
+'''
+
+LAZY_IMPORT = '''
+import time
+start = time.perf_counter()
+import server
+print(time.perf_counter() - start)
+'''
+
+READY = '''
+import time
+start = time.perf_counter()
+import server
+server.ocr_engine.start()
+client = server.app.test_client()
+while client.get('/api/health').status_code != 200:
+    if server.ocr_engine.status()['state'] == 'failed':
+        raise SystemExit(server.ocr_engine.status()['error'])
+    time.sleep(0.05)
+print(time.perf_counter() - start)
+'''
+
+FIRST_SCAN = '''
+import json, sys, time
+import cv2
+import server
+from ocr_engine import OCREngine
+from ocr_pool import extract_lines
+engine = OCREngine(server.OCR_OPTIONS, warm=%(warm)s)
+ocr = engine.get()
+img = cv2.imread(sys.argv[1], cv2.IMREAD_COLOR)
+times = []
+for _ in range(2):
+    start = time.perf_counter()
+    extract_lines(ocr, img)
+    times.append(time.perf_counter() - start)
+print(json.dumps(times))
+'''
+
+
+def measure(code, *args):
+    # Run from a scratch directory so the health check's database isn't created in the repo
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    with tempfile.TemporaryDirectory() as cwd:
+        output = subprocess.run([sys.executable, '-c', code, *args], cwd=cwd, env=env, check=True,
+                                capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('image', help='a sample label image')
+    parser.add_argument('--runs', type=int, default=3, help='fresh processes per measurement')
+    args = parser.parse_args()
+    image = os.path.abspath(args.image)
+
+    print(f'median of {args.runs} fresh processes, seconds')
+    for name, code in [('eager import', EAGER_IMPORT), ('lazy import', LAZY_IMPORT), ('ready', READY)]:
+        print(f'{name:<24} {statistics.median(measure(code) for _ in range(args.runs)):>8.3f}')
+
+    for warm in (False, True):
+        runs = [measure(FIRST_SCAN % {'warm': warm}, image) for _ in range(args.runs)]
+        label = 'with warm-up' if warm else 'no warm-up'
+        print(f'first scan, {label:<12} {statistics.median(r[0] for r in runs):>8.3f}'
+              f'   (second scan {statistics.median(r[1] for r in runs):.3f})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Batch OCR throughput on CPU: labels/sec for each worker count.
+
+Usage:
+    python benchmarks/ocr_throughput.py path/to/label/images --workers 1,2,4
+
+Model loading is excluded from the timing: every pool is warmed up with
+one label per worker before the measured run starts.
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ocr_pool import OCRPool  # noqa: E402
+
+OCR_OPTIONS = {'use_angle_cls': True, 'lang': 'en', 'use_gpu': False}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def load_images(folder, repeat):
+    images = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(folder, filename), 'rb') as f:
+                images.append(base64.b64encode(f.read()).decode('ascii'))
+    return images * repeat
+
+
+def run(images, workers):
+    pool = OCRPool(workers, OCR_OPTIONS)
+    try:
+        for _ in pool.recognize_unordered(images[:workers]):
+            pass
+
+        start = time.perf_counter()
+        failures = sum(1 for _, _, error in pool.recognize_unordered(images) if error)
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.shutdown()
+
+    return elapsed, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('folder', help='folder of sample label images')
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated worker counts')
+    parser.add_argument('--repeat', type=int, default=1, help='repeat the image set N times')
+    args = parser.parse_args()
+
+    images = load_images(args.folder, args.repeat)
+    if not images:
+        sys.exit(f'No images found in {args.folder}')
+
+    print(f'{len(images)} labels, {os.cpu_count()} CPUs')
+    print(f'{"workers":>8} {"seconds":>9} {"labels/sec":>11} {"failed":>7}')
+    for workers in (int(w) for w in args.workers.split(',')):
+        elapsed, failures = run(images, workers)
+        print(f'{workers:>8} {elapsed:>9.2f} {len(images) / elapsed:>11.2f} {failures:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Memory use of /api/export/packages while streaming a large archive.
+
+Usage:
+    python benchmarks/package_export.py [--rows 1000000] [--format csv] [--legacy-rows 100000]
+
+Seeds a scratch packages.db with --rows packages, then reads the export
+through the Flask test client chunk by chunk, sampling the process's
+resident memory as rows go by. For comparison, the legacy way of getting
+the archive out (SELECT * into a list of dicts, which is what paging
+through every /api/packages/archived page and keeping the result amounts
+to) is run on the first --legacy-rows rows. Exits non-zero if memory grows
+by more than --max-growth MB between the first sample and the end of the
+export.
+"""
+import argparse
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+SAMPLES = 10
+
+
+def rss_mb():
+    """Current resident set size (peak size where /proc isn't available)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def export(client, url, total):
+    """Read the export, returning (rows, bytes, seconds, [(rows so far, rss MB)])"""
+    every = max(1, total // SAMPLES)
+    samples = []
+    rows = size = 0
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    for chunk in response.response:
+        size += len(chunk)
+        rows += chunk.count(b'\n') if isinstance(chunk, bytes) else chunk.count('\n')
+        if rows >= every * (len(samples) + 1):
+            samples.append((rows, rss_mb()))
+    response.close()
+    return rows, size, time.perf_counter() - start, samples
+
+
+def legacy(db_path, limit):
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    before = rss_mb()
+    start = time.perf_counter()
+    rows = [dict(r) for r in db.execute('SELECT * FROM packages ORDER BY id LIMIT ?', (limit,))]
+    seconds = time.perf_counter() - start
+    grown = rss_mb() - before
+    db.close()
+    return len(rows), seconds, grown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--legacy-rows', type=int, default=100000, help='0 to skip the legacy comparison')
+    parser.add_argument('--max-growth', type=float, default=20, help='MB of growth allowed during the export')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        start = time.perf_counter()
+        seed_packages(server.DATABASE, args.rows)
+        print(f'seeded {args.rows} packages in {time.perf_counter() - start:.1f}s, '
+              f'database {os.path.getsize(server.DATABASE) / 2 ** 20:.0f} MB')
+
+        client = server.app.test_client()
+        rows, size, seconds, samples = export(client, f'/api/export/packages?format={args.format}&images=1',
+                                              args.rows)
+        print(f'export ({args.format}): {rows} lines, {size / 2 ** 20:.0f} MB in {seconds:.1f}s '
+              f'({rows / seconds:,.0f} rows/s)')
+        print(f'{"rows":>10} {"rss MB":>8}')
+        for count, mb in samples:
+            print(f'{count:>10} {mb:>8.1f}')
+        growth = samples[-1][1] - samples[0][1] if samples else 0
+        print(f'growth from first sample to end: {growth:+.1f} MB')
+
+        if args.legacy_rows:
+            count, legacy_seconds, grown = legacy(server.DATABASE, args.legacy_rows)
+            print(f'legacy SELECT * of {count} rows: {legacy_seconds:.1f}s, +{grown:.0f} MB '
+                  f'(~{grown * args.rows / count:.0f} MB for all {args.rows})')
+
+    if growth > args.max_growth:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Package list latency as the table grows: legacy SELECT * vs. paginated slim pages.
+
+Usage:
+    python benchmarks/package_pagination.py --sizes 10000,50000,100000
+
+For each size a fresh temporary packages.db is seeded and every list
+endpoint is timed through the Flask test client: the first page, a page
+deep into the archive (following X-Next-Cursor), and the old unbounded
+SELECT * query for comparison.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+REPEAT = 5
+
+
+def timed(fn):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def legacy_archived(db_path):
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    rows = db.execute("SELECT * FROM packages WHERE status = 'signed' ORDER BY signed_at DESC").fetchall()
+    body = [dict(r) for r in rows]
+    db.close()
+    return body
+
+
+def deep_page(client, url, pages):
+    cursor = None
+    for _ in range(pages):
+        response = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,50000,100000')
+    parser.add_argument('--image-bytes', type=int, default=2000,
+                        help='inline image size per package (models pre-blob-store rows)')
+    args = parser.parse_args()
+
+    print(f'{"packages":>9} {"endpoint":<28} {"ms":>9}')
+    for size in (int(s) for s in args.sizes.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            server.DATABASE = os.path.join(tmp, 'packages.db')
+            server.init_db()
+            seed_packages(server.DATABASE, size, image_bytes=args.image_bytes)
+            client = server.app.test_client()
+
+            cases = [
+                ('legacy SELECT * archived', lambda: legacy_archived(server.DATABASE)),
+                ('archived page 1', lambda: client.get('/api/packages/archived?limit=100')),
+                ('archived page 50', lambda: deep_page(client, '/api/packages/archived?limit=100', 50)),
+                ('pending', lambda: client.get('/api/packages/pending')),
+                ('old', lambda: client.get('/api/packages/old')),
+                ('customer 1 signed', lambda: client.get('/api/customers/1/packages?status=signed')),
+            ]
+            for name, fn in cases:
+                ms, _ = timed(fn)
+                if name == 'archived page 50':
+                    ms /= 50
+                    name += ' (per page)'
+                print(f'{size:>9} {name:<28} {ms:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
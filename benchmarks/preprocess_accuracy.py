@@ -0,0 +1,106 @@
+"""OCR latency and field accuracy for each pre-processing configuration.
+
+Usage:
+    python benchmarks/preprocess_accuracy.py path/to/labels expected.json
+
+expected.json maps image filenames to the fields that label should yield,
+e.g. {"label01.jpg": {"tracking": "331234567890", "postal": "P5A 1X1"}}.
+Fields are compared ignoring case, spaces and dashes. Pick the fastest
+configuration whose tracking recall matches the "original" row.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cv2  # noqa: E402
+
+from label_preprocess import preprocess_image  # noqa: E402
+from label_parser import parse_label  # noqa: E402
+from ocr_pool import extract_lines  # noqa: E402
+import server  # noqa: E402
+
+CONFIGS = {
+    'original': {'max_side': 0, 'crop': False, 'deskew': False, 'grayscale': False},
+    'max2400': {'max_side': 2400, 'crop': False, 'deskew': False, 'grayscale': False},
+    'max1600': {'max_side': 1600, 'crop': False, 'deskew': False, 'grayscale': False},
+    'max1280': {'max_side': 1280, 'crop': False, 'deskew': False, 'grayscale': False},
+    'max960': {'max_side': 960, 'crop': False, 'deskew': False, 'grayscale': False},
+    'max1600+crop': {'max_side': 1600, 'crop': True, 'deskew': False, 'grayscale': False},
+    'max1600+crop+deskew': {'max_side': 1600, 'crop': True, 'deskew': True, 'grayscale': False},
+    'max1600+all': {'max_side': 1600, 'crop': True, 'deskew': True, 'grayscale': True},
+    'max1280+all': {'max_side': 1280, 'crop': True, 'deskew': True, 'grayscale': True},
+}
+
+
+def normalize(value):
+    return (value or '').upper().replace(' ', '').replace('-', '')
+
+
+def run_config(images, expected, options):
+    preprocess_ms = ocr_ms = 0.0
+    fields_total = fields_found = tracking_total = tracking_found = 0
+
+    for filename, img in images:
+        start = time.perf_counter()
+        processed, _ = preprocess_image(img, options)
+        mid = time.perf_counter()
+        parsed = parse_label(extract_lines(server.ocr_engine.get(), processed))
+        end = time.perf_counter()
+
+        preprocess_ms += (mid - start) * 1000
+        ocr_ms += (end - mid) * 1000
+
+        for field, value in expected.get(filename, {}).items():
+            hit = normalize(parsed.get(field)) == normalize(value)
+            fields_total += 1
+            fields_found += hit
+            if field == 'tracking':
+                tracking_total += 1
+                tracking_found += hit
+
+    count = len(images)
+    return {
+        'preprocess_ms': preprocess_ms / count,
+        'ocr_ms': ocr_ms / count,
+        'field_accuracy': fields_found / fields_total if fields_total else 0,
+        'tracking_recall': tracking_found / tracking_total if tracking_total else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('folder', help='folder of sample label images')
+    parser.add_argument('expected', help='JSON file of expected fields per image')
+    parser.add_argument('--configs', default=','.join(CONFIGS), help='comma-separated config names')
+    args = parser.parse_args()
+
+    with open(args.expected) as f:
+        expected = json.load(f)
+
+    images = []
+    for filename in sorted(expected):
+        img = cv2.imread(os.path.join(args.folder, filename), cv2.IMREAD_COLOR)
+        if img is None:
+            print(f'skipping unreadable {filename}', file=sys.stderr)
+            continue
+        images.append((filename, img))
+    if not images:
+        sys.exit('No readable images')
+
+    # Warm-up so the first configuration doesn't pay for model initialisation
+    extract_lines(server.ocr_engine.get(), images[0][1])
+
+    print(f'{len(images)} labels')
+    print(f'{"config":<22} {"prep ms":>8} {"ocr ms":>8} {"total ms":>9} {"fields":>7} {"tracking":>9}')
+    for name in args.configs.split(','):
+        r = run_config(images, expected, CONFIGS[name])
+        print(f'{name:<22} {r["preprocess_ms"]:>8.1f} {r["ocr_ms"]:>8.1f} '
+              f'{r["preprocess_ms"] + r["ocr_ms"]:>9.1f} {r["field_accuracy"]:>7.1%} {r["tracking_recall"]:>9.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Concurrency stress test: several scanning stations saving packages at once.
+
+Usage:
+    python benchmarks/scanning_stations.py --stations 8 --packages 200
+
+Runs the real Flask app on a threaded local server against a scratch
+packages.db and has each station thread POST /api/packages as fast as it
+can, half of them for customers that already exist and half for new
+ones, so customer lookup/creation races with package inserts. Fails
+(exit 1) on any error response or if the row counts don't add up.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import server  # noqa: E402
+
+SHARED_CUSTOMERS = 20
+
+
+def station(base_url, station_id, count, latencies, errors):
+    session = requests.Session()
+    for i in range(count):
+        if i % 2:
+            # Existing customer, shared by every station
+            n = i % SHARED_CUSTOMERS
+            name, phone = f'Shared Customer {n}', f'705555{n:04d}'
+        else:
+            name, phone = f'Station {station_id} Customer {i}', f'70{station_id:02d}{i:06d}'
+        start = time.perf_counter()
+        try:
+            response = session.post(f'{base_url}/api/packages', json={
+                'courier': 'Purolator', 'name': name, 'phone': phone, 'postal': 'P5A1X1',
+                'tracking': f'{station_id:03d}{i:09d}', 'createdBy': f'station{station_id}'}, timeout=30)
+            if response.status_code != 200 or not response.json().get('success'):
+                errors.append(f'{response.status_code} {response.text[:200]}')
+        except requests.RequestException as e:
+            errors.append(str(e))
+        latencies.append(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=8)
+    parser.add_argument('--packages', type=int, default=200, help='packages per station')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{httpd.server_port}'
+
+        latencies, errors = [], []
+        threads = [threading.Thread(target=station, args=(base_url, s, args.packages, latencies, errors))
+                   for s in range(args.stations)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        httpd.shutdown()
+
+        db = sqlite3.connect(server.DATABASE)
+        packages = db.execute('SELECT COUNT(*) FROM packages').fetchone()[0]
+        shared = db.execute("SELECT COUNT(*) FROM customers WHERE name LIKE 'Shared Customer %'").fetchone()[0]
+        db.close()
+
+    latencies.sort()
+    total = args.stations * args.packages
+    expected_shared = len({i % SHARED_CUSTOMERS for i in range(1, args.packages, 2)})
+    print(f'{args.stations} stations x {args.packages} packages in {elapsed:.2f}s '
+          f'({total / elapsed:.0f} packages/sec)')
+    print(f'latency p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms, max {latencies[-1] * 1000:.1f}ms')
+    print(f'errors: {len(errors)}, packages stored: {packages}/{total}, '
+          f'shared customers: {shared}/{expected_shared}')
+    for error in errors[:5]:
+        print(f'  {error}')
+
+    ok = not errors and packages == total and shared == expected_shared
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Synthetic packages.db data shared by the benchmarks."""
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+COURIERS = ['Purolator', 'FedEx', 'UPS', 'Canada Post', 'Dragonfly']
+FIRST_NAMES = ['John', 'Mary', 'Robert', 'Linda', 'Michael', 'Susan', 'David', 'Karen',
+               'James', 'Lisa', 'Daniel', 'Nancy', 'Paul', 'Sandra', 'Mark', 'Donna']
+LAST_NAMES = ['Smith', 'Tremblay', 'Martin', 'Roy', 'Gagnon', 'Lee', 'Wilson', 'Johnson',
+              'MacDonald', 'Taylor', 'Campbell', 'Anderson', 'Brown', 'Leblanc', 'Cote', 'White']
+STREETS = ['Hillside Dr', 'Ontario Ave', 'Manitoba Rd', 'Spine Rd', 'Esten Dr', 'Milliken Rd']
+
+
+def random_postal(rng):
+    letters = 'ABCEGHJKLMNPRSTVXY'
+    return f'P5A {rng.randint(0, 9)}{rng.choice(letters)}{rng.randint(0, 9)}'
+
+
+def seed_customers(db, count, rng):
+    rows = []
+    for i in range(count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        rows.append((name, f'705{i:07d}', f'{rng.randint(1, 999)} {rng.choice(STREETS)}', random_postal(rng)))
+    db.executemany('INSERT INTO customers (name, phone, street, postal) VALUES (?, ?, ?, ?)', rows)
+    return [r[0] for r in db.execute('SELECT id FROM customers ORDER BY id')]
+
+
+def seed_packages(db_path, count, customers=None, pending=300, years=1, image_bytes=0, seed=1):
+    """Insert `count` packages spread over `years`; the newest `pending` stay pending.
+
+    image_bytes > 0 stores a fake inline data URL of that size in label_image
+    and signature_image, to model databases that predate the blob store.
+    """
+    rng = random.Random(seed)
+    db = sqlite3.connect(db_path)
+    customer_ids = seed_customers(db, customers or max(1, count // 20), rng)
+    image = ('data:image/jpeg;base64,' + 'A' * image_bytes) if image_bytes else ''
+
+    now = datetime.now()
+    span = timedelta(days=365 * years)
+    batch = []
+    for i in range(count):
+        created = now - span * (1 - i / count)
+        is_pending = i >= count - pending
+        signed = None if is_pending else created + timedelta(hours=rng.randint(1, 240))
+        customer_id = rng.choice(customer_ids)
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        batch.append((
+            rng.choice(COURIERS), name, f'{rng.randint(10 ** 11, 10 ** 12 - 1)}',
+            f'705{rng.randint(0, 9999999):07d}', random_postal(rng),
+            image, '' if is_pending else image,
+            'pending' if is_pending else rng.choice(['signed'] * 19 + ['sent_back']),
+            created.strftime('%Y-%m-%d %H:%M:%S'),
+            signed.strftime('%Y-%m-%d %H:%M:%S') if signed else None,
+            f'{rng.randint(1, 999)} {rng.choice(STREETS)}, Elliot Lake, ON', customer_id))
+        if len(batch) >= 10000:
+            _insert(db, batch)
+            batch = []
+    if batch:
+        _insert(db, batch)
+
+    db.commit()
+    db.close()
+
+
+def _insert(db, rows):
+    db.executemany('''INSERT INTO packages
+        (courier, name, tracking, phone, postal, label_image, signature_image, status,
+         created_at, signed_at, address, customer_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
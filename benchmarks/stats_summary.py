@@ -0,0 +1,123 @@
+"""Dashboard counts: GET /api/stats/summary against counting the package lists client-side.
+
+Usage:
+    python benchmarks/stats_summary.py [--packages 200000] [--pending 3000] [--repeat 20]
+
+Seeds a scratch packages.db (the newest --pending packages pending, the
+rest signed over the past year, a handful today), then gets the pending
+count, the 5+ days old count, the number signed today and the pending
+count per customer two ways:
+
+  lists    page through /api/packages/pending, /api/packages/old and
+           /api/packages/archived (newest first, until yesterday) and count
+  summary  one GET /api/stats/summary
+
+Reports the median time of each over --repeat rounds, and of the summary
+without the per-customer counts, and checks both give the same counts, then that check_stats finds no drift. Exits non-zero on a
+mismatch or drift, or if the summary isn't faster.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import package_stats  # noqa: E402
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+
+def pages(client, url, **query):
+    """Every package of a paginated list"""
+    query['limit'] = server.MAX_PAGE_SIZE
+    while True:
+        response = client.get(url, query_string=query)
+        yield from response.json
+        if 'X-Next-Cursor' not in response.headers:
+            return
+        query['cursor'] = response.headers['X-Next-Cursor']
+
+
+def counts_from_lists(client, today):
+    pending = list(pages(client, '/api/packages/pending', fields='id,customer_id'))
+    old = sum(1 for _ in pages(client, '/api/packages/old', fields='id'))
+    signed_today = 0
+    for package in pages(client, '/api/packages/archived', fields='id,signed_at'):
+        day = package['signed_at'][:10]
+        if day < today:
+            break
+        signed_today += day == today
+    per_customer = Counter(p['customer_id'] for p in pending if p['customer_id'] is not None)
+    return len(pending), old, signed_today, dict(per_customer)
+
+
+def counts_from_summary(client, today):
+    stats = client.get('/api/stats/summary', query_string={'customers': 1}).json
+    return (stats['pending'], stats['old'], stats['signed_today'],
+            {c['customer_id']: c['pending'] for c in stats['customers']})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packages', type=int, default=200000)
+    parser.add_argument('--pending', type=int, default=3000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        seed_packages(server.DATABASE, args.packages, pending=args.pending)
+        db = sqlite3.connect(server.DATABASE)
+        # Some signed today, in the stored (UTC) clock
+        db.execute('''UPDATE packages SET signed_at = datetime('now', '-1 minute') WHERE id IN
+            (SELECT id FROM packages WHERE status = 'signed' ORDER BY id DESC LIMIT 25)''')
+        db.commit()
+        today = db.execute("SELECT date('now')").fetchone()[0]
+        db.close()
+
+        client = server.app.test_client()
+        results = {}
+        print(f'{args.packages} packages, {args.pending} pending')
+        print(f'{"method":<8} {"median ms":>10} {"pending":>8} {"old":>6} {"signed today":>13} {"customers":>10}')
+        for method, count in [('lists', counts_from_lists), ('summary', counts_from_summary)]:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results[method] = count(client, today)
+                times.append((time.perf_counter() - start) * 1000)
+            results[method + ' ms'] = statistics.median(times)
+            pending, old, signed_today, per_customer = results[method]
+            print(f'{method:<8} {results[method + " ms"]:>10.2f} {pending:>8} {old:>6} {signed_today:>13} '
+                  f'{len(per_customer):>10}')
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            client.get('/api/stats/summary')
+            times.append((time.perf_counter() - start) * 1000)
+        print(f'summary without ?customers=1: {statistics.median(times):.2f} ms')
+
+        if results['lists'] != results['summary']:
+            print('the two methods disagree')
+            ok = False
+
+        server.get_pool().close_all()
+        db = sqlite3.connect(server.DATABASE, isolation_level=None)
+        db.execute('BEGIN')
+        drift = package_stats.drift(db)
+        db.execute('ROLLBACK')
+        db.close()
+        print(f'drift: {len(drift)} counts')
+
+    if not ok or drift or results['summary ms'] >= results['lists ms']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
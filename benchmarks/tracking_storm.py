@@ -0,0 +1,134 @@
+"""Tracking lookups per second under a refresh storm, with and without the tracking cache.
+
+Usage:
+    python benchmarks/tracking_storm.py [--packages 100000] [--trackings 50] [--threads 16] [--seconds 5]
+
+Seeds a scratch packages.db, then for --seconds each has --threads
+customers refreshing /api/track/<tracking> for --trackings tracking
+numbers as fast as they can (the Flask test client, one per thread),
+while a writer changes the status of one of those packages every
+--write-interval seconds through /api/packages/bulk-status:
+
+  uncached     the cache holding no entries, so every lookup reads SQLite
+  cached       plain GETs, answered from the cache
+  conditional  GETs sending back the last ETag, as a browser refresh does;
+               unchanged packages get a 304
+
+Reports lookups/sec, the share of 304s and how many lookups reached the
+database. Afterwards every tracking number is looked up once more and
+compared with the database. Exits non-zero on an error response or a
+stale answer.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server  # noqa: E402
+from seed import seed_packages  # noqa: E402
+
+
+def refresh(trackings, conditional, stop, results, seed):
+    client = server.app.test_client()
+    rng = random.Random(seed)
+    etags = {}
+    counts = {'lookups': 0, 'not_modified': 0, 'errors': 0}
+    while not stop.is_set():
+        tracking = rng.choice(trackings)
+        headers = {'If-None-Match': etags[tracking]} if conditional and tracking in etags else {}
+        response = client.get(f'/api/track/{tracking}', headers=headers)
+        counts['lookups'] += 1
+        if response.status_code == 304:
+            counts['not_modified'] += 1
+        elif response.status_code == 200:
+            etags[tracking] = response.headers['ETag']
+        else:
+            counts['errors'] += 1
+    results.append(counts)
+
+
+def change_statuses(ids, interval, stop, seed):
+    client = server.app.test_client()
+    rng = random.Random(seed)
+    while not stop.wait(interval):
+        client.post('/api/packages/bulk-status',
+                    json={'package_ids': [rng.choice(ids)], 'status': rng.choice(['pending', 'sent_back'])})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packages', type=int, default=100000)
+    parser.add_argument('--trackings', type=int, default=50, help='tracking numbers being refreshed')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-interval', type=float, default=0.1)
+    args = parser.parse_args()
+
+    load_tracking = server.load_tracking
+    reads = [0]
+
+    def counting_load(tracking):
+        reads[0] += 1
+        return load_tracking(tracking)
+
+    server.load_tracking = counting_load
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.init_db()
+        seed_packages(server.DATABASE, args.packages)
+        db = server.get_db()
+        hot = db.execute('SELECT id, tracking FROM packages ORDER BY random() LIMIT ?',
+                         (args.trackings,)).fetchall()
+        db.close()
+        ids = [row['id'] for row in hot]
+        trackings = [row['tracking'] for row in hot]
+
+        print(f'{args.packages} packages, {args.threads} threads refreshing {len(trackings)} tracking numbers '
+              f'for {args.seconds:g}s, a status change every {args.write_interval:g}s')
+        print(f'{"mode":<12} {"lookups/s":>10} {"304s":>6} {"db reads":>9} {"errors":>7}')
+        for mode in ('uncached', 'cached', 'conditional'):
+            server.TRACKING_CACHE_ENTRIES = 0 if mode == 'uncached' else 10000
+            server.tracking_cache = None
+            reads[0] = 0
+            stop = threading.Event()
+            results = []
+            threads = [threading.Thread(target=refresh, args=(trackings, mode == 'conditional', stop, results, i))
+                       for i in range(args.threads)]
+            threads.append(threading.Thread(target=change_statuses, args=(ids, args.write_interval, stop, 0)))
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            lookups = sum(r['lookups'] for r in results)
+            not_modified = sum(r['not_modified'] for r in results)
+            errors = sum(r['errors'] for r in results)
+            print(f'{mode:<12} {lookups / elapsed:>10.0f} {not_modified / max(lookups, 1):>6.0%} '
+                  f'{reads[0]:>9} {errors:>7}')
+            ok = ok and not errors
+
+            client = server.app.test_client()
+            stale = [t for t in trackings if client.get(f'/api/track/{t}').json != load_tracking(t)]
+            if stale:
+                print(f'  {len(stale)} stale answers after the storm')
+                ok = False
+        print(server.get_tracking_cache().stats())
+        server.get_pool().close_all()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
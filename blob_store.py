@@ -0,0 +1,139 @@
+"""Content-addressed storage for label and signature images.
+
+Images are written once to blobs/<aa>/<bb>/<sha256> and the database keeps
+only the URL they are served from (/api/blobs/<sha256>), so the same
+signature saved on ten packages is stored once and existing <img src=...>
+markup keeps working.
+
+A blob's bytes never change, so its URL can be cached forever. An upload
+re-encoded in the background (see image_jobs.py) is stored under its own
+hash and supersedes the original: <sha256>.next names the re-encoding, so
+an upload of the original and a request for its old URL both end up at
+the re-encoded blob once the original is removed.
+"""
+import base64
+import hashlib
+import os
+import re
+import tempfile
+
+URL_PREFIX = '/api/blobs/'
+
+_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Leading bytes of the image formats the browser sends us
+_MAGIC = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'RIFF', 'image/webp'),
+]
+
+
+def is_valid_hash(blob_hash):
+    return bool(_HASH_RE.match(blob_hash or ''))
+
+
+def sniff_mimetype(head):
+    for magic, mimetype in _MAGIC:
+        if head.startswith(magic):
+            return mimetype
+    return 'application/octet-stream'
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, blob_hash):
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def exists(self, blob_hash):
+        return is_valid_hash(blob_hash) and os.path.exists(self.path(blob_hash))
+
+    def put(self, data):
+        """Store bytes and return their sha256; identical content is only written once"""
+        return self._put(data)[0]
+
+    def _put(self, data):
+        """(sha256, whether data was new to the store); the sha256 of the re-encoding
+        if data was superseded by one"""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        successor = self.successor(blob_hash)
+        if successor:
+            return successor, False
+        path = self.path(blob_hash)
+        if os.path.exists(path):
+            return blob_hash, False
+        self._write(path, data)
+        return blob_hash, True
+
+    def supersede(self, blob_hash, data):
+        """Store a re-encoding of a blob's image under its own hash and return that hash;
+        the original is kept until remove()"""
+        new_hash = self.put(data)
+        self._write(self.path(blob_hash) + '.next', new_hash.encode('ascii'))
+        return new_hash
+
+    def successor(self, blob_hash):
+        """Hash of the re-encoding that superseded a blob, or None"""
+        try:
+            with open(self.path(blob_hash) + '.next', encoding='ascii') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def remove(self, blob_hash):
+        """Delete a superseded blob and the files derived from it, keeping its .next"""
+        path = self.path(blob_hash)
+        prefix = os.path.basename(path) + '.'
+        for name in os.listdir(os.path.dirname(path)):
+            if name.startswith(prefix) and name != prefix + 'next':
+                os.remove(os.path.join(os.path.dirname(path), name))
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _write(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def derived(self, blob_hash, name, make):
+        """Path of blobs/.../<hash>.<name>, made from the blob's bytes by make(data) the
+        first time; None if make returns None. A blob's bytes never change, so these
+        never need remaking."""
+        path = f'{self.path(blob_hash)}.{name}'
+        if not os.path.exists(path):
+            data = make(self.get(blob_hash))
+            if data is None:
+                return None
+            self._write(path, data)
+        return path
+
+    def get(self, blob_hash):
+        with open(self.path(blob_hash), 'rb') as f:
+            return f.read()
+
+    def store_image(self, value, stored=None):
+        """Move an inline base64 data URL into the store and return its URL.
+
+        The image is stored as sent; stored(blob_hash), if given, is called
+        when its bytes weren't in the store yet, to queue the re-encoding.
+        Anything that isn't a data URL (empty, or already a blob URL) is
+        returned unchanged.
+        """
+        if not value or not value.startswith('data:') or 'base64,' not in value:
+            return value
+        blob_hash, new = self._put(base64.b64decode(value.split('base64,', 1)[1]))
+        if new and stored:
+            stored(blob_hash)
+        return URL_PREFIX + blob_hash
@@ -0,0 +1,280 @@
+"""Bulk CSV import of customers and packages, for onboarding a new location.
+
+Rows are validated and normalised in Python, then written BATCH_SIZE at a
+time with executemany, one transaction per batch so other stations can
+still write between batches. A row that can't be imported (missing field,
+bad date, phone or tracking number already on file) is reported with its
+CSV line number and skipped; the rest of the file still goes in.
+
+Customers are deduplicated on phone digits (customer_cache.normalize_phone)
+against the database and against earlier rows of the same file. Packages
+are linked to their customer through find_or_create_customer, the same
+phone-then-name lookup create_package uses, which creates the customer
+when there's none; its result is reused for later rows with the same
+phone digits, in any batch.
+
+A package's status must be one of STATUSES (empty is pending). A signed
+package without signed_at is taken to have been signed when it arrived,
+so it still shows up in the signed lists and signing stats.
+
+Usage:
+    python bulk_import.py customers customers.csv [--db packages.db]
+    python bulk_import.py packages packages.csv [--db packages.db] [--allow-duplicates]
+
+Customer columns: name, phone, email, street, postal, profile_locked.
+Package columns: courier, name, tracking, phone, postal, address, status,
+created_at, signed_at. Header names are case-insensitive; unknown columns
+are ignored.
+"""
+import argparse
+import csv
+import io
+import re
+import sqlite3
+import sys
+from datetime import datetime
+
+from customer_cache import normalize_phone
+from package_search import deferred_indexing
+
+# Rows per executemany / transaction
+BATCH_SIZE = 5000
+
+# Errors listed in a result; the count covers every skipped row
+MAX_ERRORS = 1000
+
+STATUSES = ('pending', 'signed', 'sent_back')
+
+REQUIRED = {
+    'customers': ['name'],
+    'packages': ['courier', 'name', 'tracking'],
+}
+
+_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}(:\d{2})?)?$')
+
+
+class CSVFormatError(ValueError):
+    """The file as a whole can't be imported (e.g. a required column is missing)"""
+
+
+def read_rows(text, kind):
+    """Yield (line number, row dict) from CSV text, with lower-cased, stripped headers and values"""
+    reader = csv.reader(io.StringIO(text.lstrip('\ufeff')))
+    header = [h.strip().lower() for h in next(reader, [])]
+    missing = [c for c in REQUIRED[kind] if c not in header]
+    if missing:
+        raise CSVFormatError(f'Missing column(s): {", ".join(missing)}')
+
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        yield reader.line_num, {h: v.strip() for h, v in zip(header, values)}
+
+
+def parse_timestamp(value):
+    """'YYYY-MM-DD[ HH:MM[:SS]]' as the database's timestamp format; None for empty"""
+    if not value:
+        return None
+    # fromisoformat is several times faster than strptime, which matters at 100k rows
+    if _TIMESTAMP.match(value):
+        try:
+            return datetime.fromisoformat(value).isoformat(' ', 'seconds')
+        except ValueError:
+            pass
+    raise ValueError(f'bad date {value!r} (expected YYYY-MM-DD HH:MM:SS)')
+
+
+class Importer:
+    def __init__(self, connect, transaction, normalize_postal, normalize_address, find_or_create_customer):
+        """connect() returns a sqlite3 connection; transaction() is a context manager
+        yielding one inside BEGIN IMMEDIATE.
+
+        normalize_postal(postal), normalize_address(address, postal) and
+        find_or_create_customer(db, name, phone, address, postal) are the
+        server functions of those names.
+        """
+        self.connect = connect
+        self.transaction = transaction
+        self.normalize_postal = normalize_postal
+        self.normalize_address = normalize_address
+        self.find_or_create_customer = find_or_create_customer
+
+    def import_customers(self, text):
+        result = _result()
+        phones = self._phone_index()
+
+        batch = []
+        for line, row in read_rows(text, 'customers'):
+            try:
+                if not row.get('name'):
+                    raise ValueError('name is required')
+                phone_key = normalize_phone(row.get('phone'))
+                if phone_key and phone_key in phones:
+                    raise ValueError(f'phone {row["phone"]} already belongs to customer #{phones[phone_key]}'
+                                     if phones[phone_key] else f'phone {row["phone"]} appears earlier in the file')
+                locked = row.get('profile_locked', '').lower() in ('1', 'true', 'yes', 'y')
+            except ValueError as e:
+                _error(result, line, e)
+                continue
+
+            if phone_key:
+                phones[phone_key] = None
+            batch.append((line, (row['name'], row.get('phone') or None, row.get('email') or None,
+                                 row.get('street', ''), self.normalize_postal(row.get('postal', '')), int(locked))))
+            if len(batch) >= BATCH_SIZE:
+                self._insert_customers(batch, result)
+                batch = []
+        if batch:
+            self._insert_customers(batch, result)
+        return result
+
+    def import_packages(self, text, allow_duplicates=False):
+        result = _result()
+        result['customers_created'] = 0
+        seen_tracking = set()
+        # Customer id by normalised phone (or by name for rows without one), kept across batches
+        customers = self._phone_index()
+
+        batch = []
+        for line, row in read_rows(text, 'packages'):
+            try:
+                for column in REQUIRED['packages']:
+                    if not row.get(column):
+                        raise ValueError(f'{column} is required')
+                if not allow_duplicates and row['tracking'] in seen_tracking:
+                    raise ValueError(f'tracking {row["tracking"]} appears earlier in the file')
+                status = row.get('status', '').lower() or 'pending'
+                if status not in STATUSES:
+                    raise ValueError(f'unknown status {row["status"]!r} (expected {", ".join(STATUSES)})')
+                created_at = parse_timestamp(row.get('created_at'))
+                signed_at = parse_timestamp(row.get('signed_at'))
+                if status == 'signed' and not signed_at:
+                    signed_at = created_at
+            except ValueError as e:
+                _error(result, line, e)
+                continue
+
+            seen_tracking.add(row['tracking'])
+            postal = self.normalize_postal(row.get('postal', ''))
+            batch.append((line, row, postal, self.normalize_address(row.get('address', ''), postal),
+                          status, created_at, signed_at))
+            if len(batch) >= BATCH_SIZE:
+                self._insert_packages(batch, allow_duplicates, customers, result)
+                batch = []
+        if batch:
+            self._insert_packages(batch, allow_duplicates, customers, result)
+        return result
+
+    def _phone_index(self):
+        """Normalised phone -> customer id for every customer with a phone (the oldest, as lookups do)"""
+        db = self.connect()
+        phones = {}
+        for customer_id, phone in db.execute("SELECT id, phone FROM customers WHERE phone IS NOT NULL AND phone != ''"):
+            key = normalize_phone(phone)
+            phones[key] = min(customer_id, phones.get(key, customer_id))
+        db.close()
+        return phones
+
+    def _insert_customers(self, batch, result):
+        sql = '''INSERT INTO customers (name, phone, email, street, postal, profile_locked)
+            VALUES (?, ?, ?, ?, ?, ?)'''
+        try:
+            with self.transaction() as db:
+                db.executemany(sql, [values for _, values in batch])
+            result['imported'] += len(batch)
+        except sqlite3.IntegrityError:
+            # Someone added one of these phones since the import started; find it row by row
+            with self.transaction() as db:
+                for line, values in batch:
+                    try:
+                        db.execute(sql, values)
+                        result['imported'] += 1
+                    except sqlite3.IntegrityError:
+                        _error(result, line, f'phone {values[1]} already exists')
+
+    def _insert_packages(self, batch, allow_duplicates, customers, result):
+        with self.transaction() as db:
+            if not allow_duplicates:
+                existing = self._existing_tracking(db, [row['tracking'] for _, row, *_ in batch])
+                for line, row, *_ in batch:
+                    if row['tracking'] in existing:
+                        _error(result, line, f'tracking {row["tracking"]} is already package #{existing[row["tracking"]]}')
+                batch = [item for item in batch if item[1]['tracking'] not in existing]
+
+            # The lookup goes by phone first and creates the customer with it, so rows with
+            # the same phone digits (or no phone and the same name) share one lookup per import.
+            # It compares phones as written, so "(705) 555-0101" in a later batch wouldn't find
+            # the customer an earlier one created as "705-555-0101".
+            last_id = db.execute('SELECT MAX(id) FROM customers').fetchone()[0] or 0
+            values = []
+            for _, row, postal, address, status, created_at, signed_at in batch:
+                phone, name = row.get('phone', ''), row['name']
+                key = normalize_phone(phone) or ('', name.lower())
+                if key not in customers:
+                    customers[key] = self.find_or_create_customer(db, name, phone or None, address, postal)
+                values.append((row['courier'], name, row['tracking'], phone, postal, address, status,
+                               created_at, signed_at, status, customers[key]))
+            result['customers_created'] += db.execute('SELECT COUNT(*) FROM customers WHERE id > ?',
+                                                      (last_id,)).fetchone()[0]
+
+            with deferred_indexing(db):
+                db.executemany('''INSERT INTO packages
+                    (courier, name, tracking, phone, postal, address, status, created_at, signed_at, customer_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP),
+                    COALESCE(?, CASE ? WHEN 'signed' THEN CURRENT_TIMESTAMP END), ?)''', values)
+        result['imported'] += len(batch)
+
+    def _existing_tracking(self, db, tracking_numbers):
+        existing = {}
+        for i in range(0, len(tracking_numbers), 500):
+            chunk = tracking_numbers[i:i + 500]
+            for row in db.execute(f'''SELECT tracking, MAX(id) FROM all_packages
+                    WHERE tracking IN ({','.join('?' * len(chunk))}) GROUP BY tracking''', chunk):
+                existing[row[0]] = row[1]
+        return existing
+
+
+def _result():
+    return {'imported': 0, 'skipped': 0, 'errors': []}
+
+
+def _error(result, line, error):
+    result['skipped'] += 1
+    if len(result['errors']) < MAX_ERRORS:
+        result['errors'].append({'row': line, 'error': str(error)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import customers or packages from a CSV file')
+    parser.add_argument('kind', choices=['customers', 'packages'])
+    parser.add_argument('file')
+    parser.add_argument('--db', default='packages.db')
+    parser.add_argument('--allow-duplicates', action='store_true',
+                        help='import packages whose tracking number is already on file')
+    args = parser.parse_args()
+
+    # The server module holds the normalisation rules and runs the migrations
+    import server
+    server.DATABASE = args.db
+    server.init_db()
+    importer = Importer(server.get_db, server.transaction, server.normalize_postal_code, server.normalize_address,
+                        server.find_or_create_customer)
+
+    with open(args.file, encoding='utf-8', newline='') as f:
+        text = f.read()
+    try:
+        if args.kind == 'customers':
+            result = importer.import_customers(text)
+        else:
+            result = importer.import_packages(text, args.allow_duplicates)
+    except CSVFormatError as e:
+        sys.exit(str(e))
+
+    for error in result['errors']:
+        print(f'line {error["row"]}: {error["error"]}')
+    print(f'{result["imported"]} {args.kind} imported, {result["skipped"]} skipped'
+          + (f', {result["customers_created"]} customers created' if 'customers_created' in result else ''))
+
+
+if __name__ == '__main__':
+    main()
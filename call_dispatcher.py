@@ -0,0 +1,244 @@
+"""SQLite-backed dispatcher for customer notification calls through the Grandstream UCM.
+
+Calls live in the calls table of packages.db, so anything still queued when
+the server stops is dialled after the next start. A fixed number of worker
+threads, sized to the trunk lines the PBX can use at once, send the dial
+requests through one shared requests.Session. Dial requests are spaced at
+least min_interval seconds apart across all workers so a bulk notification
+doesn't flood the PBX API. A call that fails with a connection error, a
+timeout, 429 or a 5xx is retried with exponential backoff; any other
+response fails it straight away.
+"""
+import random
+import secrets
+import threading
+import time
+
+import requests
+
+import metrics
+
+# Dial attempts per call, including the first
+MAX_ATTEMPTS = 4
+
+# Retry delays double from BACKOFF_SECONDS up to MAX_BACKOFF_SECONDS, with jitter
+BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 120
+
+# Finished calls are deleted after this many seconds
+CALL_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# How many finished calls the latency stats are computed over
+STATS_WINDOW = 200
+
+CALL_COLUMNS = ['id', 'batch_id', 'customer_id', 'name', 'phone', 'status', 'attempts', 'error',
+    'created_at', 'started_at', 'finished_at']
+
+
+class CallDispatcher:
+    def __init__(self, connect, url, auth=None, params=None, workers=2, min_interval=0.5,
+                 timeout=10, poll_interval=1.0):
+        """connect() returns a sqlite3 connection; each dial POSTs params plus 'destination' as JSON to url"""
+        self.connect = connect
+        self.url = url
+        self.params = params or {}
+        self.workers = workers
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+        self.session.auth = auth
+        # One keep-alive connection per worker
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._changed = threading.Condition()
+        self._rate_lock = threading.Lock()
+        self._next_dial = 0
+        self._threads = []
+        self._stopping = False
+
+    def start(self):
+        """Requeue calls interrupted by a restart and start the worker threads"""
+        if self._threads:
+            return
+
+        db = self.connect()
+        # A restart mid-request may mean the PBX already dialled; ringing twice beats not at all
+        db.execute("UPDATE calls SET status = 'queued', next_attempt_at = ? WHERE status = 'dialing'",
+            (time.time(),))
+        db.execute("DELETE FROM calls WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - CALL_RETENTION_SECONDS,))
+        db.commit()
+        db.close()
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'call-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, calls, batch_id=None):
+        """Queue (customer_id, name, phone) tuples in one transaction; returns their call ids in order"""
+        now = time.time()
+        call_ids = [secrets.token_hex(8) for _ in calls]
+
+        db = self.connect()
+        db.executemany('''INSERT INTO calls
+            (id, batch_id, customer_id, name, phone, status, attempts, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?)''',
+            [(call_id, batch_id, customer_id, name, phone, now, now)
+             for call_id, (customer_id, name, phone) in zip(call_ids, calls)])
+        db.commit()
+        db.close()
+
+        self._notify()
+        return call_ids
+
+    def get(self, call_id, wait=0):
+        """Return the call as a dict (None if unknown), waiting up to `wait` seconds for it to finish"""
+        deadline = time.time() + wait
+
+        while True:
+            call = self._fetch(call_id)
+            remaining = deadline - time.time()
+            if call is None or call['status'] in ('done', 'failed') or remaining <= 0:
+                return call
+
+            with self._changed:
+                self._changed.wait(min(remaining, self.poll_interval))
+
+    def batch(self, batch_id):
+        """Every call of a bulk request, in the order they were queued"""
+        db = self.connect()
+        rows = db.execute(f'''SELECT {', '.join(CALL_COLUMNS)} FROM calls
+            WHERE batch_id = ? ORDER BY created_at, rowid''', (batch_id,)).fetchall()
+        db.close()
+        return [dict(row) for row in rows]
+
+    def stop(self, timeout=None):
+        """Let the dials in progress finish and stop the workers; False if some are still running"""
+        self._stopping = True
+        self._notify()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()) if deadline is not None else None)
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def stats(self):
+        db = self.connect()
+        counts = {row['status']: row['count'] for row in db.execute(
+            "SELECT status, COUNT(*) AS count FROM calls GROUP BY status")}
+        recent = db.execute('''SELECT started_at - created_at AS wait, finished_at - created_at AS total,
+                attempts
+            FROM calls WHERE status IN ('done', 'failed')
+            ORDER BY finished_at DESC LIMIT ?''', (STATS_WINDOW,)).fetchall()
+        db.close()
+
+        return {
+            'queued': counts.get('queued', 0),
+            'dialing': counts.get('dialing', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'workers': self.workers,
+            'min_interval_seconds': self.min_interval,
+            'retried': sum(1 for r in recent if r['attempts'] > 1),
+            'wait_seconds': metrics.summary(sorted(r['wait'] for r in recent)),
+            'total_seconds': metrics.summary(sorted(r['total'] for r in recent)),
+        }
+
+    def _fetch(self, call_id):
+        db = self.connect()
+        row = db.execute(f'SELECT {", ".join(CALL_COLUMNS)} FROM calls WHERE id = ?', (call_id,)).fetchone()
+        db.close()
+        return dict(row) if row else None
+
+    def _claim(self):
+        """Atomically move the next due call to dialing.
+
+        Returns (id, phone, attempts) or, when nothing is due, the number of
+        seconds until the next retry (None if the queue is empty).
+        """
+        now = time.time()
+        db = self.connect()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute('''SELECT id, phone, attempts FROM calls
+                WHERE status = 'queued' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT 1''', (now,)).fetchone()
+            if row:
+                db.execute('''UPDATE calls SET status = 'dialing', attempts = attempts + 1,
+                    started_at = COALESCE(started_at, ?) WHERE id = ?''', (now, row['id']))
+            else:
+                due = db.execute("SELECT MIN(next_attempt_at) FROM calls WHERE status = 'queued'").fetchone()[0]
+            db.commit()
+        finally:
+            db.close()
+
+        if row:
+            return row['id'], row['phone'], row['attempts'] + 1
+        return max(0, due - now) if due is not None else None
+
+    def _dial(self, phone):
+        """Send one dial request; returns (error, retry_after) with error None on success"""
+        self._wait_turn()
+        try:
+            with metrics.stage('grandstream_call'):
+                response = self.session.post(self.url, json=dict(self.params, destination=phone),
+                                             timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            return f'Connection error to Grandstream: {e}', 0
+
+        if response.status_code == 200:
+            return None, None
+        error = f'Grandstream returned {response.status_code}: {response.text[:200]}'
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get('Retry-After', '')
+            return error, float(retry_after) if retry_after.isdigit() else 0
+        return error, None
+
+    def _wait_turn(self):
+        """Space dial requests min_interval apart across all workers"""
+        with self._rate_lock:
+            now = time.monotonic()
+            turn = max(now, self._next_dial)
+            self._next_dial = turn + self.min_interval
+        if turn > now:
+            time.sleep(turn - now)
+
+    def _finish(self, call_id, attempts, error, retry_after):
+        now = time.time()
+        db = self.connect()
+        if error and retry_after is not None and attempts < MAX_ATTEMPTS:
+            delay = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+            db.execute('''UPDATE calls SET status = 'queued', error = ?, next_attempt_at = ?
+                WHERE id = ?''', (error, now + max(delay, retry_after), call_id))
+        else:
+            db.execute('''UPDATE calls SET status = ?, error = ?, finished_at = ?
+                WHERE id = ?''', ('failed' if error else 'done', error, now, call_id))
+        db.commit()
+        db.close()
+        self._notify()
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _work(self):
+        while not self._stopping:
+            try:
+                call = self._claim()
+            except Exception:
+                call = self.poll_interval
+
+            if not isinstance(call, tuple):
+                with self._changed:
+                    self._changed.wait(self.poll_interval if call is None else min(call, self.poll_interval))
+                continue
+
+            call_id, phone, attempts = call
+            error, retry_after = self._dial(phone)
+
+            try:
+                self._finish(call_id, attempts, error, retry_after)
+            except Exception:
+                pass  # stays 'dialing' and is requeued on the next start
@@ -0,0 +1,70 @@
+"""Polling of the change logs triggers append to (see migrations.py).
+
+customer_changes and tracking_changes each get a row with a growing
+version and the changed key on every write to their table, so an
+in-process copy (customer_cache, tracking_cache) stays coherent with
+writes from other worker processes and other tools by replaying the rows
+past the version it last saw. The log is checked at most every
+CHECK_INTERVAL seconds; write paths in this process call invalidate()
+after committing so their own changes are visible immediately. Whichever
+reader finds the log past twice CHANGE_LOG_KEEP rows trims it back.
+"""
+import sqlite3
+import time
+
+from database import no_busy_wait
+
+# Seconds between checks of a change log for writes by other processes
+CHECK_INTERVAL = 0.5
+
+# How many change-log rows to keep; a reader further behind than this starts over
+CHANGE_LOG_KEEP = 10000
+
+
+class ChangeLogReader:
+    def __init__(self, connect, table, column):
+        """connect() returns a sqlite3 connection; column is the table's changed key"""
+        self.connect = connect
+        self.table = table
+        self.column = column
+        self.version = None  # last version replayed, None before the first read
+        self._next_check = 0
+
+    def invalidate(self):
+        """Check the log on the next poll() instead of waiting for CHECK_INTERVAL"""
+        self._next_check = 0
+
+    def poll(self, reload, apply):
+        """Catch up with the log if it's due for a check; the caller holds its own lock.
+
+        reload(db) is called on the first read, or when the log was trimmed past
+        this reader, and apply(db, keys) with the set of keys changed since the
+        last read otherwise. self.version has moved on by the time they return.
+        """
+        now = time.monotonic()
+        if self.version is not None and now < self._next_check:
+            return
+
+        db = self.connect()
+        try:
+            # Two subqueries so each is a single b-tree seek rather than a scan
+            latest, oldest = db.execute(f'''SELECT (SELECT MAX(version) FROM {self.table}),
+                (SELECT MIN(version) FROM {self.table})''').fetchone()
+            latest = latest or 0
+            if self.version is None or (oldest and self.version < oldest - 1):
+                reload(db)
+            elif latest > self.version:
+                apply(db, {row[0] for row in db.execute(
+                    f'SELECT {self.column} FROM {self.table} WHERE version > ? AND version <= ?',
+                    (self.version, latest))})
+            self.version = latest
+            if oldest and latest - oldest > 2 * CHANGE_LOG_KEEP:
+                try:
+                    with no_busy_wait(db):
+                        db.execute(f'DELETE FROM {self.table} WHERE version <= ?', (latest - CHANGE_LOG_KEEP,))
+                        db.commit()
+                except sqlite3.OperationalError:
+                    pass  # busy; trim next time
+        finally:
+            db.close()
+        self._next_check = now + CHECK_INTERVAL
@@ -0,0 +1,197 @@
+"""Assert that every SQL statement the API runs is served by an index.
+
+Usage:
+    python check_query_plans.py [-v]
+
+Builds a scratch packages.db through the normal migrations, drives each
+endpoint through the Flask test client while recording the SQL it runs,
+then checks EXPLAIN QUERY PLAN for every statement. A bare
+"SCAN <table>" (a full table scan without an index) is a failure; a
+temp B-tree for ORDER BY is reported as a warning. Exits non-zero on
+failure, so it can run in CI after schema or query changes.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+import server
+
+# Tables small enough that a scan is fine
+SMALL_TABLES = {'users', 'schema_version',
+    # Read whole by /api/stats/summary: a row per status, per customer with pending packages
+    'package_status_counts', 'customer_pending_counts'}
+
+_SCAN_RE = re.compile(r'^SCAN (\S+)(.*)$')
+
+
+def record_statements(statements):
+    """Make every pooled connection log the SQL it runs"""
+    pool = server.get_pool()
+    original = pool.connect
+
+    def traced_connect():
+        db = original()
+        db.set_trace_callback(lambda sql: statements.append((current_endpoint[0], sql)))
+        return db
+
+    pool.connect = traced_connect
+
+
+current_endpoint = ['']
+
+
+def exercise(client):
+    """Call every endpoint that touches the database at least once"""
+    def call(label, method, url, **kwargs):
+        current_endpoint[0] = label
+        response = getattr(client, method)(url, **kwargs)
+        if response.status_code >= 500:
+            raise SystemExit(f'{label}: {method.upper()} {url} failed with {response.status_code}')
+        return response
+
+    call('login', 'post', '/api/login', json={'username': 'sav', 'password': 'admin123'})
+    call('create_user', 'post', '/api/users', json={'username': 'clerk', 'password': 'x'})
+    call('get_users', 'get', '/api/users')
+    call('get_user_password', 'get', '/api/users/clerk/password')
+    call('reset_password', 'put', '/api/users/clerk/password', json={'password': 'y'})
+
+    call('add_customer', 'post', '/api/customers',
+         json={'name': 'Jane Roe', 'phone': '7055550000', 'street': '1 Main St', 'postal': 'P5A 1X1'})
+    call('get_customers', 'get', '/api/customers')
+    call('update_customer', 'put', '/api/customers/1',
+         json={'name': 'Jane Roe', 'phone': '7055550000', 'street': '2 Main St', 'postal': 'P5A 1X1'})
+
+    ids = []
+    for i, (name, phone) in enumerate([('Jane Roe', '7055550000'), ('John Doe', ''), ('Jim Poe', '7055550002')]):
+        response = call('create_package', 'post', '/api/packages', json={
+            'courier': 'UPS', 'name': name, 'tracking': f'1Z{i:010d}', 'phone': phone, 'postal': 'P5A1X1'})
+        ids.append(response.json['id'])
+
+    current_endpoint[0] = 'lookup_customer_by_name'
+    server.lookup_customer_by_name('jane roe')
+
+    call('get_pending_packages', 'get', '/api/packages/pending?limit=1')
+    cursor = client.get('/api/packages/pending?limit=1').headers.get('X-Next-Cursor')
+    call('get_pending_packages (cursor)', 'get', f'/api/packages/pending?limit=1&cursor={cursor}')
+    call('get_old_packages', 'get', '/api/packages/old')
+    call('stats_summary', 'get', '/api/stats/summary?customers=1')
+    call('update_package', 'put', f'/api/packages/{ids[0]}', json={
+        'courier': 'UPS', 'name': 'Jane Roe', 'tracking': '1Z0000000000', 'phone': '7055550000',
+        'postal': 'P5A 1X1', 'address': '', 'status': 'pending'})
+    call('sign_package', 'post', f'/api/packages/{ids[0]}/sign', json={'signature': ''})
+    call('bulk_update_status', 'post', '/api/packages/bulk-status', json={'package_ids': [ids[1]], 'status': 'sent_back'})
+    call('bulk_pickup', 'post', '/api/pickups/bulk', json={'package_ids': [ids[2]], 'customer_id': 3})
+    call('get_pickups', 'get', '/api/pickups')
+    sync = {'operations': [
+        {'key': 'st1-1', 'op': 'create', 'courier': 'UPS', 'name': 'Jim Poe', 'tracking': '1Z0000000007',
+         'phone': '7055550002', 'postal': 'P5A1X1'},
+        {'key': 'st1-2', 'op': 'update', 'package_key': 'st1-1', 'courier': 'UPS', 'name': 'Jim Poe',
+         'tracking': '1Z0000000007', 'phone': '7055550002', 'postal': 'P5A 1X1', 'status': 'pending'},
+        {'key': 'st1-3', 'op': 'sign', 'package_key': 'st1-1', 'signature': ''},
+        {'key': 'st1-4', 'op': 'pickup', 'customer_id': 3, 'package_keys': ['st1-1']},
+    ]}
+    call('sync_operations', 'post', '/api/sync', json=sync)
+    call('sync_operations (replay)', 'post', '/api/sync', json=sync)
+    call('get_archived_packages', 'get', '/api/packages/archived')
+    call('get_archived_packages (all fields)', 'get', '/api/packages/archived?fields=all')
+    call('get_archived_packages (search)', 'get', '/api/packages/archived?search=jane')
+    call('get_archived_packages (relevance)', 'get', '/api/packages/archived?search=jane&sort=relevance')
+    # Streamed: the queries only run as the body is read
+    call('export_packages', 'get', '/api/export/packages?images=1').get_data()
+    call('export_packages (filtered)', 'get', '/api/export/packages?format=ndjson&status=signed'
+         '&date=signed_at&from=2020-01-01&to=2030-12-31').get_data()
+    call('get_customer_packages', 'get', '/api/customers/1/packages?status=signed')
+    call('track_package', 'get', '/api/track/1Z0000000000')
+    call('skip_package', 'post', f'/api/packages/skip/{ids[1]}')
+    call('delete_customer', 'delete', '/api/customers/2')
+    call('import_customers', 'post', '/api/import/customers',
+         data=b'name,phone\nJane Roe,705-555-0000\nAl Poe,705-555-0009\n')
+    call('import_packages', 'post', '/api/import/packages',
+         data=b'courier,name,tracking,phone\nUPS,Al Poe,1Z0000000000,7055550009\nUPS,Ed Loe,1Z0000000009,7055550010\n')
+
+    current_endpoint[0] = 'stream_events'
+    bus = server.get_event_bus()
+    bus.subscribe(0)
+    bus.after(0)
+    call('get_event_stats', 'get', '/api/events/stats')
+
+    current_endpoint[0] = 'ocr_jobs'
+    jobs = server.OCRJobQueue(server.get_db, lambda image: {}, workers=1)
+    job_id = jobs.enqueue('')
+    jobs._claim()
+    jobs._finish(job_id, {})
+    jobs.get(job_id)
+    jobs.stats()
+
+    current_endpoint[0] = 'reencode_image'
+    png = server.cv2.imencode('.png', server.np.full((64, 64, 3), 255, server.np.uint8))[1].tobytes()
+    server.reencode_image(server.blobs.put(png), 'label')
+
+    # Workers aren't started, so nothing is actually dialled
+    server.call_dispatcher = server.CallDispatcher(server.get_db, 'http://127.0.0.1:9/api/make_call')
+    response = call('call_customer', 'post', '/api/call/customer/1')
+    call_id = response.json['call_id']
+    response = call('call_bulk_customers', 'post', '/api/call/bulk', json={'customer_ids': [1, 3]})
+    call('get_calls', 'get', f'/api/calls?batch={response.json["batch_id"]}')
+    current_endpoint[0] = 'call_dispatcher'
+    claimed = server.call_dispatcher._claim()
+    server.call_dispatcher._finish(claimed[0], claimed[2], 'busy', 0)
+    server.call_dispatcher._claim()
+    server.call_dispatcher._finish(call_id, 1, None, None)
+    server.call_dispatcher.start()
+    call('get_call', 'get', f'/api/calls/{call_id}')
+    call('get_call_stats', 'get', '/api/calls/stats')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that API queries use indexes')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+
+    statements = []
+    with tempfile.TemporaryDirectory() as tmp:
+        server.DATABASE = os.path.join(tmp, 'packages.db')
+        server.blobs.root = os.path.join(tmp, 'blobs')
+        server.init_db()
+        record_statements(statements)
+        exercise(server.app.test_client())
+
+        db = sqlite3.connect(server.DATABASE)
+        failures = warnings = 0
+        seen = set()
+        for endpoint, sql in statements:
+            sql = sql.strip()
+            # Skip anything that isn't a query, and FTS5's own lookups of its shadow tables
+            if (not re.match(r'(SELECT|UPDATE|DELETE|INSERT)\b', sql, re.IGNORECASE)
+                    or "'main'." in sql or (endpoint, sql) in seen):
+                continue
+            seen.add((endpoint, sql))
+
+            plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql)]
+            # Scanning the rows a subquery or view yields isn't a table scan; its own lines say how it reads
+            subqueries = {line.strip().split()[1] for line in plan
+                          if line.strip().startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+            scans = [m.group(1) for line in plan for m in [_SCAN_RE.match(line.strip())]
+                     if m and 'USING' not in m.group(2) and 'VIRTUAL TABLE' not in m.group(2)
+                     and not m.group(1).startswith('(') and m.group(1) not in SMALL_TABLES
+                     and m.group(1) not in subqueries and line.strip() != 'SCAN CONSTANT ROW']
+            temp_sort = any('TEMP B-TREE' in line for line in plan)
+
+            status = 'FAIL' if scans else 'WARN' if temp_sort else 'ok'
+            failures += bool(scans)
+            warnings += status == 'WARN'
+            if status != 'ok' or args.verbose:
+                print(f'[{status}] {endpoint}: {" ".join(sql.split())}')
+                for line in plan:
+                    print(f'        {line}')
+        db.close()
+
+    print(f'{len(seen)} statements checked, {failures} full scans, {warnings} temp sorts')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Recount the dashboard counts from packages and report any drift.
+
+Usage:
+    python check_stats.py [--database packages.db] [--repair]
+
+The counts behind /api/stats/summary are kept by triggers (see
+package_stats.py), so they should never drift; this recomputes every one
+from packages and the archive tier in a single snapshot and lists the
+ones that differ. With --repair the tables are rebuilt in a write transaction.
+Exits non-zero if drift was found and not repaired, so it can run from
+cron.
+"""
+import argparse
+import sqlite3
+import sys
+
+import package_stats
+import server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default=server.DATABASE)
+    parser.add_argument('--repair', action='store_true', help='rebuild the counts if they drifted')
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.database, isolation_level=None)
+    db.execute('BEGIN')
+    mismatches = package_stats.drift(db)
+    db.execute('ROLLBACK')
+
+    for table, key, stored, actual in mismatches:
+        print(f'{table} {key!r}: stored {stored}, actual {actual}')
+    print(f'{len(mismatches)} counts drifted')
+
+    if mismatches and args.repair:
+        db.execute('BEGIN IMMEDIATE')
+        package_stats.rebuild(db)
+        db.execute('COMMIT')
+        print('counts rebuilt')
+    db.close()
+
+    if mismatches and not args.repair:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""In-process customer index for OCR auto-fill and package creation.
+
+Every customer row is held in memory, keyed by phone digits and by
+normalised name. Triggers on the customers table append each change to
+customer_changes (see migrations.py), and the index replays that log
+before answering, so writes from this process, other worker processes
+and other tools all show up (see change_log.py).
+"""
+import re
+import threading
+
+from change_log import ChangeLogReader
+from name_matcher import NameMatcher
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    # Treat +1 705... and 705... as the same number
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return digits
+
+
+def normalize_name(name):
+    return ' '.join((name or '').lower().split())
+
+
+class CustomerIndex:
+    def __init__(self, connect):
+        """connect() returns a sqlite3 connection with Row factory"""
+        self.connect = connect
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_phone = {}
+        self._by_name = {}
+        self._matcher = NameMatcher()
+        self._log = ChangeLogReader(connect, 'customer_changes', 'customer_id')
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.refreshes = 0
+
+    def get_by_phone(self, phone):
+        key = normalize_phone(phone)
+        return self._lookup(self._by_phone, key) if key else None
+
+    def get_by_name(self, name):
+        key = normalize_name(name)
+        return self._lookup(self._by_name, key) if key else None
+
+    def match_name(self, name, limit=5):
+        """Fuzzy name matches as [(customer, score)], best first (see name_matcher.py)"""
+        with self._lock:
+            self._sync()
+            return [(dict(self._by_id[customer_id]), score)
+                    for customer_id, score in self._matcher.match(name, limit)]
+
+    def customers(self):
+        """Snapshot of every cached customer (dicts must not be modified)"""
+        with self._lock:
+            self._sync()
+            return list(self._by_id.values())
+
+    def invalidate(self):
+        """Check the change log on the next lookup instead of waiting for CHECK_INTERVAL"""
+        self._log.invalidate()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'customers': len(self._by_id),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'reloads': self.reloads,
+                'refreshes': self.refreshes,
+                'version': self._log.version,
+            }
+
+    def _lookup(self, table, key):
+        with self._lock:
+            self._sync()
+            matches = table.get(key)
+            if matches:
+                self.hits += 1
+                # Like the SQL lookups this replaces, the oldest customer wins a tie
+                return dict(matches[min(matches)])
+            self.misses += 1
+            return None
+
+    def _sync(self):
+        self._log.poll(self._reload, self._apply_changes)
+
+    def _reload(self, db):
+        self._by_id = {}
+        self._by_phone = {}
+        self._by_name = {}
+        self._matcher = NameMatcher()
+        for row in db.execute('SELECT * FROM customers ORDER BY id'):
+            self._add(dict(row))
+        self.reloads += 1
+
+    def _apply_changes(self, db, changed):
+        for customer_id in changed:
+            self._remove(customer_id)
+            row = db.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
+            if row:
+                self._add(dict(row))
+        self.refreshes += 1
+
+    def _keys(self, customer):
+        return ((self._by_phone, normalize_phone(customer.get('phone'))),
+                (self._by_name, normalize_name(customer.get('name'))))
+
+    def _add(self, customer):
+        self._by_id[customer['id']] = customer
+        for table, key in self._keys(customer):
+            if key:
+                table.setdefault(key, {})[customer['id']] = customer
+        self._matcher.add(customer['id'], customer.get('name'))
+
+    def _remove(self, customer_id):
+        customer = self._by_id.pop(customer_id, None)
+        if not customer:
+            return
+        self._matcher.remove(customer_id)
+        for table, key in self._keys(customer):
+            matches = table.get(key)
+            if matches:
+                matches.pop(customer_id, None)
+                if not matches:
+                    del table[key]
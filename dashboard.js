@@ -1,44 +1,6 @@
 let pendingPackages = [], currentBatchPackages = [];
 const API_URL = 'http://localhost:5000/api'; // Update this to your server URL when deployed
 
-async function processImages() {
-    try {
-        const files = document.getElementById('labelImages').files;
-        if (!files.length) return alert('❌ Select images');
-        
-        const courier = document.getElementById('courier').value;
-        document.getElementById('processing').innerHTML = '⏳ Processing...';
-        pendingPackages = [];
-        
-        for (let i = 0; i < files.length; i++) {
-            const f = files[i];
-            
-            // Convert image to base64 for storage and processing
-            const reader = new FileReader();
-            const imageData = await new Promise((resolve) => {
-                reader.onload = (e) => resolve(e.target.result);
-                reader.readAsDataURL(f);
-            });
-            
-            document.getElementById('processing').innerHTML = '⏳ ' + (i + 1) + '/' + files.length + ': ' + f.name + '...';
-            
-            try {
-                // Send to server for PaddleOCR processing
-                const response = await fetch(`${API_URL}/process`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        image: imageData,
-                        courier: courier
-                    })
-                });
-                
-                if (!response.ok) throw new Error('Server processing failed');
-                
-                const result = await response.json();
-let pendingPackages = [], currentBatchPackages = [];
-const API_URL = 'http://localhost:5000/api';
-
 async function processImages() {
     try {
         const files = document.getElementById('labelImages').files;
@@ -150,20 +112,30 @@ async function savePackageFromForm(i) {
     }
     
     try {
-        const response = await fetch(`${API_URL}/packages`, {
+        const payload = {
+            courier: pkg.courier,
+            name: pkg.name,
+            tracking: pkg.tracking,
+            phone: pkg.phone,
+            postal: pkg.postal,
+            labelImage: pkg.labelImage,
+            createdBy: sessionStorage.getItem('currentUser')
+        };
+        const save = (body) => fetch(`${API_URL}/packages`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                courier: pkg.courier,
-                name: pkg.name,
-                tracking: pkg.tracking,
-                phone: pkg.phone,
-                postal: pkg.postal,
-                labelImage: pkg.labelImage,
-                createdBy: sessionStorage.getItem('currentUser')
-            })
+            body: JSON.stringify(body)
         });
         
+        let response = await save(payload);
+        
+        // Same tracking number already checked in: let staff decide
+        if (response.status === 409) {
+            const duplicate = await response.json();
+            if (!confirm('⚠️ ' + duplicate.message + '\n\nSave it again anyway?')) return;
+            response = await save({ ...payload, allowDuplicate: true });
+        }
+        
         if (!response.ok) throw new Error('Failed to save package');
         
         currentBatchPackages.push(pkg);
@@ -251,36 +223,80 @@ async function filterPackages() {
         console.error('Search error:', err);
         alert('❌ Error searching packages');
     }
+}
+
+// Every page of a package list: each response holds at most one page, and carries
+// X-Next-Cursor when there are more
+async function fetchAllPages(url) {
+    let packages = [];
+    let cursor = null;
+    do {
+        const response = await fetch(cursor ? `${url}${url.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}` : url);
+        if (!response.ok) {
+            throw new Error(`Failed to fetch ${url}`);
+        }
+        packages = packages.concat(await response.json());
+        cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return packages;
+}
+
+// 5-Day Ready Packages, as last fetched and since updated by change events
+let fiveDayPackages = [];
+
+// The counts the dashboard shows, from /api/stats/summary rather than from the lists
+let dashboardCounts = { pending: 0, old: 0 };
 
+async function loadDashboardCounts() {
+    const response = await fetch(`${API_URL}/stats/summary`);
+    if (!response.ok) {
+        throw new Error('Failed to fetch dashboard counts');
+    }
+    dashboardCounts = await response.json();
+    document.getElementById('fiveDayCount').textContent = dashboardCounts.old;
+    document.getElementById('fiveDaySection').style.display = dashboardCounts.old ? 'block' : 'none';
+}
 
-// Load 5-Day Ready Packages
+// Load 5-Day Ready Packages; the summary's old count says whether there are any, so the
+// list is only fetched when the section has something to show
 async function load5DayPackages() {
     try {
-        const response = await fetch(`${API_URL}/packages/ready-5days`);
-        const packages = await response.json();
-        
-        if (!response.ok) {
-            throw new Error('Failed to fetch 5-day packages');
-        }
-        
-        if (packages.length > 0) {
-            document.getElementById('fiveDaySection').style.display = 'block';
-            displayFiveDayPackages(packages);
-        } else {
-            document.getElementById('fiveDaySection').style.display = 'none';
-        }
+        await loadDashboardCounts();
+        fiveDayPackages = dashboardCounts.old ? await fetchAllPages(`${API_URL}/packages/old`) : [];
+        displayFiveDayPackages();
     } catch (error) {
         console.error('Error loading 5-day packages:', error);
     }
 }
 
-// Display 5-Day Packages
-function displayFiveDayPackages(packages) {
+// Counts change with every event, and packages turn 5 days old without one, so the counts
+// are read again shortly after events and every POLL_MS; the 5-day list is fetched again
+// only when the old count no longer matches it
+let countRefresh = null;
+
+function scheduleCountRefresh(delay = 500) {
+    clearTimeout(countRefresh);
+    countRefresh = setTimeout(async () => {
+        try {
+            await loadDashboardCounts();
+            if (dashboardCounts.old !== fiveDayPackages.length) {
+                await load5DayPackages();
+            }
+        } catch (error) {
+            console.error('Error loading dashboard counts:', error);
+        }
+        scheduleCountRefresh(POLL_MS);
+    }, delay);
+}
+
+// Display 5-Day Packages, keeping the boxes already ticked
+function displayFiveDayPackages() {
+    const checked = new Set(Array.from(document.querySelectorAll('.five-day-checkbox:checked'), cb => cb.dataset.id));
     const listDiv = document.getElementById('fiveDayPackageList');
-    listDiv.innerHTML = packages.map(pkg => `
+    listDiv.innerHTML = fiveDayPackages.map(pkg => `
         <div class="package-card" style="margin-bottom: 10px; padding: 10px; border: 1px solid #ddd; border-radius: 4px;">
-            <input type="checkbox" class="five-day-checkbox" data-id="${pkg.id}" style="margin-right: 10px;" />
-            <strong>${pkg.tracking}</strong> - ${pkg.name} (Ready since: ${new Date(pkg.ready_date).toLocaleDateString()})
+            <input type="checkbox" class="five-day-checkbox" data-id="${pkg.id}" style="margin-right: 10px;" ${checked.has(String(pkg.id)) ? 'checked' : ''} />
+            <strong>${pkg.tracking}</strong> - ${pkg.name} (Ready since: ${new Date(pkg.created_at).toLocaleDateString()})
         </div>
     `).join('');
 }
@@ -314,6 +330,81 @@ async function markSelectedAsSentBack() {
     }
 }
 
-// Load 5-day packages on page load
-load5DayPackages();}
+// Live updates: every station's scans, signatures and pickups arrive as events (see
+// event_bus.py) and are applied to the lists the page already has. A list is only fetched
+// again when events may have been missed: on a reset event (the stream resumed past the
+// retained log), and when the stream is opened again after the page fell back to polling.
+const CHANGE_EVENTS = ['package.created', 'package.updated', 'package.signed', 'package.deleted',
+                       'packages.status', 'pickup.created'];
+const POLL_MS = 30000;
+const changeHandlers = [];
+
+// handler(type, data) is called for each change event, and with type 'reload' when the
+// lists have to be fetched again
+function onPackageChange(handler) {
+    changeHandlers.push(handler);
+}
+
+function notifyChange(type, data) {
+    changeHandlers.forEach(handler => handler(type, data));
+}
+
+// What an event does to a list of pending packages: {removed: ids no longer pending,
+// pending: a package to add or update}, or {reload: true} when the list can't be patched
+function pendingChange(type, data) {
+    switch (type) {
+        case 'package.created':
+        case 'package.updated':
+        case 'package.signed':
+            return data.status === 'pending' ? { removed: [], pending: data } : { removed: [data.id], pending: null };
+        case 'package.deleted':
+            return { removed: [data.id], pending: null };
+        case 'packages.status':
+            // Packages put back to pending aren't in the event, only their ids
+            return data.status === 'pending' ? { reload: true } : { removed: data.ids.map(Number), pending: null };
+        case 'pickup.created':
+            return { removed: data.package_ids.map(Number), pending: null };
+    }
+    return { removed: [], pending: null };
+}
 
+function subscribeToChanges(missedEvents = false) {
+    if (!window.EventSource) {
+        setInterval(() => notifyChange('reload'), POLL_MS);
+        return;
+    }
+    const events = new EventSource(`${API_URL}/events`);
+    CHANGE_EVENTS.forEach(type => events.addEventListener(type, e => notifyChange(type, JSON.parse(e.data))));
+    events.addEventListener('reset', () => notifyChange('reload'));
+    if (missedEvents) {
+        events.addEventListener('open', () => notifyChange('reload'), { once: true });
+    }
+    events.onerror = () => {
+        // A dropped stream reconnects by itself with Last-Event-ID; one that can't be opened doesn't
+        if (events.readyState !== EventSource.CLOSED) return;
+        const poll = setInterval(() => notifyChange('reload'), POLL_MS);
+        setTimeout(() => {
+            clearInterval(poll);
+            subscribeToChanges(true);
+        }, 10 * POLL_MS);
+    };
+}
+
+onPackageChange((type, data) => {
+    const change = type === 'reload' ? { reload: true } : pendingChange(type, data);
+    if (change.reload) {
+        load5DayPackages();
+        return;
+    }
+    // New packages aren't 5 days old; one edited but still pending keeps its place
+    fiveDayPackages = fiveDayPackages
+        .filter(pkg => !change.removed.includes(pkg.id))
+        .map(pkg => change.pending && pkg.id === change.pending.id ? { ...pkg, ...change.pending } : pkg);
+    displayFiveDayPackages();
+    scheduleCountRefresh();
+});
+
+// Load 5-day packages on page load
+load5DayPackages();
+scheduleCountRefresh(POLL_MS);
+subscribeToChanges();
@@ -0,0 +1,174 @@
+"""Pooled SQLite connections for packages.db.
+
+Connections are opened once with WAL journaling and tuned pragmas, then
+reused. Code keeps the usual get_db() ... db.close() pattern: close()
+on a pooled connection rolls back anything left uncommitted and hands
+the connection back to the pool instead of closing it.
+
+Writes that must be atomic go through transaction(), which takes the
+write lock up front (BEGIN IMMEDIATE) so concurrent writers queue on the
+busy timeout instead of failing with "database is locked" when a read
+transaction tries to upgrade.
+
+Every execute() / executemany(), fetchmany() and fetchall() on a pooled
+connection is timed into metrics.QUERIES, labelled with the statement's
+first keyword.
+"""
+import queue
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from metrics import QUERIES, REGISTRY
+
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',     # safe with WAL; fsync at checkpoints only
+    'PRAGMA cache_size = -20000',      # 20 MB page cache per connection
+    'PRAGMA mmap_size = 268435456',    # 256 MB memory-mapped reads
+    'PRAGMA temp_store = MEMORY',
+]
+
+# Seconds SQLite itself waits on a lock before raising "database is locked"
+BUSY_TIMEOUT = 5.0
+
+# Extra attempts, with jittered backoff, when the busy timeout still isn't enough
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+
+def _operation(sql):
+    words = sql[:32].split(None, 1)
+    return words[0].upper() if words else ''
+
+
+class TimedCursor(sqlite3.Cursor):
+    operation = ''
+
+    def fetchmany(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            if REGISTRY.enabled:
+                QUERIES.observe(time.perf_counter() - start, self.operation, 'fetch')
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            if REGISTRY.enabled:
+                QUERIES.observe(time.perf_counter() - start, self.operation, 'fetch')
+
+
+class PooledConnection(sqlite3.Connection):
+    pool = None
+
+    def execute(self, sql, parameters=()):
+        cursor = self.cursor(TimedCursor)
+        cursor.operation = _operation(sql)
+        start = time.perf_counter()
+        try:
+            return cursor.execute(sql, parameters)
+        finally:
+            if REGISTRY.enabled:
+                QUERIES.observe(time.perf_counter() - start, cursor.operation, 'execute')
+
+    def executemany(self, sql, seq_of_parameters):
+        cursor = self.cursor(TimedCursor)
+        cursor.operation = _operation(sql)
+        start = time.perf_counter()
+        try:
+            return cursor.executemany(sql, seq_of_parameters)
+        finally:
+            if REGISTRY.enabled:
+                QUERIES.observe(time.perf_counter() - start, cursor.operation, 'execute')
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+def is_busy_error(error):
+    return isinstance(error, sqlite3.OperationalError) and (
+        'locked' in str(error) or 'busy' in str(error))
+
+
+def retry_on_busy(fn, *args, **kwargs):
+    """Call fn, retrying with backoff while SQLite reports the database as locked"""
+    for attempt in range(BUSY_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == BUSY_RETRIES:
+                raise
+            time.sleep(BUSY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+@contextmanager
+def no_busy_wait(db):
+    """Make db's statements fail at once on a lock instead of waiting out BUSY_TIMEOUT, for
+    writes that can simply be skipped (the holder may be this very thread, mid-transaction)"""
+    db.execute('PRAGMA busy_timeout = 0')
+    try:
+        yield db
+    finally:
+        db.execute(f'PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}')
+
+
+class ConnectionPool:
+    def __init__(self, path, max_idle=16):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, factory=PooledConnection,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        return conn
+
+    def connect(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.really_close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().really_close()
+            except queue.Empty:
+                return
+
+    @contextmanager
+    def transaction(self):
+        """Yield a connection inside BEGIN IMMEDIATE; commit on success, roll back on error"""
+        db = self.connect()
+        try:
+            retry_on_busy(db.execute, 'BEGIN IMMEDIATE')
+            yield db
+            db.commit()
+        except BaseException:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        finally:
+            db.close()
@@ -0,0 +1,176 @@
+"""Change events for the /api/events server-sent event stream.
+
+Write endpoints publish() an event after committing. Events are appended
+to the events table, so every server process sees them and a client that
+reconnects with Last-Event-ID resumes where it left off. One thread per
+process tails the table (immediately after a local publish, otherwise
+every poll_interval seconds), keeps the recent events in memory and calls
+the listeners registered with listen(). The streams themselves are written
+by event_server.py, one thread for all of them; neither thread's work
+grows with the number of subscribers beyond writing each batch to them.
+
+Event types: package.created, package.updated and package.signed carry
+the package (list fields, no images); package.deleted carries {id};
+packages.status carries {ids, status}; pickup.created carries {id,
+customer_id, package_ids}. A client whose Last-Event-ID is older than
+the retained log gets a reset event and should reload its lists.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+# Seconds between checks of the events table for events from other processes
+POLL_INTERVAL = 0.5
+
+# How many events the table keeps for reconnecting clients
+EVENT_RETENTION = 10000
+
+# Recent events held in memory for the streams of this process
+RECENT_EVENTS = 1000
+
+
+class EventBus:
+    def __init__(self, connect, poll_interval=POLL_INTERVAL):
+        """connect() returns a sqlite3 connection"""
+        self.connect = connect
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._poll_now = threading.Event()
+        self._recent = deque()  # (id, type, data as JSON)
+        self._floor = None      # events with id <= floor aren't in _recent
+        self._last_id = None
+        self._thread = None
+        self._closed = False
+        self._stale = False
+        self.subscribers = 0
+        self.published = 0
+        self.polls = 0
+
+    def publish(self, event_type, data):
+        """Append an event; returns its id, or None if it couldn't be stored"""
+        try:
+            db = self.connect()
+            try:
+                event_id = db.execute('INSERT INTO events (type, data, created_at) VALUES (?, ?, ?)',
+                    (event_type, json.dumps(data), time.time())).lastrowid
+                if event_id % 100 == 0:
+                    db.execute('DELETE FROM events WHERE id <= ?', (event_id - EVENT_RETENTION,))
+                db.commit()
+            finally:
+                db.close()
+        except Exception:
+            return None  # the change itself is committed; clients catch up on their next reload
+
+        self.published += 1
+        self._poll_now.set()
+        return event_id
+
+    def subscribe(self, last_event_id=None):
+        """(cursor, reset) for a new subscriber: events after cursor are its to send, from now or
+        from last_event_id. reset means last_event_id is older than the retained log, so the
+        client has missed events and should reload its lists."""
+        self._start()
+        cursor = self._current_id()
+        if last_event_id is None or last_event_id >= cursor:
+            return cursor, False
+        if last_event_id < self._oldest_id() - 1:
+            return cursor, True
+        return last_event_id, False
+
+    def listen(self, wake):
+        """Call wake() from the tail thread whenever new events are in (and on close())"""
+        with self._lock:
+            self._listeners.append(wake)
+
+    def after(self, cursor):
+        """Events with id > cursor as (id, type, data as JSON), from memory when they're recent enough"""
+        with self._lock:
+            if self._floor is not None and cursor >= self._floor:
+                return [event for event in self._recent if event[0] > cursor]
+
+        db = self.connect()
+        rows = db.execute('SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT ?',
+            (cursor, RECENT_EVENTS)).fetchall()
+        db.close()
+        return [tuple(row) for row in rows]
+
+    def stats(self):
+        return {
+            'subscribers': self.subscribers,
+            'published': self.published,
+            'last_event_id': self._last_id,
+            'recent_events': len(self._recent),
+            'polls': self.polls,
+        }
+
+    def close(self):
+        """Stop the tail thread and end the streams (on shutdown, or when the server is pointed
+        at another database)"""
+        self._closed = True
+        self._poll_now.set()
+        self._wake()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._last_id = self._floor = self._current_id()
+                self._thread = threading.Thread(target=self._tail, name='event-tail', daemon=True)
+                self._thread.start()
+
+    def _current_id(self):
+        db = self.connect()
+        event_id = db.execute('SELECT MAX(id) FROM events').fetchone()[0] or 0
+        db.close()
+        return event_id
+
+    def _oldest_id(self):
+        db = self.connect()
+        event_id = db.execute('SELECT MIN(id) FROM events').fetchone()[0] or 0
+        db.close()
+        return event_id
+
+    def _wake(self):
+        with self._lock:
+            listeners = list(self._listeners)
+        for wake in listeners:
+            wake()
+
+    def _tail(self):
+        while not self._closed:
+            self._poll_now.wait(self.poll_interval)
+            self._poll_now.clear()
+            if self._closed:
+                break
+            if not self.subscribers:
+                # Nobody is listening: skip ahead instead of replaying the backlog later
+                self._stale = True
+                continue
+
+            try:
+                if self._stale:
+                    current = self._current_id()
+                    with self._lock:
+                        self._recent.clear()
+                        self._last_id = self._floor = max(self._last_id, current)
+                    self._stale = False
+                db = self.connect()
+                rows = db.execute('SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT ?',
+                    (self._last_id, RECENT_EVENTS)).fetchall()
+                db.close()
+            except Exception:
+                continue
+            self.polls += 1
+            if not rows:
+                continue
+
+            with self._lock:
+                for row in rows:
+                    self._recent.append(tuple(row))
+                while len(self._recent) > RECENT_EVENTS:
+                    self._floor = self._recent.popleft()[0]
+                self._last_id = rows[-1][0]
+            self._wake()
+            if len(rows) == RECENT_EVENTS:
+                self._poll_now.set()
@@ -0,0 +1,290 @@
+"""One thread serving every /api/events stream of this process.
+
+A threaded WSGI server (werkzeug, waitress, gunicorn gthread) holds a
+request thread for as long as it writes a response, which for an event
+stream is as long as the dashboard stays open. So the streams get their
+own listener (EVENTS_BIND in server.py), and one thread with a selector
+serves all of them: it accepts the connections, reads each
+GET /api/events, and whenever the EventBus has new events formats them
+once and queues the same bytes on every stream at that point of the log.
+/api/events on the app redirects here. The thread count doesn't grow
+with the subscribers, so there is no cap on them beyond open files.
+
+A subscriber that stops reading isn't waited for: once more than
+MAX_BUFFERED bytes are queued for it its connection is dropped, and its
+EventSource reconnects with Last-Event-ID. Under gunicorn every worker
+serves the listening socket the master opened, so a stream lands on
+whichever worker accepts it.
+"""
+import selectors
+import socket
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from event_bus import RECENT_EVENTS
+
+# A comment line is sent after this many idle seconds, so proxies keep the
+# connection open and a closed client is noticed
+KEEPALIVE_SECONDS = 15
+
+# Streams end after this long; EventSource reconnects with Last-Event-ID
+STREAM_SECONDS = 10 * 60
+
+# Browser reconnect delay sent with each stream, in milliseconds
+RETRY_MS = 3000
+
+# Bytes queued for a subscriber that isn't reading before its connection is dropped
+MAX_BUFFERED = 1024 * 1024
+
+# Longest request head accepted, and seconds a new connection gets to send it
+MAX_REQUEST = 8192
+REQUEST_SECONDS = 10
+
+PATH = '/api/events'
+
+_STREAM_HEAD = (b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\n'
+                b'X-Accel-Buffering: no\r\n'  # stop nginx and similar proxies from buffering
+                b'Access-Control-Allow-Origin: *\r\n'
+                b'Connection: close\r\n\r\n')
+
+
+def listen(bind):
+    """A listening socket for host:port (BIND syntax) to hand to EventServer"""
+    host, port = bind.rsplit(':', 1)
+    host = host.strip('[]')
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    return socket.create_server((host, int(port)), family=family, backlog=128)
+
+
+class _Connection:
+    def __init__(self, sock, now):
+        self.sock = sock
+        self.request = b''
+        self.out = bytearray()
+        self.cursor = None      # last event id queued, once the GET is answered with a stream
+        self.deadline = now + REQUEST_SECONDS
+        self.last_write = now
+        self.writing = False    # registered for EVENT_WRITE
+        self.closing = False    # an error response: close once it's sent
+
+
+class EventServer:
+    def __init__(self, bus, listener):
+        """bus is the process's EventBus; listener a socket from listen()"""
+        self.bus = bus
+        self.listener = listener
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._connections = {}  # socket -> _Connection
+        self._streams = 0
+        self._thread = None
+        self._closed = False
+        self.accepted = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._thread:
+            return
+        self.listener.setblocking(False)
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self.listener, selectors.EVENT_READ)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self.bus.listen(self.wake)
+        self._thread = threading.Thread(target=self._serve, name='event-server', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Have the thread queue new events (called by the EventBus tail thread)"""
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass  # the socket buffer is full, so a wake-up is pending anyway; or closed
+
+    def close(self, timeout=1):
+        """End every stream and stop accepting; the listening socket is left open for its owner"""
+        self._closed = True
+        self.wake()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'streams': self._streams,
+            'accepted': self.accepted,
+            'dropped': self.dropped,
+        }
+
+    def _serve(self):
+        last_tick = time.monotonic()
+        try:
+            while not self._closed:
+                woken = False
+                for key, mask in self._selector.select(1):
+                    now = time.monotonic()
+                    if key.fileobj is self.listener:
+                        self._accept(now)
+                    elif key.fileobj is self._wake_r:
+                        self._drain_wake()
+                        woken = True
+                    else:
+                        conn = self._connections.get(key.fileobj)
+                        if conn and mask & selectors.EVENT_READ:
+                            self._read(conn, now)
+                        if conn and mask & selectors.EVENT_WRITE and conn.sock in self._connections:
+                            self._flush(conn)
+                if woken and not self._closed:
+                    self._fan_out()
+                now = time.monotonic()
+                if now - last_tick >= 1:
+                    self._tick(now)
+                    last_tick = now
+        finally:
+            for conn in list(self._connections.values()):
+                self._drop(conn)
+            self._selector.unregister(self.listener)
+            self._selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def _accept(self, now):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return  # backlog empty, or another worker took the connection
+            except OSError:
+                return  # out of file descriptors; the connection waits in the backlog
+            sock.setblocking(False)
+            self._connections[sock] = _Connection(sock, now)
+            self._selector.register(sock, selectors.EVENT_READ)
+            self.accepted += 1
+
+    def _read(self, conn, now):
+        try:
+            data = conn.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(conn)
+        elif conn.cursor is None and not conn.closing:
+            conn.request += data
+            if b'\r\n\r\n' in conn.request:
+                self._answer(conn, now)
+            elif len(conn.request) > MAX_REQUEST:
+                self._respond(conn, '431 Request Header Fields Too Large')
+        # Anything a subscriber sends after its request is ignored
+
+    def _answer(self, conn, now):
+        lines = conn.request.split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')
+        parts = lines[0].split()
+        if len(parts) != 3:
+            return self._respond(conn, '400 Bad Request')
+        method, target, _ = parts
+        url = urlsplit(target)
+        if url.path != PATH:
+            return self._respond(conn, '404 Not Found')
+        if method != 'GET':
+            return self._respond(conn, '405 Method Not Allowed')
+
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        # ?last_event_id= for clients that can't set the header
+        last_event_id = headers.get('last-event-id') or parse_qs(url.query).get('last_event_id', [None])[0]
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+        try:
+            cursor, reset = self.bus.subscribe(last_event_id)
+        except Exception:
+            return self._respond(conn, '503 Service Unavailable')
+
+        conn.request = b''
+        conn.cursor = cursor
+        conn.deadline = now + STREAM_SECONDS
+        self._streams += 1
+        self.bus.subscribers = self._streams
+        self._send(conn, _STREAM_HEAD + f'retry: {RETRY_MS}\n\n'.encode('ascii')
+                   + (b'event: reset\ndata: {}\n\n' if reset else b''))
+        if conn.sock in self._connections:
+            # Events a reconnecting client missed, and any that came in while it subscribed
+            self._queue_events([conn])
+
+    def _fan_out(self):
+        self._queue_events([conn for conn in self._connections.values() if conn.cursor is not None])
+
+    def _queue_events(self, streams):
+        """Queue the events past each stream's cursor, read and formatted once per cursor"""
+        batches = {}
+        for conn in streams:
+            if conn.cursor not in batches:
+                events = self.bus.after(conn.cursor)
+                text = ''.join(f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+                               for event_id, event_type, data in events)
+                batches[conn.cursor] = (events[-1][0] if events else conn.cursor, text.encode('utf-8'),
+                                        len(events))
+            cursor, data, count = batches[conn.cursor]
+            if data:
+                conn.cursor = cursor
+                self._send(conn, data)
+        # A stream far behind gets the rest of its backlog on the next pass
+        if any(count >= RECENT_EVENTS for _, _, count in batches.values()):
+            self.wake()
+
+    def _tick(self, now):
+        for conn in list(self._connections.values()):
+            if now >= conn.deadline:
+                self._drop(conn)  # a stream's EventSource reconnects with Last-Event-ID
+            elif conn.cursor is not None and now - conn.last_write >= KEEPALIVE_SECONDS:
+                self._send(conn, b': keepalive\n\n')
+
+    def _respond(self, conn, status):
+        body = status.encode('ascii')
+        conn.closing = True
+        self._send(conn, f'HTTP/1.1 {status}\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n'
+                   f'Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n'.encode('ascii') + body)
+
+    def _send(self, conn, data):
+        conn.out += data
+        conn.last_write = time.monotonic()
+        self._flush(conn)
+        if conn.sock in self._connections and len(conn.out) > MAX_BUFFERED:
+            self.dropped += 1
+            self._drop(conn)
+
+    def _flush(self, conn):
+        try:
+            del conn.out[:conn.sock.send(conn.out)]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            return self._drop(conn)
+        if conn.closing and not conn.out:
+            return self._drop(conn)
+        if conn.writing != bool(conn.out):
+            conn.writing = bool(conn.out)
+            self._selector.modify(conn.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.writing else 0))
+
+    def _drop(self, conn):
+        if self._connections.pop(conn.sock, None) is None:
+            return
+        self._selector.unregister(conn.sock)
+        conn.sock.close()
+        if conn.cursor is not None:
+            self._streams -= 1
+            self.bus.subscribers = self._streams
@@ -0,0 +1,97 @@
+"""gunicorn settings for the production server on Linux/macOS.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+BIND, WORKERS, THREADS and GRACEFUL_TIMEOUT come from server.py, so the
+PACKAGES_* environment variables and the PACKAGES_CONFIG file apply here
+too (see settings.py). BIND defaults to 127.0.0.1; listening on the
+network has to be set explicitly.
+
+The master imports the app, runs the database migrations once and opens
+the EVENTS_BIND socket, then forks WORKERS processes with THREADS request
+threads each. Every worker also serves /api/events streams from that
+socket on one thread of its own (see event_server.py), so open
+dashboards hold none of the request threads. The workers never load
+PaddleOCR: OCR_SERVICE is switched on, so scans and calls are
+queued in the database and one ocr_service.py process, started and
+stopped with the master, runs the model, the OCR jobs and the calls for
+all of them. A model per worker would cost WORKERS times the memory, and
+loading it once before forking isn't an option because Paddle's native
+threads don't survive a fork (see ocr_pool.py).
+
+On SIGTERM (or a graceful restart with SIGHUP) each worker stops
+accepting, ends its /api/events streams at once so the browsers reconnect
+to a live worker, and gets GRACEFUL_TIMEOUT seconds to finish the
+requests in flight.
+
+/metrics adds up the counts of every worker and the OCR service through
+files in METRICS_DIR (a fresh temporary directory unless set).
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metrics  # noqa: E402
+import server  # noqa: E402
+from event_server import listen as listen_for_events  # noqa: E402
+
+server.OCR_SERVICE = True
+
+# One metrics directory for the workers and the OCR service, so /metrics covers them all
+if not server.METRICS_DIR:
+    server.METRICS_DIR = os.environ['PACKAGES_METRICS_DIR'] = tempfile.mkdtemp(prefix='packages-metrics-')
+
+bind = server.BIND
+workers = server.WORKERS
+worker_class = 'gthread'
+threads = server.THREADS
+graceful_timeout = server.GRACEFUL_TIMEOUT
+preload_app = True
+
+_ocr_service = None
+_event_listener = None
+
+
+def on_starting(arbiter):
+    global _event_listener
+    metrics.clear(server.METRICS_DIR)
+    metrics.REGISTRY.configure(server.METRICS_DIR)
+    server.init_db()
+    # Workers open their own connections after the fork
+    server.get_pool().close_all()
+    # One event stream socket, which every worker inherits and accepts on
+    _event_listener = listen_for_events(server.EVENTS_BIND)
+
+
+def when_ready(arbiter):
+    global _ocr_service
+    _ocr_service = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr_service.py')])
+
+
+def post_worker_init(worker):
+    server.start_event_server(_event_listener)
+
+    # gunicorn's own handler only stops the accept loop; open event streams would
+    # otherwise hold the worker for the whole graceful timeout
+    def handle_exit(signum, frame):
+        server.close_event_streams()
+        worker.handle_exit(signum, frame)
+    signal.signal(signal.SIGTERM, handle_exit)
+
+
+def worker_exit(arbiter, worker):
+    server.shutdown()
+
+
+def on_exit(arbiter):
+    if _ocr_service is not None:
+        _ocr_service.terminate()
+        try:
+            _ocr_service.wait(server.GRACEFUL_TIMEOUT + 5)
+        except subprocess.TimeoutExpired:
+            _ocr_service.kill()
@@ -0,0 +1,92 @@
+"""Background re-encoding of uploaded label photos and signatures.
+
+Saving a package stores its images as the browser sent them, so the
+counter doesn't wait on OpenCV. A worker thread then re-encodes each new
+blob (see image_pipeline.py), stores the result under its own hash with
+BlobStore.supersede, points the packages and pickups showing the upload
+at it in one transaction, removes the upload and makes the list-view
+thumbnail. Served blobs never change, so browsers can cache them forever.
+
+Jobs are held in memory. Any still queued when the server stops past the
+shutdown timeout leave their images as sent, which are served as before.
+"""
+import queue
+import threading
+import time
+
+
+class ImageJobQueue:
+    def __init__(self, process, workers=1):
+        """process(blob_hash, kind) re-encodes one stored image; kind is 'label' or 'signature'"""
+        self.process = process
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._pending = set()  # hashes queued or being re-encoded
+        self._changed = threading.Condition()
+        self._threads = []
+        self._done = 0
+        self._failed = 0
+        self._run_seconds = 0.0
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'image-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, blob_hash, kind):
+        """Queue a blob for re-encoding, unless it already is"""
+        with self._changed:
+            if blob_hash in self._pending:
+                return
+            self._pending.add(blob_hash)
+        self._queue.put((blob_hash, kind))
+
+    def wait(self, timeout=None):
+        """Block until every queued image is re-encoded; False if some are left after timeout"""
+        with self._changed:
+            return self._changed.wait_for(lambda: not self._pending, timeout)
+
+    def stop(self, timeout=None):
+        """Re-encode the images already queued, then stop the workers; False if some are still left"""
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()) if deadline is not None else None)
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def stats(self):
+        with self._changed:
+            return {
+                'queue_depth': len(self._pending),
+                'done': self._done,
+                'failed': self._failed,
+                'workers': self.workers,
+                'avg_run_seconds': round(self._run_seconds / self._done, 3) if self._done else 0,
+            }
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            blob_hash, kind = job
+            start = time.perf_counter()
+            try:
+                self.process(blob_hash, kind)
+                failed = False
+            except Exception:
+                failed = True  # the image stays as sent
+
+            with self._changed:
+                self._pending.discard(blob_hash)
+                if failed:
+                    self._failed += 1
+                else:
+                    self._done += 1
+                    self._run_seconds += time.perf_counter() - start
+                self._changed.notify_all()
@@ -0,0 +1,109 @@
+"""Re-encoding of uploaded label photos and signatures, and thumbnails for list views.
+
+The browser posts full-size phone photos and signature canvases as PNG or
+JPEG data URLs. They're stored as sent, then re-encoded in the background
+(see image_jobs.py): labels are downsampled to label_max_side and
+re-encoded as WebP (or JPEG), and signatures are flattened onto white,
+cropped to the ink and stored as 1-bit PNGs. List
+views show thumbnail() copies, which the blob store keeps next to the
+full image the first time they're asked for (see BlobStore.derived), so
+full images are only downloaded when one is opened.
+
+Anything OpenCV can't decode is kept as sent, as is a re-encoding that
+would come out larger than the upload.
+"""
+import cv2
+import numpy as np
+
+DEFAULT_OPTIONS = {
+    'compress': True,           # False keeps uploads as sent (thumbnails are still made)
+    'label_max_side': 1600,     # longest side of a stored label in pixels; 0 keeps the size
+    'label_format': 'webp',     # 'webp' or 'jpeg'
+    'label_quality': 80,
+    'signature_threshold': 160,  # gray level below which a signature pixel counts as ink
+    'signature_margin': 8,      # pixels kept around the ink
+    'thumbnail_side': 240,
+    'thumbnail_quality': 70,
+}
+
+_ENCODINGS = {
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+}
+
+
+def decode(data):
+    """Image array (alpha kept), or None if data isn't an image OpenCV reads"""
+    if not data:
+        return None
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is not None and img.dtype == np.uint16:
+        img = (img >> 8).astype(np.uint8)
+    return img
+
+
+def on_white(img):
+    """3-channel BGR copy of img, with any transparency composited onto white"""
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        alpha = img[:, :, 3:4].astype(np.float32) / 255
+        return (img[:, :, :3] * alpha + 255 * (1 - alpha)).astype(np.uint8)
+    return img
+
+
+def downsample(img, max_side):
+    height, width = img.shape[:2]
+    scale = max_side / max(height, width)
+    if not max_side or scale >= 1:
+        return img
+    return cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def encode(img, image_format, quality):
+    extension, quality_flag = _ENCODINGS[image_format]
+    ok, buffer = cv2.imencode(extension, img, [quality_flag, int(quality)])
+    if not ok:
+        raise ValueError(f'OpenCV could not encode {image_format}')
+    return buffer.tobytes()
+
+
+def compress_label(data, options=None):
+    """Label photo bytes downsampled and re-encoded as label_format"""
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    img = decode(data) if options['compress'] else None
+    if img is None:
+        return data
+    compressed = encode(downsample(on_white(img), options['label_max_side']),
+                        options['label_format'], options['label_quality'])
+    return compressed if len(compressed) < len(data) else data
+
+
+def compress_signature(data, options=None):
+    """Signature bytes as a 1-bit PNG of the ink on white, cropped to the ink"""
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    img = decode(data) if options['compress'] else None
+    if img is None:
+        return data
+    ink = cv2.cvtColor(on_white(img), cv2.COLOR_BGR2GRAY) < options['signature_threshold']
+    rows, columns = np.nonzero(ink)
+    if len(rows):
+        margin = options['signature_margin']
+        ink = ink[max(0, rows.min() - margin):rows.max() + margin + 1,
+                  max(0, columns.min() - margin):columns.max() + margin + 1]
+    bilevel = np.where(ink, 0, 255).astype(np.uint8)
+    ok, buffer = cv2.imencode('.png', bilevel, [cv2.IMWRITE_PNG_BILEVEL, 1, cv2.IMWRITE_PNG_COMPRESSION, 9])
+    if not ok or len(buffer) >= len(data):
+        return data
+    return buffer.tobytes()
+
+
+def thumbnail(data, options=None):
+    """A small label_format copy of an image for list views, or None if data isn't an image"""
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    img = decode(data)
+    if img is None:
+        return None
+    return encode(downsample(on_white(img), options['thumbnail_side']),
+                  options['label_format'], options['thumbnail_quality'])
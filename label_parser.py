@@ -0,0 +1,349 @@
+"""Shipping label parser with per-courier rules.
+
+Works on PaddleOCR's recognised lines and their boxes rather than one
+joined string. The recipient is the block under "SHIP TO" / "TO / À" rather
+than whatever text comes first. A tracking number must match one of the
+detected courier's formats and, where the courier publishes one, its check
+digit. Phone numbers and account numbers on the label can't be picked up as
+tracking numbers.
+
+Every pattern is compiled once at import, each courier's tracking formats
+of one length as a single pattern. The label's lines, joined into one
+text, are read in a single regex scan: at each line start it matches the
+heading, street address or name the line starts with, and whether the
+line has six digits or more (the only lines a phone or tracking number
+can be on); everywhere else courier keywords, postal codes and
+"TRACKING #" labels. Only those digit lines are looked at again, for
+phone and tracking numbers.
+"""
+import re
+from collections import namedtuple
+from operator import mul
+
+OCRLine = namedtuple('OCRLine', 'text left top right bottom confidence')
+
+Courier = namedtuple('Courier', 'name keywords tracking')
+TrackingFormat = namedtuple('TrackingFormat', 'pattern lengths check')
+
+
+def _words(words):
+    """Regex for any of words as whole words, but for the \\b in front (see _SCAN)"""
+    return r'(?:%s)\b' % '|'.join(w.replace(' ', r'[^\S\n]*') for w in words)
+
+
+# The check digit sums below run in map() rather than a Python loop per digit
+
+_UPS_LETTER_VALUES = str.maketrans({c: str((ord(c) - 63) % 10) for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'})
+
+
+def _ups_check(number):
+    """1Z + 15 characters + check digit; letters count as (ord - 63) % 10"""
+    values = number[2:-1].translate(_UPS_LETTER_VALUES)
+    total = sum(map(int, values[0::2])) + 2 * sum(map(int, values[1::2]))
+    return (10 - total % 10) % 10 == int(number[-1])
+
+
+def _fedex_express_check(number):
+    """12 digits; weights 3,1,7 repeating, sum mod 11 (10 counts as 0)"""
+    total = sum(map(mul, map(int, number[:-1]), (3, 1, 7) * 4))
+    return total % 11 % 10 == int(number[-1])
+
+
+def _fedex_ground_check(number):
+    """15 digits; mod 10 with every second digit weighted 3"""
+    total = sum(map(int, number[:-1:2])) + 3 * sum(map(int, number[1:-1:2]))
+    return (10 - total % 10) % 10 == int(number[-1])
+
+
+def _s10_check(number):
+    """UPU S10 international numbers (RA123456785CA): weights 8,6,4,2,3,5,9,7 mod 11"""
+    total = sum(map(mul, map(int, number[2:10]), (8, 6, 4, 2, 3, 5, 9, 7)))
+    check = 11 - total % 11
+    return {10: 0, 11: 5}.get(check, check) == int(number[10])
+
+
+# Order matters only when a label mentions two couriers: the first keyword found wins
+COURIERS = [
+    Courier('Purolator', ('PUROLATOR',), [
+        TrackingFormat(re.compile(r'\d{12}'), [12], None),
+        TrackingFormat(re.compile(r'[A-Z]{3}\d{9}'), [12], None),
+    ]),
+    Courier('FedEx', ('FEDEX', 'FED EX'), [
+        TrackingFormat(re.compile(r'\d{12}'), [12], _fedex_express_check),
+        TrackingFormat(re.compile(r'\d{15}'), [15], _fedex_ground_check),
+        TrackingFormat(re.compile(r'96\d{20}'), [22], None),
+    ]),
+    Courier('UPS', ('UPS', 'UNITED PARCEL'), [
+        TrackingFormat(re.compile(r'1Z[0-9A-Z]{15}\d'), [18], _ups_check),
+    ]),
+    Courier('Canada Post', ('CANADA POST', 'POSTES CANADA'), [
+        TrackingFormat(re.compile(r'\d{16}'), [16], None),
+        TrackingFormat(re.compile(r'[A-Z]{2}\d{9}CA'), [13], _s10_check),
+    ]),
+    # No published format: any 10-20 character id with at least six digits, on Dragonfly labels only
+    Courier('Dragonfly', ('DRAGONFLY',), [
+        TrackingFormat(re.compile(r'(?=(?:[A-Z]*\d){6})[A-Z0-9]+'), range(10, 21), None),
+    ]),
+]
+
+
+def _format_table(formats):
+    """{length: [(courier name, pattern, check by group name)]} for (courier name, format) pairs,
+    each courier's formats of one length joined into one pattern with a named group per format"""
+    by_length = {}
+    for i, (courier, fmt) in enumerate(formats):
+        for length in fmt.lengths:
+            by_length.setdefault(length, {}).setdefault(courier, []).append((f'f{i}', fmt))
+    return {length: [(courier, re.compile('|'.join(f'(?P<{group}>{fmt.pattern.pattern})' for group, fmt in grouped)),
+                      {group: fmt.check for group, fmt in grouped})
+                     for courier, grouped in by_courier.items()]
+            for length, by_courier in by_length.items()}
+
+
+# The formats worth trying once the label's courier is known (None: no courier keyword):
+# its own, and other couriers' formats with a check digit, since an unchecked number of
+# another courier never wins (see _tracking_score). Most labels skip Dragonfly's catch-all.
+_ALL_FORMATS = [(courier.name, fmt) for courier in COURIERS for fmt in courier.tracking]
+_FORMATS_FOR_COURIER = {None: _format_table(_ALL_FORMATS)}
+for _courier in COURIERS:
+    _FORMATS_FOR_COURIER[_courier.name] = _format_table(
+        [(name, fmt) for name, fmt in _ALL_FORMATS if name == _courier.name or fmt.check])
+
+# The first courier keyword on the label names its courier
+_COURIER_KEYWORDS = _words([word for courier in COURIERS for word in courier.keywords])
+_COURIER_BY_KEYWORD = {word.replace(' ', ''): courier.name for courier in COURIERS for word in courier.keywords}
+
+# A tracking number printed in groups ("1Z 999 AA1 01 2345 678 4") spans at most this many
+_MAX_GROUPS = 8
+
+_TOKEN = re.compile(r'[A-Z0-9]+')
+_SEGMENT_BREAK = re.compile(r'[^A-Z0-9 -]|  +|\|')
+
+# Letters OCR reads in place of digits, for numbers that are mostly digits
+_DIGIT_FIXES = str.maketrans('OQDIL|SB', '00011158')
+_UPS_PREFIX = re.compile(r'^[IL|]Z')
+_NO_DIGITS = str.maketrans('', '', '0123456789')
+
+_PHONE = re.compile(r'(?<![\dA-Z])(?:\+?1[-. ]?)?\(?(\d{3})\)?[-. ]?(\d{3})[-. ]?(\d{4})(?![\dA-Z])')
+# Without the \b in front, as in _words()
+_POSTAL = r'[A-Z][0-9OIL][A-Z] ?[0-9OIL][A-Z][0-9OIL]\b'
+_POSTAL_ANY_CASE = re.compile(r'\b' + _POSTAL, re.IGNORECASE)
+_POSTAL_FIXES = str.maketrans('OIL', '011')
+
+# "SHIP TO:" / "TO / À" style headings that start the recipient ('to') or sender ('from') block
+_HEADING = (r'[^\S\n]*(?:'
+            r'(?P<to>SHIP[^\S\n]*TO|DELIVER(?:Y)?[^\S\n]*TO|TO|DESTINATAIRE|RECIPIENT|CONSIGNEE)\b'
+            r'(?:[^\S\n]*/[^\S\n]*(?:À|A|DESTINATAIRE)\b)?'
+            r'|(?P<from>SHIP[^\S\n]*FROM|FROM|SENDER|SHIPPER|EXP[ÉE]DITEUR)\b'
+            r'(?:[^\S\n]*/[^\S\n]*(?:DE|EXP[ÉE]DITEUR)\b)?'
+            r')[^\S\n]*:?[^\S\n]*')
+_TRACKING_LABEL = _words(['TRACKING', 'TRACK', 'TRK', 'PIN', 'AWB', 'WAYBILL'])
+
+_NAME = r"[^\W\d_](?:[^\W\d_]|['.-])*(?: [^\W\d_](?:[^\W\d_]|['.-])*){1,4}"
+_NOT_NAME = re.compile(r'\b' + _words([
+    'TRACKING', 'TRK', 'PIN', 'REF', 'DELIVERY', 'SHIP', 'FROM', 'WEIGHT', 'KG', 'LB', 'LBS',
+    'EXPRESS', 'GROUND', 'PRIORITY', 'EXPEDITED', 'REGULAR', 'STANDARD', 'OVERNIGHT', 'SIGNATURE',
+    'PACKAGE', 'PIECE', 'PIECES', 'DATE', 'ACCOUNT', 'INVOICE', 'BILL', 'SERVICE', 'ROUTE',
+    'PUROLATOR', 'FEDEX', 'UPS', 'CANADA POST', 'POSTES CANADA', 'DRAGONFLY', 'ONTARIO']))
+_STREET = r'[^\S\n]*(?:\d+[A-Z]?(?:-\d+)?[^\S\n]+[A-Z0-9]|P\.?[^\S\n]*O\.?[^\S\n]*BOX\b|RR[^\S\n]*\d)'
+
+# The scan of a label's upper-cased text, "\n" + its lines joined by "\n". A match at a
+# "\n" is the start of the next line: its heading if it has one, the street address or
+# name that follows and whether the line has six digits or more; only the heading is
+# consumed, so the rest of the line is still scanned. Anywhere else a match is a courier
+# keyword, a postal code or a "TRACKING #" label, all of which start a word with a letter:
+# one \b and one look at that letter rule out most positions for all three at once.
+_SCAN_PATTERN = (r'\n(?=(?P<digits>(?:[^\d\n]*+\d){6}))?(?:%s)?'
+                 r'(?:(?=(?P<street>%s[^\n]*+))|(?=(?P<name>%s)(?:\n|$)))?'
+                 r'|\b(?=[A-Z])(?:(?P<courier>%s)|(?P<postal>%s)|(?P<label>%s))'
+                 % (_HEADING, _STREET, _NAME, _COURIER_KEYWORDS, _POSTAL, _TRACKING_LABEL))
+_SCAN = re.compile(_SCAN_PATTERN)
+# For the rare text whose length upper-casing changes ("ß" becomes "SS")
+_SCAN_ANY_CASE = re.compile(_SCAN_PATTERN, re.IGNORECASE)
+
+
+def lines_from_ocr(result):
+    """PaddleOCR ocr() output as OCRLines in reading order"""
+    lines = []
+    if result and result[0]:
+        for box, (text, confidence) in result[0]:
+            text = text.strip()
+            if text:
+                xs = [p[0] for p in box]
+                ys = [p[1] for p in box]
+                lines.append(OCRLine(text, min(xs), min(ys), max(xs), max(ys), confidence))
+    return reading_order(lines)
+
+
+def lines_from_text(text):
+    """Plain text, one label line per text line, as OCRLines stacked top to bottom"""
+    lines = [line.strip() for line in text.split('\n')]
+    return [OCRLine(line, 0, i, len(line), i + 1, 1.0) for i, line in enumerate(lines) if line]
+
+
+def reading_order(lines):
+    """Rows top to bottom, left to right within a row; a line joins a row its middle falls in"""
+    rows = []
+    for line in sorted(lines, key=lambda l: l.top + l.bottom):
+        middle = (line.top + line.bottom) / 2
+        if rows and abs(middle - rows[-1][0]) <= (line.bottom - line.top) / 2:
+            rows[-1][1].append(line)
+        else:
+            rows.append((middle, [line]))
+    return [line for _, row in rows for line in sorted(row, key=lambda l: l.left)]
+
+
+def _role(line, anchors):
+    """'to' or 'from' for a line under a SHIP TO / FROM heading, else None.
+
+    The heading is the nearest row of headings above the line and, within
+    that row, the rightmost one starting left of the line, so two-column
+    labels with FROM and TO side by side split correctly. `anchors` are in
+    reading order.
+    """
+    height = line.bottom - line.top
+    best = None
+    for anchor, role in anchors:
+        if anchor.top > line.top + height / 2 or anchor.left > line.left + 2 * height:
+            continue
+        if (best is None or anchor.top > best[0].top + height
+                or (anchor.top >= best[0].top - height and anchor.left > best[0].left)):
+            best = (anchor, role)
+    return best[1] if best else None
+
+
+def _tracking_candidates(lines, formats):
+    """(line index, number, courier, checksum_ok) for every one of formats a span of a line fits.
+
+    lines are (index, upper-cased text, (start, end) of each of its phone
+    numbers), as a phone number can't be part of a tracking number. A span
+    is one or more space-separated groups, tried as read plus, when it's
+    mostly digits, with OCR letter-for-digit fixes.
+    """
+    min_length, max_length = min(formats), max(formats)
+    segments = []
+    for index, upper, phones in lines:
+        for start, end in reversed(phones):
+            upper = upper[:start] + '|' + upper[end:]
+        # Dates, times and the like: too short for any number, spaces included
+        segments += [(index, segment) for segment in _SEGMENT_BREAK.split(upper) if len(segment) >= min_length]
+    for index, segment in segments:
+        tokens = _TOKEN.findall(segment)
+        for i, first in enumerate(tokens):
+            # Groups start with a digit, except the two-letter prefix of an S10 number
+            if first.isalpha() and (len(first) > 2 or i + 1 == len(tokens) or not tokens[i + 1][0].isdigit()):
+                continue
+            compact = ''
+            for token in tokens[i:i + _MAX_GROUPS]:
+                compact += token
+                if len(compact) > max_length:
+                    break
+                if len(compact) not in formats:
+                    continue
+                numbers = [compact]
+                if _UPS_PREFIX.match(first):
+                    numbers.append('1Z' + compact[2:])
+                elif not compact.isdigit() and len(compact.translate(_NO_DIGITS)) <= 0.25 * len(compact):
+                    fixed = compact.translate(_DIGIT_FIXES)
+                    if fixed != compact:
+                        numbers.append(fixed)
+                for number in numbers:
+                    for courier, pattern, checks in formats[len(number)]:
+                        m = pattern.fullmatch(number)
+                        if m:
+                            check = checks[m.lastgroup]
+                            checked = check(number) if check else None
+                            if checked is not False:
+                                yield index, number, courier, checked
+
+
+def _tracking_score(courier, checked, label_courier, near_label):
+    """Higher is better; None if this courier's format can't be the label's tracking number"""
+    if courier == label_courier:
+        score = 6 if checked else 4
+    elif checked:
+        score = 3 if label_courier is None else 1
+    elif label_courier is None and near_label:
+        score = 0  # unknown courier: take an unchecked number only if it's labelled as one
+    else:
+        return None
+    return score + near_label
+
+
+def _postal(code):
+    """Postal code from a _POSTAL match, with O/I/L in the digit positions read as digits"""
+    code = code.upper().replace(' ', '')
+    digits = code[1::2].translate(_POSTAL_FIXES)
+    return f'{code[0]}{digits[0]}{code[2]} {digits[1]}{code[4]}{digits[2]}'
+
+
+def _pick(values):
+    """First value from the recipient block, else from outside any sender block, else any"""
+    for wanted in ('to', None, 'from'):
+        for value, role in values:
+            if role == wanted:
+                return value
+    return ''
+
+
+def parse_label(lines):
+    """Courier, name, tracking, phone, postal and address from a label's OCRLines"""
+    anchors = []  # (line, 'to' | 'from') for the headings scanned so far
+    names, streets, phones, postals = [], [], [], []
+    label_courier = None
+    labelled = set()  # indexes of lines with a "TRACKING #" label
+    digit_lines = []  # (index, upper-cased text, phone spans)
+
+    text = '\n' + '\n'.join([line.text for line in lines])
+    upper = text.upper()
+    scan = _SCAN
+    if len(upper) != len(text):
+        upper, scan = text, _SCAN_ANY_CASE
+    i = -1
+    for m in scan.finditer(upper):
+        kind = m.lastgroup
+        if kind == 'courier':
+            if label_courier is None:
+                label_courier = _COURIER_BY_KEYWORD[''.join(m.group().upper().split())]
+        elif kind == 'postal':
+            if not name_line:
+                postals.append((_postal(m.group()), _role(line, anchors)))
+        elif kind == 'label':
+            labelled.add(i)
+        else:
+            i += 1
+            line = lines[i]
+            name_line = False
+            to, sender, street, name, digits = m.group('to', 'from', 'street', 'name', 'digits')
+            if to or sender:
+                anchors.append((line, 'to' if to else 'from'))
+            if street:
+                streets.append((_POSTAL_ANY_CASE.sub('', text[m.start('street'):m.end('street')]).strip(' ,'),
+                                _role(line, anchors)))
+            elif name and not _NOT_NAME.search(name.upper()):
+                names.append((text[m.start('name'):m.end('name')], _role(line, anchors)))
+                name_line = True  # a postal code can't be part of a name
+            if digits:
+                digits = line.text.upper()
+                phone_matches = list(_PHONE.finditer(digits))
+                for phone in phone_matches:
+                    phones.append((f'{phone.group(1)}-{phone.group(2)}-{phone.group(3)}', _role(line, anchors)))
+                digit_lines.append((i, digits, [phone.span() for phone in phone_matches]))
+
+    # A tracking number sits on its "TRACKING #" / "PIN" line or the one after it. Scored
+    # once the courier is known, since its logo can come after its tracking number, and
+    # with only the formats worth trying for it
+    best = None
+    for i, number, courier, checked in _tracking_candidates(digit_lines, _FORMATS_FOR_COURIER[label_courier]):
+        score = _tracking_score(courier, checked, label_courier, i in labelled or i - 1 in labelled)
+        if score is not None and (best is None or score > best[0]):
+            best = (score, number, courier if checked else None)
+
+    return {
+        'courier': label_courier or (best[2] if best else None) or '',
+        'name': _pick(names),
+        'tracking': best[1] if best else '',
+        'phone': _pick(phones),
+        'postal': _pick(postals),
+        'address': _pick(streets),
+    }
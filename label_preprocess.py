@@ -0,0 +1,111 @@
+"""Image pre-processing applied to label photos before OCR.
+
+Phone cameras send 12MP images, and most of that is cardboard around the
+label. Each step here can be switched on or off, and each step's time is
+recorded so configurations can be compared (see
+benchmarks/preprocess_accuracy.py).
+"""
+import time
+
+import cv2
+
+DEFAULT_OPTIONS = {
+    'max_side': 1600,   # longest side in pixels after downsampling; 0 disables
+    'crop': True,       # crop to the label (largest bright region)
+    'deskew': True,     # straighten small rotations of the text
+    'grayscale': False,
+}
+
+# A crop is only applied when the detected label covers at least this much of the frame
+MIN_LABEL_AREA = 0.15
+
+# Margin kept around the detected label, as a fraction of its size
+CROP_MARGIN = 0.03
+
+# Skews smaller than this are left alone; larger than MAX_SKEW are assumed to be misdetections
+MIN_SKEW = 0.5
+MAX_SKEW = 20
+
+
+def preprocess_image(img, options=None):
+    """Run the enabled steps; returns (image, {step: milliseconds})"""
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    timings = {}
+
+    steps = [
+        ('downsample', options['max_side'], lambda im: downsample(im, options['max_side'])),
+        ('crop', options['crop'], crop_label),
+        ('deskew', options['deskew'], deskew),
+        ('grayscale', options['grayscale'], to_grayscale),
+    ]
+    for name, enabled, step in steps:
+        if not enabled:
+            continue
+        start = time.perf_counter()
+        img = step(img)
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    return img, timings
+
+
+def downsample(img, max_side):
+    height, width = img.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def crop_label(img):
+    """Crop to the largest bright rectangle-ish region (a white label on a box)"""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Close the gaps left by dark text so the label becomes one blob
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (25, 25))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return img
+
+    height, width = img.shape[:2]
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    if w * h < MIN_LABEL_AREA * width * height or w * h >= 0.98 * width * height:
+        return img
+
+    mx, my = int(w * CROP_MARGIN), int(h * CROP_MARGIN)
+    return img[max(0, y - my):min(height, y + h + my), max(0, x - mx):min(width, x + w + mx)]
+
+
+def deskew(img):
+    """Rotate so text lines are horizontal, based on the min-area box around dark pixels"""
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+    # Smear characters into text lines so the box follows their direction
+    mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3)))
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return img
+
+    _, (w, h), angle = cv2.minAreaRect(points)
+    # OpenCV's angle convention varies between versions; normalise to (-45, 45) along the long side
+    if w < h:
+        angle += 90
+    angle = (angle + 45) % 90 - 45
+    if abs(angle) < MIN_SKEW or abs(angle) > MAX_SKEW:
+        return img
+
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+def to_grayscale(img):
+    if img.ndim == 2:
+        return img
+    # PaddleOCR expects three channels, so keep the shape
+    return cv2.cvtColor(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
@@ -0,0 +1,217 @@
+"""Latency histograms for /metrics, in the Prometheus text format.
+
+Three histograms are recorded:
+
+  packages_http_request_duration_seconds{method, endpoint, status}
+      every request, from before_request to the response being returned
+      (for streamed responses that's the time to the first byte)
+  packages_stage_duration_seconds{stage}
+      image_decode, preprocess, ocr, parse_label, grandstream_call
+  packages_db_query_duration_seconds{operation, phase}
+      every query on a pooled connection: phase 'execute' is execute() /
+      executemany(), where SQLite runs the statement up to its first row
+      (nearly all of a single-row lookup); 'fetch' is fetchmany() and
+      fetchall(). fetchone() and iterating over the cursor aren't timed
+
+observe() is a bisect and a dict update under a lock, about a microsecond
+(see benchmarks/metrics_overhead.py). Each process keeps its own counts.
+With a directory configured, each process also writes them to a file
+there every FLUSH_SECONDS and render() adds up every file, so /metrics
+shows the whole server whichever gunicorn worker answers, the OCR service
+included (other processes' counts up to FLUSH_SECONDS old). Files of processes that have exited stay, so their counts
+don't go backwards; clear() empties the directory at server start.
+"""
+import atexit
+import bisect
+import json
+import os
+import secrets
+import threading
+import time
+
+# Upper bounds in seconds; one more bucket (+Inf) takes the rest
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Seconds between writes of this process's counts to the metrics directory
+FLUSH_SECONDS = 5
+
+
+class Histogram:
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> per-bucket counts (not cumulative), then the sum
+
+    def observe(self, seconds, *label_values):
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(BUCKETS) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {label_values: list(series) for label_values, series in self._series.items()}
+
+    def reset(self):
+        # Called in a freshly forked child, where the lock may have been copied while held
+        self._lock = threading.Lock()
+        self._series = {}
+
+
+class Registry:
+    def __init__(self):
+        self.enabled = True
+        self.directory = None
+        self.histograms = {}
+        self._flusher = None
+        self._file = None
+        os.register_at_fork(after_in_child=self._forked)
+        atexit.register(self.flush)
+
+    def histogram(self, name, description, labels):
+        self.histograms[name] = Histogram(name, description, labels)
+        return self.histograms[name]
+
+    def configure(self, directory):
+        """Share counts with the other processes writing to directory (None: this process only)"""
+        self.directory = directory or None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True)
+                self._flusher.start()
+
+    def flush(self):
+        """Write this process's counts to its file in the metrics directory"""
+        if not self.directory:
+            return
+        if self._file is None:
+            self._file = os.path.join(self.directory, f'{os.getpid()}-{secrets.token_hex(4)}.json')
+        data = {name: [[list(labels), series] for labels, series in histogram.snapshot().items()]
+                for name, histogram in self.histograms.items()}
+        try:
+            with open(self._file + '.tmp', 'w') as f:
+                json.dump(data, f)
+            os.replace(self._file + '.tmp', self._file)
+        except OSError:
+            pass  # the next flush tries again
+
+    def render(self):
+        """Every histogram in the Prometheus text exposition format"""
+        totals = self._collect()
+        out = []
+        for name, histogram in self.histograms.items():
+            out.append(f'# HELP {name} {histogram.description}')
+            out.append(f'# TYPE {name} histogram')
+            for label_values, series in sorted(totals[name].items()):
+                labels = ','.join(f'{label}="{_escape(value)}"' for label, value in zip(histogram.labels, label_values))
+                prefix = labels + ',' if labels else ''
+                count = 0
+                for bound, bucket_count in zip(BUCKETS + ('+Inf',), series[:-1]):
+                    count += bucket_count
+                    out.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+                out.append(f'{name}_sum{{{labels}}} {series[-1]}')
+                out.append(f'{name}_count{{{labels}}} {count}')
+        return '\n'.join(out) + '\n'
+
+    def _collect(self):
+        """Counts of every process sharing the directory (or just this one), summed per series"""
+        if not self.directory:
+            return {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+
+        self.flush()
+        totals = {name: {} for name in self.histograms}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, entries in data.items():
+                if name not in totals:
+                    continue
+                for labels, series in entries:
+                    total = totals[name].setdefault(tuple(labels), [0] * len(series))
+                    for i, value in enumerate(series):
+                        total[i] += value
+        return totals
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            self.flush()
+
+    def _forked(self):
+        # A forked child starts from zero under its own file; the parent's counts stay the parent's
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self._file = None
+        self._flusher = None
+        if self.directory:
+            self.configure(self.directory)
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.histogram('packages_http_request_duration_seconds',
+    'Time to handle an HTTP request', ('method', 'endpoint', 'status'))
+STAGES = REGISTRY.histogram('packages_stage_duration_seconds',
+    'Time spent in one stage of scanning or calling', ('stage',))
+QUERIES = REGISTRY.histogram('packages_db_query_duration_seconds',
+    'Time in SQLite per query call', ('operation', 'phase'))
+
+
+class timer:
+    """Context manager timing a block into a histogram: with timer(STAGES, 'ocr'): ..."""
+    __slots__ = ('histogram', 'label_values', 'start')
+
+    def __init__(self, histogram, *label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if REGISTRY.enabled:
+            self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+def stage(name):
+    return timer(STAGES, name)
+
+
+def summary(values):
+    """Count, mean and percentiles of sorted durations, as the job queues' stats report them"""
+    if not values:
+        return {'count': 0, 'avg': 0, 'p50': 0, 'p95': 0, 'max': 0}
+    return {
+        'count': len(values),
+        'avg': round(sum(values) / len(values), 3),
+        'p50': round(values[len(values) // 2], 3),
+        'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        'max': round(values[-1], 3),
+    }
+
+
+def clear(directory):
+    """Remove the files left by an earlier run of the server"""
+    if os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if filename.endswith(('.json', '.tmp')):
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    pass
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,92 @@
+"""One-shot migration of inline base64 images out of packages.db.
+
+Moves packages.label_image, packages.signature_image and
+pickups.pickup_signature data URLs into the blob store, replaces them with
+/api/blobs/<hash> URLs, vacuums the database and reports the size change.
+
+Usage:
+    python migrate_blobs.py [--db packages.db] [--blobs blobs]
+
+Stop the server first: VACUUM needs exclusive access to the database.
+Running it again is harmless; rows that already hold a URL are skipped.
+"""
+import argparse
+import os
+import sqlite3
+
+from blob_store import BlobStore
+
+COLUMNS = [
+    ('packages', 'label_image'),
+    ('packages', 'signature_image'),
+    ('packages_archive', 'label_image'),
+    ('packages_archive', 'signature_image'),
+    ('pickups', 'pickup_signature'),
+]
+
+BATCH_SIZE = 500
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def migrate_column(db, store, table, column):
+    """Move every data URL in table.column to the store; returns (rows, inline bytes)"""
+    rows = inline_bytes = 0
+    last_id = 0
+
+    while True:
+        batch = db.execute(f'''SELECT id, {column} FROM {table}
+            WHERE id > ? AND {column} LIKE 'data:%'
+            ORDER BY id LIMIT ?''', (last_id, BATCH_SIZE)).fetchall()
+        if not batch:
+            break
+
+        updates = []
+        for row_id, value in batch:
+            updates.append((store.store_image(value), row_id))
+            inline_bytes += len(value)
+        db.executemany(f'UPDATE {table} SET {column} = ? WHERE id = ?', updates)
+        db.commit()
+
+        rows += len(batch)
+        last_id = batch[-1][0]
+
+    return rows, inline_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move inline images out of packages.db')
+    parser.add_argument('--db', default='packages.db')
+    parser.add_argument('--blobs', default='blobs')
+    args = parser.parse_args()
+
+    store = BlobStore(args.blobs)
+    db_before = os.path.getsize(args.db)
+    blobs_before = directory_size(args.blobs)
+
+    db = sqlite3.connect(args.db)
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, column in COLUMNS:
+        if table not in tables:
+            continue
+        rows, inline_bytes = migrate_column(db, store, table, column)
+        print(f'{table}.{column}: moved {rows} images ({inline_bytes / 1e6:.1f} MB inline)')
+
+    print('Vacuuming...')
+    db.execute('VACUUM')
+    db.close()
+
+    db_after = os.path.getsize(args.db)
+    blobs_added = directory_size(args.blobs) - blobs_before
+    print(f'Database: {db_before / 1e6:.1f} MB -> {db_after / 1e6:.1f} MB '
+          f'({(1 - db_after / db_before) * 100 if db_before else 0:.0f}% smaller)')
+    print(f'Blob store: +{blobs_added / 1e6:.1f} MB (deduplicated, decoded from base64)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""Versioned schema migrations for packages.db.
+
+Each step in MIGRATIONS runs once, in order, inside its own transaction,
+and the version it brings the database to is recorded in schema_version.
+init_db() calls migrate() at startup, so upgrading is just restarting the
+server. Steps use IF NOT EXISTS so databases created before versioning
+existed upgrade cleanly. Add new steps to the end; never edit one that
+has shipped.
+"""
+from archive_tier import create_archive
+from batch_sync import create_sync_log
+from package_search import allow_deferred_indexing, create_search_index
+from package_stats import create_stats, rebuild as rebuild_stats
+
+
+def _core_tables(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS customers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        phone TEXT UNIQUE,
+        email TEXT,
+        street TEXT,
+        postal TEXT,
+        profile_locked INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS packages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        courier TEXT NOT NULL,
+        name TEXT NOT NULL,
+        tracking TEXT NOT NULL,
+        phone TEXT,
+        postal TEXT NOT NULL,
+        label_image TEXT,
+        signature_image TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        address TEXT,
+        signed_at TIMESTAMP,
+        created_by TEXT,
+        customer_id INTEGER,
+        FOREIGN KEY (customer_id) REFERENCES customers(id)
+    )''')
+
+    db.execute('''CREATE TABLE IF NOT EXISTS pickups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL,
+        pickup_name TEXT,
+        pickup_id_type TEXT,
+        pickup_id_number TEXT,
+        pickup_signature TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (customer_id) REFERENCES customers(id)
+    )''')
+
+
+def _ocr_jobs(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS ocr_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        image TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL
+    )''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_ocr_jobs_status ON ocr_jobs (status, created_at)')
+
+
+def _package_list_indexes(db):
+    # Keyset pagination for the pending/old/archived/customer package lists
+    db.execute('CREATE INDEX IF NOT EXISTS idx_packages_status_created ON packages (status, created_at, id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_packages_status_signed ON packages (status, signed_at, id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_packages_customer_status ON packages (customer_id, status, created_at, id)')
+
+
+def _lookup_indexes(db):
+    # track_package
+    db.execute('CREATE INDEX IF NOT EXISTS idx_packages_tracking ON packages (tracking)')
+    # lookup_customer_by_name / find_or_create_customer compare LOWER(name)
+    db.execute('CREATE INDEX IF NOT EXISTS idx_customers_lower_name ON customers (LOWER(name))')
+    # get_customers lists by name
+    db.execute('CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name)')
+    # get_pickups lists the newest pickups first
+    db.execute('CREATE INDEX IF NOT EXISTS idx_pickups_timestamp ON pickups (timestamp)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_pickups_customer ON pickups (customer_id)')
+
+
+def _customer_change_log(db):
+    # Read by customer_cache.CustomerIndex through change_log.py to stay coherent with writes from any process
+    db.execute('''CREATE TABLE IF NOT EXISTS customer_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL
+    )''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS customer_changes_insert AFTER INSERT ON customers BEGIN
+        INSERT INTO customer_changes (customer_id) VALUES (new.id);
+    END''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS customer_changes_update AFTER UPDATE ON customers BEGIN
+        INSERT INTO customer_changes (customer_id) VALUES (old.id);
+        INSERT INTO customer_changes (customer_id) SELECT new.id WHERE new.id != old.id;
+    END''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS customer_changes_delete AFTER DELETE ON customers BEGIN
+        INSERT INTO customer_changes (customer_id) VALUES (old.id);
+    END''')
+
+
+def _tracking_change_log(db):
+    # Read by tracking_cache.TrackingCache through change_log.py to drop lookups a write has made stale; moves
+    # between the tiers don't change what /api/track returns, so they aren't logged
+    db.execute('''CREATE TABLE IF NOT EXISTS tracking_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        tracking TEXT NOT NULL
+    )''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS tracking_changes_insert AFTER INSERT ON packages
+        WHEN NOT EXISTS (SELECT 1 FROM packages_moving) BEGIN
+        INSERT INTO tracking_changes (tracking) VALUES (new.tracking);
+    END''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS tracking_changes_update
+        AFTER UPDATE OF courier, name, tracking, status, created_at, signed_at ON packages BEGIN
+        INSERT INTO tracking_changes (tracking) VALUES (old.tracking);
+        INSERT INTO tracking_changes (tracking) SELECT new.tracking WHERE new.tracking != old.tracking;
+    END''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS tracking_changes_delete AFTER DELETE ON packages
+        WHEN NOT EXISTS (SELECT 1 FROM packages_moving) BEGIN
+        INSERT INTO tracking_changes (tracking) VALUES (old.tracking);
+    END''')
+
+
+def _backfill_signed_at(db):
+    # Packages signed through an edit, a status change or an import before those paths set
+    # signed_at had none, which the archive list's (signed_at, id) cursor skipped
+    for table in ('packages', 'packages_archive'):
+        db.execute(f'''UPDATE {table} SET signed_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+            WHERE status = 'signed' AND signed_at IS NULL''')
+    # The archive tier has no count triggers
+    rebuild_stats(db)
+
+
+def _forget_failed_sync_operations(db):
+    # Batch sync used to record failures too, so resending a failed key replayed the failure
+    db.execute('DELETE FROM sync_operations WHERE status != 200')
+
+
+def _calls(db):
+    # Notification calls queued for call_dispatcher.CallDispatcher
+    db.execute('''CREATE TABLE IF NOT EXISTS calls (
+        id TEXT PRIMARY KEY,
+        batch_id TEXT,
+        customer_id INTEGER,
+        name TEXT,
+        phone TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL
+    )''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_calls_status_next ON calls (status, next_attempt_at)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_calls_batch ON calls (batch_id, created_at)')
+
+
+def _events(db):
+    # Change log behind /api/events (see event_bus.py)
+    db.execute('''CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )''')
+
+
+def _pickup_reference(db):
+    # Packages released by a bulk pickup point at it and share its signature (see insert_pickup)
+    columns = [row[1] for row in db.execute('PRAGMA table_info(packages)')]
+    if 'pickup_id' not in columns:
+        db.execute('ALTER TABLE packages ADD COLUMN pickup_id INTEGER REFERENCES pickups(id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_packages_pickup ON packages (pickup_id)')
+    # Earlier bulk pickups copied their signature onto each package without recording which
+    # pickup released it. Those packages keep their copies and stay unlinked: matching them up
+    # by signature would join pickups that share one, or have none
+
+
+def _image_reference_indexes(db):
+    # reencode_image moves every row referring to an upload over to its re-encoding
+    db.execute('CREATE INDEX IF NOT EXISTS idx_packages_label_image ON packages (label_image)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_packages_signature_image ON packages (signature_image)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_archive_label_image ON packages_archive (label_image)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_archive_signature_image ON packages_archive (signature_image)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_pickups_signature ON pickups (pickup_signature)')
+
+
+MIGRATIONS = [
+    (1, 'core tables', _core_tables),
+    (2, 'async OCR job queue', _ocr_jobs),
+    (3, 'package list indexes', _package_list_indexes),
+    (4, 'archive full-text search', create_search_index),
+    (5, 'lookup indexes', _lookup_indexes),
+    (6, 'customer change log', _customer_change_log),
+    (7, 'call dispatch queue', _calls),
+    (8, 'deferred search indexing for bulk imports', allow_deferred_indexing),
+    (9, 'change events', _events),
+    (10, 'pickup reference on packages', _pickup_reference),
+    (11, 'dashboard counts', create_stats),
+    (12, 'archive tier for old closed packages', create_archive),
+    (13, 'tracking lookup change log', _tracking_change_log),
+    (14, 'batch sync idempotency keys', create_sync_log),
+    (15, 'signed_at for every signed package', _backfill_signed_at),
+    (16, 'batch sync keeps successes only', _forget_failed_sync_operations),
+    (17, 'image reference indexes', _image_reference_indexes),
+]
+
+
+def current_version(db):
+    row = db.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(db):
+    """Apply every pending migration; returns the list of versions applied"""
+    db.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    db.commit()
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current_version(db):
+            continue
+
+        # IMMEDIATE takes the write lock up front, so two processes starting
+        # together can't both run the same step
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= current_version(db):
+                db.rollback()
+                continue
+            step(db)
+            db.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        applied.append(version)
+
+    return applied
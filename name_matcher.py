@@ -0,0 +1,133 @@
+"""Fuzzy customer-name matching for OCR output.
+
+OCR names come back as "JOHN SMlTH" or "Smith, John". Names are
+normalised (case, accents, punctuation, digit look-alikes, word order),
+candidates are found through a trigram index, and the best few are
+scored with an edit distance where OCR look-alikes (l/i, rn/m, o/c...)
+cost less than other substitutions.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+# Digits OCR produces in place of letters inside names
+_DIGIT_LOOKALIKES = str.maketrans('012586', 'olzsbg')
+
+# Character pairs OCR commonly confuses; substituting one for the other is cheap
+CONFUSABLE_COST = 0.3
+_SUBSTITUTION_COST = {}
+for _pair in ['il', 'lt', 'oc', 'ce', 'ao', 'nm', 'uv', 'hb', 'ij', 'ft']:
+    _SUBSTITUTION_COST[_pair[0], _pair[1]] = _SUBSTITUTION_COST[_pair[1], _pair[0]] = CONFUSABLE_COST
+
+# Candidates pulled from the trigram index before edit-distance scoring
+CANDIDATES = 20
+
+# Only the rarest trigrams of a query are used to find candidates: the ones every
+# "John" shares cost the most to count and narrow the search the least
+RARE_TRIGRAM_FRACTION = 0.7
+MIN_TRIGRAMS = 10
+
+
+def normalize(name):
+    """Lower-case, accent-free words in sorted order: "Smith, JOHN" -> "john smith" """
+    name = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode()
+    name = name.lower().translate(_DIGIT_LOOKALIKES)
+    return ' '.join(sorted(re.findall(r'[a-z]+', name)))
+
+
+def trigrams(normalized):
+    grams = set()
+    for word in normalized.split():
+        padded = f' {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def distance(a, b):
+    """Levenshtein distance with cheap OCR look-alike substitutions"""
+    if len(a) < len(b):
+        a, b = b, a
+    costs = _SUBSTITUTION_COST
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        left = i
+        for j, cb in enumerate(b, 1):
+            diagonal = previous[j - 1] + (0 if ca == cb else costs.get((ca, cb), 1))
+            up = previous[j] + 1
+            left = min(up, left + 1, diagonal)
+            current.append(left)
+        previous = current
+    return previous[-1]
+
+
+def similarity(a, b):
+    """1.0 for identical normalised names, falling towards 0 as they differ"""
+    if not a or not b:
+        return 0.0
+    return max(0.0, 1 - distance(a, b) / max(len(a), len(b)))
+
+
+def confident_match(matches, threshold, margin):
+    """The top match if it clears `threshold` and beats the runner-up by `margin`, else None"""
+    if not matches or matches[0][1] < threshold:
+        return None
+    if len(matches) > 1 and matches[0][1] - matches[1][1] < margin:
+        return None
+    return matches[0]
+
+
+class NameMatcher:
+    """Trigram index of names by id; add/remove keep it in step with the customer table"""
+
+    def __init__(self):
+        self._names = {}
+        self._exact = {}
+        self._postings = {}
+
+    def add(self, item_id, name):
+        normalized = normalize(name)
+        if not normalized:
+            return
+        self._names[item_id] = normalized
+        self._exact.setdefault(normalized, set()).add(item_id)
+        for gram in trigrams(normalized):
+            self._postings.setdefault(gram, set()).add(item_id)
+
+    def remove(self, item_id):
+        normalized = self._names.pop(item_id, None)
+        if normalized is None:
+            return
+        self._exact[normalized].discard(item_id)
+        if not self._exact[normalized]:
+            del self._exact[normalized]
+        for gram in trigrams(normalized):
+            posting = self._postings.get(gram)
+            if posting:
+                posting.discard(item_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def match(self, name, limit=5):
+        """Best matches as [(id, score)], highest score first"""
+        query = normalize(name)
+        if not query:
+            return []
+
+        exact = self._exact.get(query)
+        if exact:
+            return [(item_id, 1.0) for item_id in sorted(exact)[:limit]]
+
+        postings = sorted((p for p in map(self._postings.get, trigrams(query)) if p), key=len)
+        if not postings:
+            return []
+        postings = postings[:max(MIN_TRIGRAMS, int(len(postings) * RARE_TRIGRAM_FRACTION))]
+
+        counts = Counter()
+        for posting in postings:
+            counts.update(posting)
+
+        candidates = counts.most_common(CANDIDATES)
+        scored = [(item_id, similarity(query, self._names[item_id])) for item_id, _ in candidates]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return [(item_id, round(score, 4)) for item_id, score in scored[:limit]]
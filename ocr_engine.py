@@ -0,0 +1,90 @@
+"""Managed PaddleOCR instance for the single-image scan path.
+
+Importing paddleocr and constructing PaddleOCR loads Paddle and three
+models, which takes seconds, and the first inference afterwards is slow
+again while Paddle sizes its buffers. OCREngine keeps both off import and
+off the first request: start() loads the model and runs a warm-up
+inference in a background thread, get() waits for that (starting it if
+nobody has), and status() is what /api/health reports.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class OCRNotReady(RuntimeError):
+    """The model is still loading, or failed to load"""
+
+
+def warm_up(ocr):
+    """Run one small inference so the first real label doesn't pay for Paddle's setup"""
+    img = np.full((96, 480, 3), 255, np.uint8)
+    cv2.putText(img, 'P5A 1X1 705-555-1234', (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    ocr.ocr(img, cls=True)
+
+
+class OCREngine:
+    def __init__(self, options, warm=True):
+        """options are PaddleOCR keyword arguments; warm runs warm_up() after loading"""
+        self.options = options
+        self.warm = warm
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._ocr = None
+        self._error = None
+        self._load_seconds = None
+        self._warmup_seconds = None
+
+    def start(self):
+        """Begin loading in a background thread; does nothing if already started"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name='ocr-load', daemon=True)
+                self._thread.start()
+
+    def get(self, timeout=None):
+        """The PaddleOCR instance, waiting up to `timeout` seconds for it to finish loading"""
+        self.start()
+        if not self._ready.wait(timeout):
+            raise OCRNotReady('OCR model is still loading, try again shortly')
+        if self._error:
+            raise OCRNotReady(f'OCR model failed to load: {self._error}')
+        return self._ocr
+
+    def is_ready(self):
+        return self._ready.is_set() and self._error is None
+
+    def status(self):
+        if self._thread is None:
+            state = 'not started'
+        elif not self._ready.is_set():
+            state = 'loading'
+        else:
+            state = 'failed' if self._error else 'ready'
+        return {
+            'state': state,
+            'load_seconds': self._load_seconds,
+            'warmup_seconds': self._warmup_seconds,
+            'error': self._error,
+        }
+
+    def _load(self):
+        try:
+            start = time.perf_counter()
+            # Imported here rather than at module level: importing paddle alone takes seconds
+            from paddleocr import PaddleOCR
+            ocr = PaddleOCR(**self.options)
+            self._load_seconds = round(time.perf_counter() - start, 3)
+
+            if self.warm:
+                start = time.perf_counter()
+                warm_up(ocr)
+                self._warmup_seconds = round(time.perf_counter() - start, 3)
+            self._ocr = ocr
+        except Exception as e:
+            self._error = str(e)
+        finally:
+            self._ready.set()
@@ -0,0 +1,191 @@
+"""SQLite-backed queue for asynchronous OCR jobs.
+
+Jobs live in the ocr_jobs table of packages.db, so anything still queued
+or running when the server stops is picked up again on the next start.
+A fixed number of worker threads bounds how many labels are OCR'd at once.
+"""
+import json
+import secrets
+import threading
+import time
+
+import metrics
+
+# Finished jobs are deleted after this many seconds
+JOB_RETENTION_SECONDS = 24 * 60 * 60
+
+# How many finished jobs the latency stats are computed over
+STATS_WINDOW = 200
+
+
+class OCRJobQueue:
+    def __init__(self, connect, process, workers=1, poll_interval=1.0):
+        """connect() returns a sqlite3 connection; process(image_data) returns the parsed label"""
+        self.connect = connect
+        self.process = process
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._changed = threading.Condition()
+        self._threads = []
+        self._stopping = False
+
+    def start(self):
+        """Requeue jobs interrupted by a restart and start the worker threads"""
+        if self._threads:
+            return
+
+        db = self.connect()
+        db.execute("UPDATE ocr_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        db.execute("DELETE FROM ocr_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - JOB_RETENTION_SECONDS,))
+        db.commit()
+        db.close()
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'ocr-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, image_data):
+        """Store a job and return its id"""
+        job_id = secrets.token_hex(8)
+
+        db = self.connect()
+        db.execute('''INSERT INTO ocr_jobs (id, status, image, created_at)
+            VALUES (?, 'queued', ?, ?)''',
+            (job_id, image_data, time.time()))
+        db.commit()
+        db.close()
+
+        self._notify()
+        return job_id
+
+    def get(self, job_id, wait=0):
+        """Return the job as a dict (None if unknown), waiting up to `wait` seconds for it to finish"""
+        deadline = time.time() + wait
+
+        while True:
+            job = self._fetch(job_id)
+            remaining = deadline - time.time()
+            if job is None or job['status'] in ('done', 'failed') or remaining <= 0:
+                return job
+
+            # Jobs finished by another process don't notify us, so cap the wait
+            with self._changed:
+                self._changed.wait(min(remaining, self.poll_interval))
+
+    def as_completed(self, job_ids, timeout):
+        """Yield (job id, job) as each job finishes; once none has finished for `timeout`
+        seconds, the rest are yielded as they stand"""
+        pending = list(job_ids)
+        deadline = time.time() + timeout
+
+        while pending:
+            for job_id in list(pending):
+                job = self._fetch(job_id)
+                if job is None or job['status'] in ('done', 'failed') or time.time() >= deadline:
+                    pending.remove(job_id)
+                    deadline = time.time() + timeout
+                    yield job_id, job
+            if pending:
+                with self._changed:
+                    self._changed.wait(self.poll_interval)
+
+    def stop(self, timeout=None):
+        """Let the jobs in progress finish and stop the workers; False if some are still running"""
+        self._stopping = True
+        self._notify()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()) if deadline is not None else None)
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def stats(self):
+        db = self.connect()
+        counts = {row['status']: row['count'] for row in db.execute(
+            "SELECT status, COUNT(*) AS count FROM ocr_jobs GROUP BY status")}
+        recent = db.execute('''SELECT started_at - created_at AS wait, finished_at - started_at AS run
+            FROM ocr_jobs WHERE status IN ('done', 'failed')
+            ORDER BY finished_at DESC LIMIT ?''', (STATS_WINDOW,)).fetchall()
+        oldest = db.execute("SELECT MIN(created_at) FROM ocr_jobs WHERE status = 'queued'").fetchone()[0]
+        db.close()
+
+        waits = sorted(r['wait'] for r in recent)
+        runs = sorted(r['run'] for r in recent)
+        return {
+            'queue_depth': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'workers': self.workers,
+            'oldest_queued_age': round(time.time() - oldest, 3) if oldest else 0,
+            'wait_seconds': metrics.summary(waits),
+            'run_seconds': metrics.summary(runs),
+        }
+
+    def _fetch(self, job_id):
+        db = self.connect()
+        row = db.execute('''SELECT id, status, result, error, created_at, started_at, finished_at
+            FROM ocr_jobs WHERE id = ?''', (job_id,)).fetchone()
+        db.close()
+
+        if not row:
+            return None
+
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running; returns (id, image) or None"""
+        db = self.connect()
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute('''SELECT id, image FROM ocr_jobs
+                WHERE status = 'queued' ORDER BY created_at LIMIT 1''').fetchone()
+            if row:
+                db.execute("UPDATE ocr_jobs SET status = 'running', started_at = ? WHERE id = ?",
+                    (time.time(), row['id']))
+            db.commit()
+        finally:
+            db.close()
+        return (row['id'], row['image']) if row else None
+
+    def _finish(self, job_id, result=None, error=None):
+        db = self.connect()
+        # The image is only needed until the job runs
+        db.execute('''UPDATE ocr_jobs
+            SET status = ?, result = ?, error = ?, image = NULL, finished_at = ?
+            WHERE id = ?''',
+            ('failed' if error else 'done', json.dumps(result) if result is not None else None,
+             error, time.time(), job_id))
+        db.commit()
+        db.close()
+        self._notify()
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _work(self):
+        while not self._stopping:
+            try:
+                job = self._claim()
+            except Exception:
+                job = None
+
+            if job is None:
+                with self._changed:
+                    self._changed.wait(self.poll_interval)
+                continue
+
+            job_id, image_data = job
+            try:
+                result, error = self.process(image_data), None
+            except Exception as e:
+                result, error = None, str(e)
+
+            try:
+                self._finish(job_id, result, error)
+            except Exception:
+                pass  # stays 'running' and is requeued on the next start
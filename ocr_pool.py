@@ -0,0 +1,80 @@
+"""PaddleOCR worker pool for batch label intake.
+
+Each worker process loads its own PaddleOCR model once, in the pool
+initializer, warms it up, and reuses it for every label it is handed. The helpers
+decode_image and extract_lines are shared with the single-image path in
+server.py so both paths produce the same lines for the same label.
+"""
+import base64
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from label_parser import lines_from_ocr
+from ocr_engine import warm_up
+from label_preprocess import preprocess_image
+
+# PaddleOCR instance and pre-processing options owned by the current worker process
+_worker_ocr = None
+_worker_preprocess = None
+
+
+def image_bytes(image_data):
+    """Raw bytes of a base64 image (plain or data URL)"""
+    if 'base64,' in image_data:
+        image_data = image_data.split('base64,')[1]
+    return base64.b64decode(image_data)
+
+
+def decode_image(image_data):
+    """Decode a base64 image (plain or data URL) into an OpenCV BGR array"""
+    nparr = np.frombuffer(image_bytes(image_data), np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def extract_lines(ocr, img):
+    """Run OCR on a decoded image and return the recognised OCRLines in reading order"""
+    return lines_from_ocr(ocr.ocr(img, cls=True))
+
+
+def _init_worker(ocr_options, preprocess_options):
+    global _worker_ocr, _worker_preprocess
+    from paddleocr import PaddleOCR
+    _worker_ocr = PaddleOCR(**ocr_options)
+    warm_up(_worker_ocr)
+    _worker_preprocess = preprocess_options
+
+
+def _recognize(image_data):
+    img, _ = preprocess_image(decode_image(image_data), _worker_preprocess)
+    return extract_lines(_worker_ocr, img)
+
+
+class OCRPool:
+    """Fan label images out to a fixed number of OCR worker processes"""
+
+    def __init__(self, workers, ocr_options, preprocess_options=None):
+        self.workers = workers
+        # spawn rather than fork: Paddle's native thread pools don't survive a fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(ocr_options, preprocess_options))
+
+    def recognize_unordered(self, images):
+        """Yield (index, lines, error) for each image as soon as it finishes"""
+        futures = {self._executor.submit(_recognize, image): index
+                   for index, image in enumerate(images)}
+
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                yield index, future.result(), None
+            except Exception as e:
+                yield index, None, str(e)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,43 @@
+"""OCR and call service: one process that runs PaddleOCR, the OCR jobs and the customer calls.
+
+With several web worker processes (gunicorn.conf.py) each would otherwise
+load its own copy of the model and run its own call workers, dialling past
+the PBX's trunk and rate limits. With OCR_SERVICE on, the web workers
+queue scans in the ocr_jobs table and calls in the calls table, and this
+process works through both, with one model and one OCRCache for all.
+
+gunicorn.conf.py starts and stops it with the master. When serving some
+other way with PACKAGES_OCR_SERVICE=1, run it alongside:
+
+    python ocr_service.py
+
+SIGTERM or Ctrl-C lets the OCR job and calls in progress finish, for up
+to GRACEFUL_TIMEOUT seconds, before it exits.
+"""
+import signal
+import threading
+
+import server
+
+
+def main():
+    stopping = threading.Event()
+    for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: stopping.set())
+
+    # Jobs come from other processes, so look for them every OCR_SERVICE_POLL seconds
+    server.OCR_SERVICE = True
+    server.init_db()
+    server.ocr_engine.start()
+    server.get_ocr_jobs().start()
+    server.get_call_dispatcher().start()
+    print(f'OCR service running on {server.DATABASE}', flush=True)
+
+    while not stopping.wait(1):
+        pass
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""FTS5 full-text index over packages for the archive search box.
+
+packages_fts is a standalone FTS5 table keyed by package id and kept in
+sync by triggers; bulk loads can defer indexing to one statement per batch
+with deferred_indexing(). Phone numbers are indexed as bare digits (plus the last
+seven digits, so a local number without area code matches) and postal
+codes both compact and split, so "705-555-1234", "705 555 1234",
+"P5A1X1" and "p5a 1x1" all find the same rows.
+"""
+import re
+from contextlib import contextmanager
+
+# Digits-only phone, built from SQL string functions because triggers can't call Python
+_PHONE_DIGITS = ("replace(replace(replace(replace(replace(replace(coalesce({row}.phone, ''),"
+                 " '-', ''), ' ', ''), '(', ''), ')', ''), '.', ''), '+', '')")
+_POSTAL_COMPACT = "replace(replace(upper(coalesce({row}.postal, '')), ' ', ''), '-', '')"
+
+
+def _indexed_values(row):
+    """SQL expressions for (rowid, name, tracking, phone, postal) of `row` (new/old/packages)"""
+    phone = _PHONE_DIGITS.format(row=row)
+    postal = _POSTAL_COMPACT.format(row=row)
+    return (f"{row}.id, coalesce({row}.name, ''), coalesce({row}.tracking, ''), "
+            f"{phone} || ' ' || substr({phone}, -7), "
+            f"{postal} || ' ' || coalesce({row}.postal, '')")
+
+
+SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS packages_fts USING fts5(
+        name, tracking, phone, postal,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS packages_fts_insert AFTER INSERT ON packages BEGIN
+        INSERT INTO packages_fts (rowid, name, tracking, phone, postal)
+        VALUES ({_indexed_values('new')});
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS packages_fts_delete AFTER DELETE ON packages BEGIN
+        DELETE FROM packages_fts WHERE rowid = old.id;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS packages_fts_update AFTER UPDATE OF name, tracking, phone, postal ON packages BEGIN
+        DELETE FROM packages_fts WHERE rowid = old.id;
+        INSERT INTO packages_fts (rowid, name, tracking, phone, postal)
+        VALUES ({_indexed_values('new')});
+    END''',
+]
+
+REBUILD = [
+    'DELETE FROM packages_fts',
+    f'''INSERT INTO packages_fts (rowid, name, tracking, phone, postal)
+        SELECT {_indexed_values('packages')} FROM packages''',
+]
+
+
+def create_search_index(db):
+    """Create the index and its triggers and fill it from the packages table"""
+    for statement in SCHEMA + REBUILD:
+        db.execute(statement)
+
+
+def allow_deferred_indexing(db):
+    """Make the insert trigger skip rows while packages_fts_deferred has a row (see deferred_indexing)"""
+    db.execute('CREATE TABLE IF NOT EXISTS packages_fts_deferred (active INTEGER)')
+    db.execute('DROP TRIGGER IF EXISTS packages_fts_insert')
+    db.execute(f'''CREATE TRIGGER packages_fts_insert AFTER INSERT ON packages
+        WHEN NOT EXISTS (SELECT 1 FROM packages_fts_deferred) BEGIN
+        INSERT INTO packages_fts (rowid, name, tracking, phone, postal)
+        VALUES ({_indexed_values('new')});
+    END''')
+
+
+def ignore_tier_moves(db):
+    """Make the insert and delete triggers skip rows while packages_moving has a row,
+    which is while archive_tier moves packages between tiers with their entries kept"""
+    db.execute('DROP TRIGGER IF EXISTS packages_fts_insert')
+    db.execute(f'''CREATE TRIGGER packages_fts_insert AFTER INSERT ON packages
+        WHEN NOT EXISTS (SELECT 1 FROM packages_fts_deferred) AND NOT EXISTS (SELECT 1 FROM packages_moving) BEGIN
+        INSERT INTO packages_fts (rowid, name, tracking, phone, postal)
+        VALUES ({_indexed_values('new')});
+    END''')
+    db.execute('DROP TRIGGER IF EXISTS packages_fts_delete')
+    db.execute('''CREATE TRIGGER packages_fts_delete AFTER DELETE ON packages
+        WHEN NOT EXISTS (SELECT 1 FROM packages_moving) BEGIN
+        DELETE FROM packages_fts WHERE rowid = old.id;
+    END''')
+
+
+@contextmanager
+def deferred_indexing(db):
+    """Index the packages inserted inside the block with one INSERT ... SELECT at the end.
+
+    Must run inside a write transaction (BEGIN IMMEDIATE), so the marker row
+    is never visible to other connections and ids only grow. Indexing a batch
+    in one statement is about twice as fast as the per-row trigger.
+    """
+    last_id = db.execute('SELECT MAX(id) FROM packages').fetchone()[0] or 0
+    db.execute('INSERT INTO packages_fts_deferred (active) VALUES (1)')
+    yield
+    db.execute('DELETE FROM packages_fts_deferred')
+    db.execute(f'''INSERT INTO packages_fts (rowid, name, tracking, phone, postal)
+        SELECT {_indexed_values('packages')} FROM packages WHERE id > ?''', (last_id,))
+
+
+def build_match_query(search):
+    """Turn search box text into an FTS5 MATCH expression, or None if there's nothing to search.
+
+    Every word is a prefix term and all must match. With several words the
+    words run together are also tried, so "705 555 1234" matches the
+    indexed digits 7055551234.
+    """
+    terms = re.findall(r'[^\W_]+', search)
+    if not terms:
+        return None
+
+    query = ' AND '.join(f'"{t}"*' for t in terms)
+    if len(terms) > 1:
+        query = f'({query}) OR "{"".join(terms)}"*'
+    return query
@@ -0,0 +1,138 @@
+"""Package counts for the dashboard, kept up to date by triggers.
+
+Four small tables hold the counts /api/stats/summary reads, so it never
+walks the package lists:
+
+  package_status_counts    packages per status
+  pending_by_day           pending packages per day created
+  signed_by_day            signed packages per day signed
+  customer_pending_counts  pending packages per customer
+
+Triggers on packages move a row's counts when it's inserted, deleted or
+has its status, created_at, signed_at or customer_id changed, so every
+write path (the API, CSV imports, a hand-run UPDATE) keeps them in step
+inside its own transaction. Days are date() of the stored timestamps,
+which are UTC; rows whose timestamp date() can't read count under ''.
+Counts that drop to zero are deleted. Archived packages (see archive_tier.py)
+keep their counts. drift() recomputes every count from both tiers to check
+them (see check_stats.py).
+"""
+
+# (table, key column, key expression for row `{row}`, condition on `{row}`)
+_COUNTS = [
+    ('package_status_counts', 'status', "coalesce({row}.status, '')", '1'),
+    ('pending_by_day', 'day', "coalesce(date({row}.created_at), '')", "{row}.status = 'pending'"),
+    ('signed_by_day', 'day', "coalesce(date({row}.signed_at), '')", "{row}.status = 'signed'"),
+    ('customer_pending_counts', 'customer_id', '{row}.customer_id',
+     "{row}.status = 'pending' AND {row}.customer_id IS NOT NULL"),
+]
+
+
+def _add(row):
+    return ''.join(f'''
+        INSERT INTO {table} ({key}, count) SELECT {expr.format(row=row)}, 1 WHERE {where.format(row=row)}
+            ON CONFLICT ({key}) DO UPDATE SET count = count + 1;''' for table, key, expr, where in _COUNTS)
+
+
+def _remove(row):
+    return ''.join(f'''
+        UPDATE {table} SET count = count - 1 WHERE {key} = {expr.format(row=row)} AND {where.format(row=row)};
+        DELETE FROM {table} WHERE {key} = {expr.format(row=row)} AND count <= 0;'''
+        for table, key, expr, where in _COUNTS)
+
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS package_status_counts (status TEXT PRIMARY KEY, count INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS pending_by_day (day TEXT PRIMARY KEY, count INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS signed_by_day (day TEXT PRIMARY KEY, count INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS customer_pending_counts (customer_id INTEGER PRIMARY KEY, count INTEGER NOT NULL)',
+    f'''CREATE TRIGGER IF NOT EXISTS package_stats_insert AFTER INSERT ON packages BEGIN{_add('new')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS package_stats_delete AFTER DELETE ON packages BEGIN{_remove('old')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS package_stats_update
+        AFTER UPDATE OF status, created_at, signed_at, customer_id ON packages BEGIN{_remove('old')}{_add('new')}
+    END''',
+]
+
+
+def ignore_tier_moves(db):
+    """Make the insert and delete triggers skip rows while packages_moving has a row: a
+    package moved between tiers by archive_tier keeps its counts"""
+    db.execute('DROP TRIGGER IF EXISTS package_stats_insert')
+    db.execute(f'''CREATE TRIGGER package_stats_insert AFTER INSERT ON packages
+        WHEN NOT EXISTS (SELECT 1 FROM packages_moving) BEGIN{_add('new')}
+    END''')
+    db.execute('DROP TRIGGER IF EXISTS package_stats_delete')
+    db.execute(f'''CREATE TRIGGER package_stats_delete AFTER DELETE ON packages
+        WHEN NOT EXISTS (SELECT 1 FROM packages_moving) BEGIN{_remove('old')}
+    END''')
+
+
+def _recount(db, key, expr, where):
+    """SELECT of (key, count) for one table, counted from packages and the archive tier"""
+    source = 'all_packages' if db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = 'all_packages'").fetchone() else 'packages'
+    return f'''SELECT {expr.format(row=source)} AS {key}, COUNT(*) FROM {source}
+        WHERE {where.format(row=source)} GROUP BY 1'''
+
+
+def rebuild(db):
+    """Recount every table from packages"""
+    for table, key, expr, where in _COUNTS:
+        db.execute(f'DELETE FROM {table}')
+        db.execute(f'INSERT INTO {table} ({key}, count) {_recount(db, key, expr, where)}')
+
+
+def create_stats(db):
+    """Create the count tables and their triggers and fill them"""
+    for statement in SCHEMA:
+        db.execute(statement)
+    rebuild(db)
+
+
+def drift(db):
+    """Counts that don't match packages, as [(table, key, stored, actual)].
+
+    Run it inside a transaction (BEGIN) so the stored and recomputed counts
+    come from the same snapshot.
+    """
+    mismatches = []
+    for table, key, expr, where in _COUNTS:
+        stored = dict(db.execute(f'SELECT {key}, count FROM {table}').fetchall())
+        actual = dict(db.execute(_recount(db, key, expr, where)).fetchall())
+        for value in sorted(stored.keys() | actual.keys(), key=str):
+            if stored.get(value, 0) != actual.get(value, 0):
+                mismatches.append((table, value, stored.get(value, 0), actual.get(value, 0)))
+    return mismatches
+
+
+def summary(db, old_cutoff, customers=False):
+    """The dashboard counts. old_cutoff is the created_at (YYYY-MM-DD HH:MM:SS) at or
+    before which a pending package counts as old, as get_old_packages takes it.
+    With customers, also the pending count of every customer who has any.
+    """
+    statuses = dict(db.execute('SELECT status, count FROM package_status_counts').fetchall())
+
+    # Whole days before the cutoff's day from the counts, that one day from the index
+    cutoff_day = old_cutoff[:10]
+    old = db.execute('SELECT COALESCE(SUM(count), 0) FROM pending_by_day WHERE day < ?',
+                     (cutoff_day,)).fetchone()[0]
+    old += db.execute('''SELECT COUNT(*) FROM packages
+        WHERE status = 'pending' AND created_at >= ? AND created_at <= ?''', (cutoff_day, old_cutoff)).fetchone()[0]
+
+    signed_today = db.execute("SELECT count FROM signed_by_day WHERE day = date('now')").fetchone()
+    stats = {
+        'pending': statuses.get('pending', 0),
+        'old': old,
+        'signed_today': signed_today[0] if signed_today else 0,
+        'statuses': statuses,
+    }
+    if not customers:
+        return stats
+
+    # CROSS JOIN keeps the planner from walking every customer in name order
+    rows = db.execute('''SELECT customer_id, name, phone, count AS pending
+        FROM customer_pending_counts CROSS JOIN customers ON customers.id = customer_id''').fetchall()
+    stats['customers'] = sorted((dict(row) for row in rows), key=lambda c: (c['name'] or '').lower())
+    return stats
@@ -0,0 +1,118 @@
+"""Cache of OCR results keyed by a perceptual fingerprint of the label photo.
+
+A double-tapped scan or a re-sent upload is the same photo again, but
+rarely the same bytes: the browser may re-encode or resize it. Each image
+is reduced to a FINGERPRINT_SIZE x FINGERPRINT_SIZE grayscale thumbnail,
+normalised to zero mean and unit length. Two photos whose thumbnails
+correlate above MIN_SIMILARITY are treated as the same image and share one
+OCR result.
+
+The threshold is deliberately strict. A label photographed a second time
+(new framing and lighting) differs from the first about as much as two
+different labels on the same courier template do, so a looser match could
+hand back another customer's label. Those re-photographed labels are
+caught after OCR instead, by the tracking-number duplicate check in
+server.py.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+FINGERPRINT_SIZE = 32
+
+# Re-encoded / resized copies of one photo correlate above 0.9997; different
+# labels on the same template stay below 0.98 (see benchmarks/duplicate_scans.py)
+MIN_SIMILARITY = 0.997
+
+
+def fingerprint(img):
+    """Normalised grayscale thumbnail of a decoded (BGR or grayscale) image; None for None.
+
+    Takes the fully decoded image: JPEG reduced-size decoding is faster but
+    aliases differently at each upload size, which costs most of the margin.
+    """
+    if img is None:
+        return None
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    thumb = cv2.resize(img, (FINGERPRINT_SIZE, FINGERPRINT_SIZE), interpolation=cv2.INTER_AREA)
+    thumb = thumb.astype(np.float32).ravel()
+    thumb -= thumb.mean()
+    norm = np.linalg.norm(thumb)
+    return thumb / norm if norm else thumb
+
+
+class OCRCache:
+    """Bounded LRU of fingerprint -> OCR result; entries also expire max_age seconds after insertion"""
+
+    def __init__(self, max_entries=256, max_age=30 * 60, min_similarity=MIN_SIMILARITY):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (fingerprint, result, stored_at)
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, fp):
+        """The cached result for a near-identical image, or None"""
+        if fp is None:
+            return None
+        with self._lock:
+            self._expire()
+            key = self._closest(fp)
+            if key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][1]
+
+    def put(self, fp, result):
+        if fp is None:
+            return
+        with self._lock:
+            self._expire()
+            key = self._closest(fp)
+            if key is None:
+                key = self._next_key
+                self._next_key += 1
+            self._entries[key] = (fp, result, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'max_age_seconds': self.max_age,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _closest(self, fp):
+        if not self._entries:
+            return None
+        keys = list(self._entries)
+        similarity = np.stack([self._entries[k][0] for k in keys]) @ fp
+        best = int(similarity.argmax())
+        return keys[best] if similarity[best] >= self.min_similarity else None
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.max_age
+        for key in [k for k, (_, _, stored_at) in self._entries.items() if stored_at < cutoff]:
+            del self._entries[key]
+            self.expirations += 1
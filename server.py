@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, stream_with_context, g, redirect
 from flask_cors import CORS
 import sqlite3
 import hashlib
@@ -6,22 +6,128 @@ import secrets
 from datetime import datetime, timedelta
 import os
 import base64
+import csv
+import io
 import cv2
 import json
 import numpy as np
-from paddleocr import PaddleOCR
 import re
-import requests
+import time
+from urllib.parse import urlsplit
+from ocr_engine import OCREngine, OCRNotReady
+from ocr_pool import OCRPool, decode_image, extract_lines, image_bytes
+from label_parser import parse_label
+from ocr_jobs import OCRJobQueue
+from image_jobs import ImageJobQueue
+from call_dispatcher import CallDispatcher
+from label_preprocess import preprocess_image
+import image_pipeline
+from scan_cache import OCRCache, fingerprint
+from blob_store import URL_PREFIX, BlobStore, is_valid_hash, sniff_mimetype
+from package_search import build_match_query
+import package_stats
+import archive_tier
+from migrations import migrate
+from database import ConnectionPool
+from customer_cache import CustomerIndex
+from tracking_cache import TrackingCache
+from name_matcher import confident_match
+from bulk_import import CSVFormatError, Importer
+import batch_sync
+from batch_sync import OperationError
+from event_bus import EventBus
+from event_server import EventServer, listen as listen_for_events
+import metrics
+import settings
 
 app = Flask(__name__, static_folder='.')
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor'])
 
-# Initialize PaddleOCR (runs locally, no external API calls)
-ocr = PaddleOCR(use_angle_cls=True, lang='en', use_gpu=False)
+# PaddleOCR settings (runs locally, no external API calls). For faster, lighter
+# models add e.g. 'ocr_version': 'PP-OCRv3', 'det_limit_side_len': 736, or
+# 'det_model_dir' / 'rec_model_dir' pointing at slim (quantised) inference models
+OCR_OPTIONS = {'use_angle_cls': True, 'lang': 'en', 'use_gpu': False}
+
+# The model loads in the background (see ocr_engine.py); a scan arriving before it
+# is ready waits this many seconds before getting a 503
+OCR_READY_TIMEOUT = 60
+
+# Steps applied to label photos before OCR (see label_preprocess.py)
+PREPROCESS_OPTIONS = {'max_side': 1600, 'crop': True, 'deskew': True, 'grayscale': False}
+
+# Worker processes for /api/process-images (each loads its own model)
+OCR_POOL_WORKERS = 2
+ocr_pool = None
+
+# Background threads running async /api/process-image jobs
+OCR_JOB_WORKERS = 1
+ocr_jobs = None
+
+# OCR results of recent label photos, so a re-sent image skips OCR (see scan_cache.py)
+OCR_CACHE_ENTRIES = 256
+OCR_CACHE_MAX_AGE = 30 * 60
+
+# True when one separate process (ocr_service.py) loads the model and runs the OCR
+# jobs and calls for every web process: web processes then queue scans and calls
+# for it and check the ocr_jobs table every OCR_SERVICE_POLL seconds for results.
+# gunicorn.conf.py turns this on and starts the service
+OCR_SERVICE = False
+OCR_SERVICE_POLL = 0.1
 
 # Database file
 DATABASE = 'packages.db'
 
+# Label and signature images live here; the database only stores /api/blobs/<hash> URLs
+BLOB_DIR = 'blobs'
+
+# Uploaded labels and signatures are stored as sent and re-encoded in the background by
+# IMAGE_JOB_WORKERS threads (see image_jobs.py); list views show thumbnails from
+# /api/blobs/<hash>/thumbnail (see image_pipeline.py)
+IMAGE_JOB_WORKERS = 1
+image_jobs = None
+IMAGE_OPTIONS = {'compress': True, 'label_max_side': 1600, 'label_format': 'webp', 'label_quality': 80,
+                 'signature_threshold': 160, 'signature_margin': 8, 'thumbnail_side': 240, 'thumbnail_quality': 70}
+# (table, column) holding blob URLs, moved to an image's re-encoding once it's stored
+IMAGE_COLUMNS = [('packages', 'label_image'), ('packages', 'signature_image'),
+                 ('packages_archive', 'label_image'), ('packages_archive', 'signature_image'),
+                 ('pickups', 'pickup_signature')]
+
+# Package list endpoints return this many rows per page unless ?limit= says otherwise
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Pending packages this many days old show up in /api/packages/old and the old count
+OLD_PACKAGE_DAYS = 5
+
+# /api/track answers are cached per tracking number (see tracking_cache.py): at most
+# TRACKING_CACHE_ENTRIES of them, each reloaded after TRACKING_CACHE_MAX_AGE seconds
+TRACKING_CACHE_ENTRIES = 10000
+TRACKING_CACHE_MAX_AGE = 5 * 60
+
+# POST /api/sync applies at most this many queued station operations per request
+SYNC_MAX_OPERATIONS = 1000
+
+# archive_packages.py moves packages signed or sent back this many days ago to the archive tier
+ARCHIVE_AFTER_DAYS = 180
+
+PACKAGE_COLUMNS = ['id', 'courier', 'name', 'tracking', 'phone', 'postal', 'label_image',
+    'signature_image', 'status', 'created_at', 'address', 'signed_at', 'created_by', 'customer_id', 'pickup_id']
+
+# Columns list endpoints return by default; images only when asked for with ?fields=
+PACKAGE_LIST_FIELDS = [c for c in PACKAGE_COLUMNS if c not in ('label_image', 'signature_image')]
+
+# Archive searches matching fewer packages than this are driven from the FTS index
+FTS_SELECTIVE_MATCHES = 2000
+
+# /api/export/packages fetches and writes this many rows at a time
+EXPORT_CHUNK_ROWS = 500
+
+# Fuzzy name matches at or above this score auto-fill OCR results for the user to confirm,
+# provided the runner-up is at least AUTO_FILL_MARGIN behind; saving a package only ever
+# links a customer by phone or exact name
+AUTO_FILL_CONFIDENCE = 0.92
+AUTO_FILL_MARGIN = 0.02
+
 # Default location for packages
 DEFAULT_CITY = "Elliot Lake"
 DEFAULT_PROVINCE = "ON"
@@ -34,6 +140,63 @@ GRANDSTREAM_PASSWORD = "admin"    # Change to your admin password
 GRANDSTREAM_EXTENSION = "8000"    # Extension to make outbound calls
 GRANDSTREAM_RECORDING_ID = "1"    # ID of your prerecorded message
 
+# Calls are placed in the background (see call_dispatcher.py): at most CALL_WORKERS
+# at once (the trunk lines the UCM can dial on), with dial requests at least
+# CALL_MIN_INTERVAL seconds apart
+CALL_WORKERS = 2
+CALL_MIN_INTERVAL = 0.2
+CALL_TIMEOUT = 10
+call_dispatcher = None
+
+# Production serving (wsgi.py, gunicorn.conf.py): listen address, worker processes
+# (gunicorn only; waitress runs one), request threads per process, and seconds a
+# stopping server gives requests in flight and background work to finish. The default
+# only listens on this machine; set bind to 0.0.0.0:5000 (or the LAN address) in the
+# config file to serve the scanning stations over the network, and events_bind to match
+BIND = '127.0.0.1:5000'
+WORKERS = 3
+THREADS = 8
+GRACEFUL_TIMEOUT = 30
+
+# Where /api/events streams are served (see event_server.py): one thread per process
+# writes every open stream, so they take none of the THREADS. /api/events on BIND
+# redirects there: to EVENTS_URL if set (the address browsers reach it at behind a
+# proxy), otherwise to the host the browser used with EVENTS_BIND's port
+EVENTS_BIND = '127.0.0.1:5001'
+EVENTS_URL = ''
+
+# Where each process writes its /metrics counts so any one of them can report them all
+# (see metrics.py); empty keeps them per process, which is enough for a single process
+METRICS_DIR = ''
+
+# Any of the settings above can come from the environment or a config file (see settings.py)
+settings.override(globals())
+
+metrics.REGISTRY.configure(METRICS_DIR)
+
+ocr_engine = OCREngine(OCR_OPTIONS)
+ocr_cache = OCRCache(OCR_CACHE_ENTRIES, OCR_CACHE_MAX_AGE)
+blobs = BlobStore(BLOB_DIR)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.pop('request_start', None)
+    if start is not None and metrics.REGISTRY.enabled:
+        # The route pattern, not the path, so /api/packages/<id> is one series
+        rule = request.url_rule
+        metrics.REQUESTS.observe(time.perf_counter() - start,
+            request.method, rule.rule if rule else 'unmatched', str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, stage and query latency histograms in the Prometheus text format (see metrics.py)"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # Function to normalize postal code
 def normalize_postal_code(postal):
     """Ensure postal code is in correct format and add default prefix if needed"""
@@ -66,63 +229,107 @@ def normalize_address(address, postal):
     
     return address
 
+db_pool = None
+customer_index = None
+tracking_cache = None
+event_bus = None
+event_server = None
+
+def get_pool():
+    """Connection pool for DATABASE (rebuilt if DATABASE is pointed somewhere else)"""
+    global db_pool, customer_index, tracking_cache, event_bus
+    if db_pool is None or db_pool.path != DATABASE:
+        if db_pool is not None:
+            db_pool.close_all()
+        db_pool = ConnectionPool(DATABASE)
+        customer_index = None
+        tracking_cache = None
+        if event_bus is not None:
+            close_event_streams()
+            event_bus = None
+    return db_pool
+
+def get_customer_index():
+    """In-memory customer lookup by phone/name for the current DATABASE"""
+    global customer_index
+    get_pool()
+    if customer_index is None:
+        customer_index = CustomerIndex(get_db)
+    return customer_index
+
+def get_tracking_cache():
+    """Cached /api/track lookups for the current DATABASE"""
+    global tracking_cache
+    get_pool()
+    if tracking_cache is None:
+        tracking_cache = TrackingCache(get_db, TRACKING_CACHE_ENTRIES, TRACKING_CACHE_MAX_AGE)
+    return tracking_cache
+
+def close_event_streams():
+    """End this process's /api/events streams and stop serving them; clients reconnect with
+    Last-Event-ID (under gunicorn, to another worker)"""
+    global event_server
+    if event_server is not None:
+        event_server.close()
+        event_server = None
+    if event_bus is not None:
+        event_bus.close()
+
+def shutdown(timeout=GRACEFUL_TIMEOUT):
+    """Stop this process's background work before it exits.
+    
+    OCR jobs and calls in progress get up to `timeout` seconds to finish;
+    anything still running after that is requeued on the next start.
+    """
+    close_event_streams()
+    deadline = time.monotonic() + timeout
+    for worker in (ocr_jobs, call_dispatcher, image_jobs):
+        if worker is not None:
+            worker.stop(max(0, deadline - time.monotonic()))
+    if ocr_pool is not None:
+        ocr_pool.shutdown()
+    if db_pool is not None:
+        db_pool.close_all()
+    metrics.REGISTRY.flush()
+
+def get_event_bus():
+    """Change events for /api/events on the current DATABASE"""
+    global event_bus
+    get_pool()
+    if event_bus is None:
+        event_bus = EventBus(get_db)
+    return event_bus
+
+def start_event_server(listener=None):
+    """Serve /api/events streams from this process, on listener (a socket from
+    event_server.listen(), which gunicorn's master opens for all its workers) or EVENTS_BIND"""
+    global event_server
+    if event_server is None:
+        event_server = EventServer(get_event_bus(), listener or listen_for_events(EVENTS_BIND))
+        event_server.start()
+    return event_server
+
+def publish_package(event_type, package_id):
+    """Publish a package event carrying the package's list fields"""
+    db = get_db()
+    package = db.execute(f"SELECT {', '.join(PACKAGE_LIST_FIELDS)} FROM packages WHERE id = ?",
+        (package_id,)).fetchone()
+    db.close()
+    if package:
+        get_event_bus().publish(event_type, dict(package))
+
 def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """A pooled connection; db.close() returns it to the pool"""
+    return get_pool().connect()
+
+def transaction():
+    """Context manager: a connection inside BEGIN IMMEDIATE, committed on exit"""
+    return get_pool().transaction()
 
 def init_db():
     with app.app_context():
         db = get_db()
-        
-        db.execute('''CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            password_hash TEXT NOT NULL,
-            role TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        db.execute('''CREATE TABLE IF NOT EXISTS customers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            phone TEXT UNIQUE,
-            email TEXT,
-            street TEXT,
-            postal TEXT,
-            profile_locked INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        db.execute('''CREATE TABLE IF NOT EXISTS packages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            courier TEXT NOT NULL,
-            name TEXT NOT NULL,
-            tracking TEXT NOT NULL,
-            phone TEXT,
-            postal TEXT NOT NULL,
-            label_image TEXT,
-            signature_image TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            address TEXT,
-            signed_at TIMESTAMP,
-            created_by TEXT,
-            customer_id INTEGER,
-            FOREIGN KEY (customer_id) REFERENCES customers(id)
-        )''')
-        
-        db.execute('''CREATE TABLE IF NOT EXISTS pickups (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            customer_id INTEGER NOT NULL,
-            pickup_name TEXT,
-            pickup_id_type TEXT,
-            pickup_id_number TEXT,
-            pickup_signature TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (customer_id) REFERENCES customers(id)
-        )''')
+        migrate(db)
         
         try:
             password = 'admin123'
@@ -134,6 +341,9 @@ def init_db():
             pass
         
         db.close()
+        
+        # Load the customer index now rather than on the first scan
+        get_customer_index().customers()
 
 @app.route('/')
 def index():
@@ -167,6 +377,27 @@ def login():
 @app.route('/api/packages', methods=['POST'])
 def create_package():
     data = request.json
+    data['labelImage'] = store_label_image(data.get('labelImage', ''))
+    
+    # Customer lookup/creation and the package insert commit (or fail) together
+    try:
+        with transaction() as db:
+            result = insert_package(db, data)
+    except OperationError as e:
+        return jsonify(dict(e.body, success=False)), e.status
+    
+    get_customer_index().invalidate()
+    # Drops a cached "not found" for the new tracking number
+    get_tracking_cache().invalidate()
+    publish_package('package.created', result['id'])
+    return jsonify(dict(result, success=True))
+
+def insert_package(db, data):
+    """Insert a scanned package (labelImage already stored) inside the caller's write transaction.
+    
+    Returns {'id', 'customer_id'}; raises OperationError (409) for a tracking
+    number already on file unless data['allowDuplicate'] is set.
+    """
     postal = normalize_postal_code(data.get('postal', ''))
     address = normalize_address(data.get('address', ''), postal)
     
@@ -174,87 +405,178 @@ def create_package():
     phone = data.get('phone', '')
     name = data.get('name', '')
     
+    # Checked inside the write lock so two stations saving the same label can't both pass
+    existing = find_package_by_tracking(db, data.get('tracking'))
+    if existing and not data.get('allowDuplicate'):
+        raise OperationError(409, {
+            'duplicate': True,
+            'existing': existing,
+            'message': f"Tracking number {data['tracking']} was already scanned as package "
+                       f"#{existing['id']} ({existing['status']}, {existing['created_at']})"
+        })
+    
     if phone or name:
-        customer_id = find_or_create_customer(name, phone, address, postal)
+        customer_id = find_or_create_customer(db, name, phone, address, postal)
     
-    db = get_db()
     cursor = db.execute('''INSERT INTO packages 
         (courier, name, tracking, phone, postal, address, label_image, created_by, customer_id)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
         (data['courier'], data['name'], data['tracking'],
          phone, postal, address,
          data.get('labelImage', ''), data.get('createdBy', ''), customer_id))
-    db.commit()
-    package_id = cursor.lastrowid
-    db.close()
-    
-    return jsonify({'success': True, 'id': package_id, 'customer_id': customer_id})
-def find_or_create_customer(name, phone, address, postal):
-    """Find existing customer or create new one, return customer_id. Respects profile_locked."""
-    db = get_db()
-    
+    return {'id': cursor.lastrowid, 'customer_id': customer_id}
+
+def find_package_by_tracking(db, tracking):
+    """Most recent package with this tracking number, or None"""
+    if not tracking:
+        return None
+    package = db.execute('''SELECT id, name, status, created_at FROM all_packages
+        WHERE tracking = ? ORDER BY id DESC LIMIT 1''', (tracking,)).fetchone()
+    return dict(package) if package else None
+
+def find_or_create_customer(db, name, phone, address, postal):
+    """Find existing customer or create new one, return customer_id. Respects profile_locked.
+    
+    Runs on the caller's connection and leaves committing to the caller.
+    """
+    customers = get_customer_index()
+    customer = (phone and customers.get_by_phone(phone)) or (name and lookup_customer_by_name(name))
+    if customer:
+        return customer['id']
+    
+    # Not cached: check inside the transaction before inserting, in case another
+    # station created this customer a moment ago
     if phone:
         customer = db.execute("SELECT id, profile_locked FROM customers WHERE phone = ?", (phone,)).fetchone()
         if customer:
-            db.close()
             return customer['id']
     
     if name:
         customer = db.execute("SELECT id, profile_locked FROM customers WHERE LOWER(name) = LOWER(?)", (name,)).fetchone()
         if customer:
-            db.close()
             return customer['id']
     
     street = address.split(',')[0] if address else ''
     cursor = db.execute('''INSERT INTO customers (name, phone, street, postal, profile_locked)
         VALUES (?, ?, ?, ?, 0)''',
         (name, phone, street, postal))
-    db.commit()
-    customer_id = cursor.lastrowid
-    db.close()
     
-    return customer_id
+    return cursor.lastrowid
 
-@app.route('/api/packages/pending', methods=['GET'])
-def get_pending_packages():
+def encode_cursor(sort_value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return sort_value, int(row_id)
+
+def package_fields(fields_param):
+    """Columns for ?fields=a,b,c ('all' for every column), defaulting to the slim list set"""
+    if not fields_param:
+        return list(PACKAGE_LIST_FIELDS)
+    if fields_param == 'all':
+        return list(PACKAGE_COLUMNS)
+    return [f for f in fields_param.split(',') if f in PACKAGE_COLUMNS]
+
+def package_value(field, table='packages'):
+    """SQL expression for one of PACKAGE_COLUMNS on `table` (a table name or alias)"""
+    if field == 'signature_image':
+        # Packages released by a bulk pickup point at its one signature instead of holding a copy
+        return f'''COALESCE({table}.signature_image,
+            (SELECT pickup_signature FROM pickups WHERE pickups.id = {table}.pickup_id))'''
+    return f'{table}.{field}'
+
+def list_packages(where, params, sort_column, descending=True, default_limit=PAGE_SIZE, table='packages'):
+    """One page of packages, keyset-paginated on (sort_column, id).
+    
+    The body is a plain list; when more rows exist the X-Next-Cursor header
+    holds the value to pass back as ?cursor= for the next page. table is
+    'all_packages' for lists that include the archive tier.
+    """
+    fields = package_fields(request.args.get('fields'))
+    for required in ('id', sort_column):
+        if required not in fields:
+            fields.append(required)
+    
+    limit = max(1, min(request.args.get('limit', default_limit, type=int), MAX_PAGE_SIZE))
+    params = list(params)
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            sort_value, last_id = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+        where += f" AND ({sort_column}, id) {'<' if descending else '>'} (?, ?)"
+        params += [sort_value, last_id]
+    
+    order = 'DESC' if descending else 'ASC'
     db = get_db()
-    packages = db.execute('''SELECT * FROM packages 
-        WHERE status = 'pending' 
-        ORDER BY created_at DESC''').fetchall()
+    rows = db.execute(f'''SELECT {', '.join(f'{package_value(f, table)} AS {f}' for f in fields)} FROM {table}
+        WHERE {where}
+        ORDER BY {sort_column} {order}, id {order}
+        LIMIT ?''', params + [limit + 1]).fetchall()
     db.close()
     
-    return jsonify([dict(p) for p in packages])
+    packages = [dict(p) for p in rows[:limit]]
+    response = jsonify(packages)
+    if len(rows) > limit:
+        last = packages[-1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last[sort_column], last['id'])
+    return response
+
+@app.route('/api/packages/pending', methods=['GET'])
+def get_pending_packages():
+    return list_packages("status = 'pending'", [], 'created_at', default_limit=MAX_PAGE_SIZE)
 
 @app.route('/api/packages/old', methods=['GET'])
 def get_old_packages():
-    """Get packages older than 5 days that are still pending"""
-    five_days_ago = (datetime.now() - timedelta(days=5)).strftime('%Y-%m-%d %H:%M:%S')
-    
+    """Get packages older than OLD_PACKAGE_DAYS days that are still pending"""
+    return list_packages("status = 'pending' AND created_at <= ?", [old_package_cutoff()], 'created_at',
+        descending=False, default_limit=MAX_PAGE_SIZE)
+
+def old_package_cutoff():
+    """created_at at or before which a pending package is old"""
+    return (datetime.now() - timedelta(days=OLD_PACKAGE_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+
+@app.route('/api/stats/summary', methods=['GET'])
+def stats_summary():
+    """Dashboard counts (pending, old, signed today, per status; with ?customers=1 the pending
+    count per customer), read from the count tables package_stats keeps rather than the package lists"""
     db = get_db()
-    packages = db.execute('''SELECT * FROM packages 
-        WHERE status = 'pending' 
-        AND created_at <= ?
-        ORDER BY created_at ASC''', (five_days_ago,)).fetchall()
+    stats = package_stats.summary(db, old_package_cutoff(), request.args.get('customers') in ('1', 'true'))
     db.close()
-    
-    return jsonify([dict(p) for p in packages])
+    return jsonify(stats)
 
 @app.route('/api/packages/<int:package_id>', methods=['PUT'])
 def update_package(package_id):
     """Update package details and status"""
     data = request.json
     
-    db = get_db()
-    db.execute('''UPDATE packages 
-        SET courier = ?, name = ?, tracking = ?, phone = ?, postal = ?, address = ?, status = ?
+    with transaction() as db:
+        update_package_row(db, package_id, data)
+    get_tracking_cache().invalidate()
+    publish_package('package.updated', package_id)
+    
+    return jsonify({'success': True})
+
+# signed_at in an UPDATE that sets status to the ? parameter: stamped when a package becomes
+# signed and kept otherwise, so the archive list's (signed_at, id) cursor never meets a NULL
+SIGNED_AT_FOR_STATUS = '''CASE WHEN ? != 'signed' OR (status = 'signed' AND signed_at IS NOT NULL)
+    THEN signed_at ELSE CURRENT_TIMESTAMP END'''
+
+def update_package_row(db, package_id, data):
+    """Replace a package's details and status inside the caller's write transaction;
+    returns how many packages changed (0 if there's no such package)"""
+    # An archived package moves back to the working tier before it changes
+    archive_tier.restore(db, [package_id])
+    return db.execute(f'''UPDATE packages 
+        SET courier = ?, name = ?, tracking = ?, phone = ?, postal = ?, address = ?, status = ?,
+            signed_at = {SIGNED_AT_FOR_STATUS}
         WHERE id = ?''',
         (data.get('courier'), data.get('name'), data.get('tracking'),
          data.get('phone'), data.get('postal'), data.get('address'),
-         data.get('status'), package_id))
-    db.commit()
-    db.close()
-    
-    return jsonify({'success': True})
+         data.get('status'), data.get('status'), package_id)).rowcount
 
 @app.route('/api/packages/bulk-status', methods=['POST'])
 def bulk_update_status():
@@ -266,186 +588,530 @@ def bulk_update_status():
     if not package_ids:
         return jsonify({'success': False, 'message': 'No packages selected'}), 400
     
-    db = get_db()
     placeholders = ','.join('?' * len(package_ids))
-    db.execute(f'''UPDATE packages 
-        SET status = ?
-        WHERE id IN ({placeholders})''',
-        [new_status] + package_ids)
-    db.commit()
-    db.close()
+    with transaction() as db:
+        archive_tier.restore(db, package_ids)
+        db.execute(f'''UPDATE packages 
+            SET status = ?, signed_at = {SIGNED_AT_FOR_STATUS}
+            WHERE id IN ({placeholders})''',
+            [new_status, new_status] + package_ids)
+    get_tracking_cache().invalidate()
+    get_event_bus().publish('packages.status', {'ids': package_ids, 'status': new_status})
     
     return jsonify({'success': True, 'updated': len(package_ids)})
 
 @app.route('/api/packages/archived', methods=['GET'])
 def get_archived_packages():
-    search = request.args.get('search', '')
+    match = build_match_query(request.args.get('search', ''))
+    
+    if not match:
+        return list_packages("status = 'signed'", [], 'signed_at', table='all_packages')
+    if request.args.get('sort') == 'relevance':
+        return search_packages_ranked(match, "status = 'signed'")
+    # For selective searches let the FTS matches drive the lookup (unary + hides the status
+    # index from the planner); for very common words walking the signed_at index is faster
+    db = get_db()
+    matches = db.execute('''SELECT COUNT(*) FROM
+        (SELECT rowid FROM packages_fts WHERE packages_fts MATCH ? LIMIT ?)''',
+        (match, FTS_SELECTIVE_MATCHES)).fetchone()[0]
+    db.close()
+    status = '+status' if matches < FTS_SELECTIVE_MATCHES else 'status'
     
+    return list_packages(f'''{status} = 'signed' AND
+        id IN (SELECT rowid FROM packages_fts WHERE packages_fts MATCH ?)''', [match], 'signed_at',
+        table='all_packages')
+
+def search_packages_ranked(match, where):
+    """Best FTS matches first (bm25); a single page, no cursor"""
+    fields = package_fields(request.args.get('fields'))
+    if 'id' not in fields:
+        fields.append('id')
+    limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    
+    # One arm per tier: joining the FTS matches to the all_packages view would materialize it
+    tiers = ' UNION ALL '.join(f'''SELECT {', '.join(f"{package_value(f, 'p')} AS {f}" for f in fields)},
+            bm25(packages_fts, 10.0, 5.0, 2.0, 2.0) AS rank
+        FROM packages_fts f JOIN {table} p ON p.id = f.rowid
+        WHERE packages_fts MATCH ? AND {where}''' for table in ('packages', 'packages_archive'))
     db = get_db()
-    if search:
-        packages = db.execute('''SELECT * FROM packages 
-            WHERE status = 'signed' AND
-            (name LIKE ? OR tracking LIKE ? OR phone LIKE ? OR postal LIKE ?)
-            ORDER BY signed_at DESC''',
-            (f'%{search}%', f'%{search}%', f'%{search}%', f'%{search}%')).fetchall()
-    else:
-        packages = db.execute('''SELECT * FROM packages 
-            WHERE status = 'signed' 
-            ORDER BY signed_at DESC''').fetchall()
+    packages = db.execute(f'{tiers} ORDER BY rank, id LIMIT ?', (match, match, limit)).fetchall()
     db.close()
     
-    return jsonify([dict(p) for p in packages])
+    return jsonify([{f: p[f] for f in fields} for p in packages])
+
+def parse_export_date(value, end=False):
+    """A ?from= / ?to= value as a timestamp string; a bare end date covers that whole day"""
+    if not value:
+        return None
+    if len(value) == 10:
+        day = datetime.strptime(value, '%Y-%m-%d')
+        return (day + timedelta(days=1) if end else day).strftime('%Y-%m-%d %H:%M:%S')
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+
+@app.route('/api/export/packages', methods=['GET'])
+def export_packages():
+    """Stream packages as CSV (default) or ?format=ndjson, in constant memory.
+    
+    ?status=signed,sent_back limits the statuses (default all), ?from= / ?to=
+    (YYYY-MM-DD, inclusive) filter on created_at or ?date=signed_at, ?fields=
+    works as for the list endpoints and ?images=1 adds the label and signature
+    image URLs. Images are never inlined; rows still holding inline base64
+    (not yet moved by migrate_blobs.py) export an empty reference. Rows are
+    grouped by status, oldest first within each.
+    """
+    export_format = request.args.get('format', 'csv')
+    date_column = request.args.get('date', 'created_at')
+    if export_format not in ('csv', 'ndjson') or date_column not in ('created_at', 'signed_at'):
+        return jsonify({'success': False, 'message': 'format must be csv or ndjson, date created_at or signed_at'}), 400
+    try:
+        start = parse_export_date(request.args.get('from'))
+        end = parse_export_date(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    
+    image_fields = ('label_image', 'signature_image')
+    fields = [f for f in package_fields(request.args.get('fields')) if f not in image_fields]
+    if request.args.get('images') in ('1', 'true'):
+        fields += image_fields
+    columns = [f"CASE WHEN substr({package_value(f, 'all_packages')}, 1, {len(URL_PREFIX)}) = '{URL_PREFIX}' "
+               f"THEN {package_value(f, 'all_packages')} ELSE '' END AS {f}"
+               if f in image_fields else f for f in fields]
+    # Both tiers' index scans are merged, not sorted, only if the ORDER BY columns are selected
+    columns += [c for c in (date_column, 'id') if c not in fields]
+    
+    where = 'status = ?'
+    params = []
+    if start:
+        where += f' AND {date_column} >= ?'
+        params.append(start)
+    if end:
+        where += f' AND {date_column} < ?'
+        params.append(end)
+    statuses = [s for s in request.args.get('status', '').split(',') if s]
+    
+    def encode_csv(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(row[:len(fields)] for row in rows)
+        return buffer.getvalue()
+    
+    def encode_ndjson(rows):
+        return ''.join(json.dumps(dict(zip(fields, row))) + '\n' for row in rows)
+    
+    encode = encode_csv if export_format == 'csv' else encode_ndjson
+    
+    def generate():
+        # One query per status walks the (status, date, id) index, so nothing is sorted in memory
+        db = get_db()
+        try:
+            if export_format == 'csv':
+                yield encode([fields])
+            for status in statuses or [row[0] for row in db.execute('SELECT status FROM package_status_counts')]:
+                rows = db.execute(f'''SELECT {', '.join(columns)} FROM all_packages
+                    WHERE {where}
+                    ORDER BY {date_column}, id''', [status] + params)
+                while True:
+                    chunk = rows.fetchmany(EXPORT_CHUNK_ROWS)
+                    if not chunk:
+                        break
+                    yield encode(chunk)
+        finally:
+            db.close()
+    
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    response = Response(generate(), mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename=packages-{datetime.now():%Y%m%d}.{extension}'
+    return response
 
 @app.route('/api/process-image', methods=['POST'])
 def process_image():
     try:
         data = request.json
-        image_data = data.get('image', '')
-        
-        if 'base64,' in image_data:
-            image_data = image_data.split('base64,')[1]
-        
-        img_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
-        result = ocr.ocr(img, cls=True)
+        # Async mode: queue the image and let the client poll /api/ocr-jobs/<id>
+        if data.get('async') or request.args.get('async'):
+            job_id = get_ocr_jobs().enqueue(data.get('image', ''))
+            return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'}), 202
         
-        extracted_text = []
-        if result and len(result) > 0:
-            for line in result[0]:
-                if line[1][0]:
-                    extracted_text.append(line[1][0])
-        
-        full_text = ' '.join(extracted_text)
-        parsed_data = parse_shipping_label(full_text)
-        
-        if parsed_data.get('name'):
-            customer = lookup_customer_by_name(parsed_data['name'])
-            if customer and not customer.get('profile_locked'):
-                if not parsed_data.get('phone'):
-                    parsed_data['phone'] = customer.get('phone', '')
-                if not parsed_data.get('postal'):
-                    parsed_data['postal'] = customer.get('postal', '')
-                if not parsed_data.get('address'):
-                    parsed_data['address'] = f"{customer.get('street', '')}, {DEFAULT_CITY}, {DEFAULT_PROVINCE}"
-        
-        if 'postal' in parsed_data:
-            parsed_data['postal'] = normalize_postal_code(parsed_data.get('postal', ''))
-        if 'address' in parsed_data:
-            parsed_data['address'] = normalize_address(parsed_data.get('address', ''), parsed_data.get('postal', ''))
+        parsed_data = scan_label(data.get('image', ''))
         
         return jsonify({'success': True, 'data': parsed_data})
     
+    except OCRNotReady as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
-def lookup_customer_by_name(name):
+def scan_label(image_data):
+    """process_label_image here, or in the OCR service when OCR_SERVICE is on"""
+    if not OCR_SERVICE:
+        return process_label_image(image_data)
+    
+    jobs = get_ocr_jobs()
+    job = jobs.get(jobs.enqueue(image_data), wait=OCR_READY_TIMEOUT)
+    if job['status'] == 'failed':
+        raise RuntimeError(job['error'])
+    if job['status'] != 'done':
+        raise OCRNotReady('OCR service is busy or not running, try again shortly')
+    return job['result']
+
+def process_label_image(image_data):
+    """Decode, OCR and parse a single base64 label image; a re-sent photo reuses its cached OCR"""
+    with metrics.stage('image_decode'):
+        img = decode_image(image_data)
+    fp = fingerprint(img)
+    lines = ocr_cache.get(fp)
+    if lines is None:
+        with metrics.stage('preprocess'):
+            img, _ = preprocess_image(img, PREPROCESS_OPTIONS)
+        ocr = ocr_engine.get(OCR_READY_TIMEOUT)
+        with metrics.stage('ocr'):
+            lines = extract_lines(ocr, img)
+        ocr_cache.put(fp, lines)
+    return build_label_data(lines)
+
+def label_fingerprint(image_data):
+    """Perceptual fingerprint of a base64 label image, or None if it isn't a readable image"""
+    try:
+        img_bytes = image_bytes(image_data)
+    except ValueError:
+        return None
+    with metrics.stage('image_decode'):
+        img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    return fingerprint(img)
+
+def get_ocr_jobs():
+    """Start the async OCR job workers on first use (the OCR service starts them when OCR_SERVICE is on)"""
+    global ocr_jobs
+    if ocr_jobs is None:
+        if OCR_SERVICE:
+            ocr_jobs = OCRJobQueue(get_db, process_label_image, OCR_JOB_WORKERS, poll_interval=OCR_SERVICE_POLL)
+        else:
+            ocr_jobs = OCRJobQueue(get_db, process_label_image, OCR_JOB_WORKERS)
+            ocr_jobs.start()
+    return ocr_jobs
+
+@app.route('/api/ocr-jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    """Job status and parsed label; ?wait=N long-polls up to N seconds (max 30)"""
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    job = get_ocr_jobs().get(job_id, wait=wait)
+    
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    response = {'success': True, 'job_id': job['id'], 'status': job['status']}
+    if job['status'] == 'done':
+        response['data'] = job['result']
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Readiness for load balancers and monitoring: 200 once OCR is loaded and the database answers"""
     try:
         db = get_db()
-        customer = db.execute("SELECT * FROM customers WHERE LOWER(name) = LOWER(?)", (name,)).fetchone()
+        db.execute('SELECT 1').fetchone()
         db.close()
-        if customer:
-            return dict(customer)
-    except:
-        pass
-    return None
-
-def parse_shipping_label(text):
-    result = {
-        'courier': '',
-        'name': '',
-        'tracking': '',
-        'phone': '',
-        'postal': '',
-        'address': ''
-    }
-    
-    text_upper = text.upper()
-    
-    if 'PUROLATOR' in text_upper:
-        result['courier'] = 'Purolator'
-    elif 'FEDEX' in text_upper or 'FED EX' in text_upper:
-        result['courier'] = 'FedEx'
-    elif 'UPS' in text_upper:
-        result['courier'] = 'UPS'
-    elif 'CANADA POST' in text_upper or 'POSTES CANADA' in text_upper:
-        result['courier'] = 'Canada Post'
-    elif 'DRAGONFLY' in text_upper:
-        result['courier'] = 'Dragonfly'
-    
-    tracking_patterns = [
-        r'\b[0-9]{12,}\b',
-        r'\b[0-9]{4}\s?[0-9]{4}\s?[0-9]{4}\b',
-        r'\b[A-Z0-9]{10,}\b',
-    ]
-    
-    for pattern in tracking_patterns:
-        match = re.search(pattern, text)
-        if match:
-            result['tracking'] = match.group(0).replace(' ', '')
-            break
-    
-    postal_match = re.search(r'\b[A-Z][0-9][A-Z]\s?[0-9][A-Z][0-9]\b', text_upper)
-    if postal_match:
-        result['postal'] = postal_match.group(0)
-    
-    phone_patterns = [
-        r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b',
-        r'\(\d{3}\)\s?\d{3}[-.]?\d{4}',
-    ]
-    for pattern in phone_patterns:
-        match = re.search(pattern, text)
-        if match:
-            result['phone'] = match.group(0)
-            break
-    
-    lines = text.split('\n')
-    for line in lines:
-        line_stripped = line.strip()
-        if len(line_stripped) > 3 and len(line_stripped) < 50:
-            if sum(c.isalpha() for c in line_stripped) > len(line_stripped) * 0.6:
-                if not any(keyword in line_stripped.upper() for keyword in ['TRACKING', 'DELIVERY', 'SHIP', 'FROM', 'PUROLATOR', 'FEDEX', 'UPS']):
-                    result['name'] = line_stripped
-                    break
-    
-    return result
+        database = 'ok'
+    except sqlite3.Error as e:
+        database = str(e)
+    
+    if OCR_SERVICE:
+        # The model lives in the service process; a queue nobody has taken from lately means it's down
+        stats = get_ocr_jobs().stats()
+        ready = stats['oldest_queued_age'] < OCR_READY_TIMEOUT and database == 'ok'
+        ocr_status = {'state': 'service', 'queue_depth': stats['queue_depth'],
+                      'oldest_queued_age': stats['oldest_queued_age']}
+        return jsonify({'status': 'ok' if ready else 'unavailable',
+                        'ocr': ocr_status, 'database': database}), 200 if ready else 503
+    
+    # A readiness probe means we're about to take traffic, so start loading if nothing has
+    ocr_engine.start()
+    ocr_status = ocr_engine.status()
+    ready = ocr_status['state'] == 'ready' and database == 'ok'
+    return jsonify({'status': 'ok' if ready else 'starting' if ocr_status['state'] == 'loading' else 'unavailable',
+                    'ocr': ocr_status, 'database': database}), 200 if ready else 503
+
+@app.route('/api/ocr-cache/stats', methods=['GET'])
+def get_ocr_cache_stats():
+    return jsonify(ocr_cache.stats())
+
+@app.route('/api/ocr-jobs/stats', methods=['GET'])
+def get_ocr_job_stats():
+    return jsonify(get_ocr_jobs().stats())
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-sent events for package and pickup changes (see event_bus.py for the types).
+    
+    The streams are served by event_server.py on EVENTS_BIND, so this redirects there with
+    the query string kept; the browser sends Last-Event-ID (or ?last_event_id=) along.
+    """
+    url = EVENTS_URL
+    if not url:
+        host = urlsplit('//' + request.host).hostname
+        if ':' in host:
+            host = f'[{host}]'
+        url = f"{request.scheme}://{host}:{EVENTS_BIND.rsplit(':', 1)[1]}/api/events"
+    if request.query_string:
+        url += '?' + request.query_string.decode('latin-1')
+    return redirect(url, code=307)
+
+@app.route('/api/events/stats', methods=['GET'])
+def get_event_stats():
+    return jsonify(dict(get_event_bus().stats(), **(event_server.stats() if event_server else {})))
+
+def get_ocr_pool():
+    """Start the batch OCR worker pool on first use"""
+    global ocr_pool
+    if ocr_pool is None:
+        ocr_pool = OCRPool(OCR_POOL_WORKERS, OCR_OPTIONS, PREPROCESS_OPTIONS)
+    return ocr_pool
+
+@app.route('/api/process-images', methods=['POST'])
+def process_images():
+    """Batch OCR: stream one NDJSON result line per label as each one finishes"""
+    data = request.json
+    images = data.get('images', [])
+    
+    if not images:
+        return jsonify({'success': False, 'message': 'No images provided'}), 400
+    
+    if OCR_SERVICE:
+        return Response(stream_with_context(scan_labels_in_service(images)), mimetype='application/x-ndjson')
+    
+    pool = get_ocr_pool()
+    
+    def result_line(index, lines, error):
+        if error is None:
+            try:
+                line = {'index': index, 'success': True, 'data': build_label_data(lines)}
+            except Exception as e:
+                line = {'index': index, 'success': False, 'error': str(e)}
+        else:
+            line = {'index': index, 'success': False, 'error': error}
+        return json.dumps(line) + '\n'
+    
+    def generate():
+        # Labels already in the OCR cache are answered straight away; the rest go to the pool
+        uncached = []
+        for index, image in enumerate(images):
+            fp = label_fingerprint(image)
+            lines = ocr_cache.get(fp)
+            if lines is None:
+                uncached.append((index, fp, image))
+            else:
+                yield result_line(index, lines, None)
+        
+        for i, lines, error in pool.recognize_unordered([image for _, _, image in uncached]):
+            index, fp, _ = uncached[i]
+            if error is None:
+                ocr_cache.put(fp, lines)
+            yield result_line(index, lines, error)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def scan_labels_in_service(images):
+    """NDJSON result lines for a batch handed to the OCR service, in the order they finish"""
+    jobs = get_ocr_jobs()
+    job_ids = [jobs.enqueue(image) for image in images]
+    indexes = {job_id: index for index, job_id in enumerate(job_ids)}
+    
+    for job_id, job in jobs.as_completed(job_ids, OCR_READY_TIMEOUT):
+        line = {'index': indexes[job_id], 'success': False}
+        if job and job['status'] == 'done':
+            line.update(success=True, data=job['result'])
+        elif job and job['status'] == 'failed':
+            line['error'] = job['error']
+        else:
+            line['error'] = 'OCR service is busy or not running, try again shortly'
+        yield json.dumps(line) + '\n'
+
+def build_label_data(lines):
+    """Parse OCR lines and fill in missing fields from the customer database"""
+    with metrics.stage('parse_label'):
+        parsed_data = parse_label(lines)
+    
+    # Warn at scan time if this label was already checked in
+    if parsed_data.get('tracking'):
+        db = get_db()
+        existing = find_package_by_tracking(db, parsed_data['tracking'])
+        db.close()
+        if existing:
+            parsed_data['duplicate_of'] = existing
+    
+    if parsed_data.get('name'):
+        customer = suggest_customer_by_name(parsed_data['name'])
+        if customer and not customer.get('profile_locked'):
+            if not parsed_data.get('phone'):
+                parsed_data['phone'] = customer.get('phone', '')
+            if not parsed_data.get('postal'):
+                parsed_data['postal'] = customer.get('postal', '')
+            if not parsed_data.get('address'):
+                parsed_data['address'] = f"{customer.get('street', '')}, {DEFAULT_CITY}, {DEFAULT_PROVINCE}"
+    
+    if 'postal' in parsed_data:
+        parsed_data['postal'] = normalize_postal_code(parsed_data.get('postal', ''))
+    if 'address' in parsed_data:
+        parsed_data['address'] = normalize_address(parsed_data.get('address', ''), parsed_data.get('postal', ''))
+    
+    return parsed_data
+
+def lookup_customer_by_name(name):
+    """Exact (normalised) name match, else None"""
+    try:
+        return get_customer_index().get_by_name(name)
+    except sqlite3.Error:
+        return None
+
+def suggest_customer_by_name(name):
+    """Exact name match, else a confident fuzzy match, else None: only for auto-filling
+    the scan form, which the user checks before saving"""
+    customer = lookup_customer_by_name(name)
+    if customer:
+        return customer
+    try:
+        match = confident_match(get_customer_index().match_name(name, limit=2), AUTO_FILL_CONFIDENCE, AUTO_FILL_MARGIN)
+    except sqlite3.Error:
+        return None
+    return match[0] if match else None
 
 @app.route('/api/packages/<int:package_id>/sign', methods=['POST'])
 def sign_package(package_id):
     data = request.json
-    signature = data.get('signature')
+    signature = store_signature_image(data.get('signature'))
     
-    db = get_db()
-    db.execute('''UPDATE packages 
-        SET signature_image = ?, status = 'signed', signed_at = CURRENT_TIMESTAMP
-        WHERE id = ?''',
-        (signature, package_id))
-    db.commit()
-    db.close()
+    with transaction() as db:
+        sign_package_row(db, package_id, signature)
+    get_tracking_cache().invalidate()
+    publish_package('package.signed', package_id)
     
     return jsonify({'success': True})
 
+def sign_package_row(db, package_id, signature):
+    """Mark a package signed for with a stored signature inside the caller's write transaction;
+    returns how many packages changed"""
+    archive_tier.restore(db, [package_id])
+    return db.execute('''UPDATE packages 
+        SET signature_image = ?, status = 'signed', signed_at = CURRENT_TIMESTAMP
+        WHERE id = ?''',
+        (signature, package_id)).rowcount
+
 @app.route('/api/packages/skip/<int:package_id>', methods=['POST'])
 def skip_package(package_id):
-    db = get_db()
-    db.execute("DELETE FROM packages WHERE id = ?", (package_id,))
-    db.commit()
-    db.close()
+    with transaction() as db:
+        archive_tier.restore(db, [package_id])
+        db.execute("DELETE FROM packages WHERE id = ?", (package_id,))
+    get_tracking_cache().invalidate()
+    get_event_bus().publish('package.deleted', {'id': package_id})
     
     return jsonify({'success': True})
 
-@app.route('/api/track/<tracking_number>', methods=['GET'])
-def track_package(tracking_number):
+def store_label_image(value):
+    """Blob URL for an uploaded label data URL, downsampled and re-encoded in the background"""
+    return blobs.store_image(value, lambda blob_hash: get_image_jobs().enqueue(blob_hash, 'label'))
+
+def store_signature_image(value):
+    """Blob URL for an uploaded signature data URL, made a cropped 1-bit PNG in the background"""
+    return blobs.store_image(value, lambda blob_hash: get_image_jobs().enqueue(blob_hash, 'signature'))
+
+def get_image_jobs():
+    """Start the image re-encoding workers on first use"""
+    global image_jobs
+    if image_jobs is None:
+        image_jobs = ImageJobQueue(reencode_image, IMAGE_JOB_WORKERS)
+        image_jobs.start()
+    return image_jobs
+
+def reencode_image(blob_hash, kind):
+    """Supersede a blob stored as sent with its re-encoding, and make its thumbnail ahead of the list views"""
+    compress = image_pipeline.compress_label if kind == 'label' else image_pipeline.compress_signature
+    data = blobs.get(blob_hash)
+    compressed = compress(data, IMAGE_OPTIONS)
+    if compressed != data:
+        new_hash = blobs.supersede(blob_hash, compressed)
+        # Every row that refers to the original moves over at once. Archived rows are
+        # rewritten in place: the picture they show doesn't change.
+        with transaction() as db:
+            for table, column in IMAGE_COLUMNS:
+                db.execute(f'UPDATE {table} SET {column} = ? WHERE {column} = ?',
+                           (URL_PREFIX + new_hash, URL_PREFIX + blob_hash))
+        blobs.remove(blob_hash)
+        blob_hash = new_hash
+    thumbnail_path(blob_hash)
+
+def thumbnail_path(blob_hash):
+    """Path of a stored image's thumbnail, made the first time; None if it isn't an image"""
+    return blobs.derived(blob_hash, f"thumb{IMAGE_OPTIONS['thumbnail_side']}",
+                         lambda data: image_pipeline.thumbnail(data, IMAGE_OPTIONS))
+
+@app.route('/api/image-jobs/stats', methods=['GET'])
+def get_image_job_stats():
+    return jsonify(get_image_jobs().stats())
+
+@app.route('/api/blobs/<blob_hash>', methods=['GET'])
+def get_blob(blob_hash):
+    """Serve a stored image; the bytes never change for a given hash, so cache it forever"""
+    if not blobs.exists(blob_hash):
+        return superseded_blob(blob_hash, '')
+    
+    return send_immutable(blobs.path(blob_hash), blob_hash)
+
+@app.route('/api/blobs/<blob_hash>/thumbnail', methods=['GET'])
+def get_blob_thumbnail(blob_hash):
+    """A small copy of a stored image for list views, made the first time it's asked for"""
+    if not blobs.exists(blob_hash):
+        return superseded_blob(blob_hash, '/thumbnail')
+    
+    path = thumbnail_path(blob_hash)
+    if path is None:
+        return jsonify({'error': 'Not an image'}), 404
+    return send_immutable(path, f"{blob_hash}-thumb{IMAGE_OPTIONS['thumbnail_side']}")
+
+def superseded_blob(blob_hash, suffix):
+    """Permanent redirect from a re-encoded upload's URL (still on pages loaded before) to its re-encoding"""
+    successor = blobs.successor(blob_hash) if is_valid_hash(blob_hash) else None
+    if not successor:
+        return jsonify({'error': 'Not found'}), 404
+    return redirect(URL_PREFIX + successor + suffix, 308)
+
+def send_immutable(path, etag):
+    with open(path, 'rb') as f:
+        mimetype = sniff_mimetype(f.read(16))
+    
+    response = send_file(path, mimetype=mimetype, etag=etag, max_age=31536000, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def load_tracking(tracking_number):
     db = get_db()
     package = db.execute('''SELECT courier, name, tracking, status, created_at, signed_at 
-        FROM packages WHERE tracking = ?''',
+        FROM all_packages WHERE tracking = ?''',
         (tracking_number,)).fetchone()
     db.close()
-    
-    if package:
-        return jsonify(dict(package))
-    return jsonify({'error': 'Package not found'}), 404
+    return dict(package) if package else None
+
+@app.route('/api/track/<tracking_number>', methods=['GET'])
+def track_package(tracking_number):
+    """Customer tracking lookup, served from the tracking cache; a refresh that sends back
+    the ETag or Last-Modified gets a 304 until the package changes"""
+    package, etag, last_modified = get_tracking_cache().lookup(tracking_number, load_tracking)
+    if package is None:
+        return jsonify({'error': 'Package not found'}), 404
+    
+    response = jsonify(package)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # The browser keeps the body but asks again on every refresh
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/api/track/cache-stats', methods=['GET'])
+def get_tracking_cache_stats():
+    return jsonify(get_tracking_cache().stats())
+
 @app.route('/api/users', methods=['GET'])
 def get_users():
     db = get_db()
@@ -519,11 +1185,42 @@ def add_customer():
         db.commit()
         customer_id = cursor.lastrowid
         db.close()
+        get_customer_index().invalidate()
         return jsonify({'success': True, 'id': customer_id})
     except sqlite3.IntegrityError:
         db.close()
         return jsonify({'success': False, 'message': 'Customer with this phone already exists'}), 400
 
+@app.route('/api/import/<kind>', methods=['POST'])
+def import_csv(kind):
+    """Import customers or packages from CSV (an uploaded 'file' or the request body); see bulk_import.py"""
+    if kind not in ('customers', 'packages'):
+        return jsonify({'success': False, 'message': 'Import customers or packages'}), 404
+    
+    upload = request.files.get('file')
+    data = upload.read() if upload else request.get_data()
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('cp1252', errors='replace')
+    if not text.strip():
+        return jsonify({'success': False, 'message': 'No CSV provided'}), 400
+    
+    importer = Importer(get_db, transaction, normalize_postal_code, normalize_address, find_or_create_customer)
+    try:
+        if kind == 'customers':
+            result = importer.import_customers(text)
+        else:
+            allow_duplicates = request.args.get('allow_duplicates') in ('1', 'true')
+            result = importer.import_packages(text, allow_duplicates)
+    except CSVFormatError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    finally:
+        get_customer_index().invalidate()
+        get_tracking_cache().invalidate()
+    
+    return jsonify(dict(result, success=True))
+
 @app.route('/api/customers/<int:customer_id>', methods=['PUT'])
 def update_customer(customer_id):
     data = request.json
@@ -536,6 +1233,7 @@ def update_customer(customer_id):
          data.get('street'), data.get('postal'), data.get('profile_locked', 0), customer_id))
     db.commit()
     db.close()
+    get_customer_index().invalidate()
     
     return jsonify({'success': True})
 
@@ -545,55 +1243,101 @@ def delete_customer(customer_id):
     db.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
     db.commit()
     db.close()
+    get_customer_index().invalidate()
     
     return jsonify({'success': True})
 
+@app.route('/api/customers/match', methods=['GET'])
+def match_customers():
+    """Ranked fuzzy matches for ?name=, for picking the right customer after OCR"""
+    name = request.args.get('name', '')
+    limit = max(1, min(request.args.get('limit', 5, type=int), 50))
+    
+    matches = get_customer_index().match_name(name, limit)
+    return jsonify({
+        'matches': [dict(customer, score=score) for customer, score in matches],
+        'auto_fill_threshold': AUTO_FILL_CONFIDENCE,
+    })
+
+@app.route('/api/customers/cache-stats', methods=['GET'])
+def get_customer_cache_stats():
+    return jsonify(get_customer_index().stats())
+
 @app.route('/api/customers/<int:customer_id>/packages', methods=['GET'])
 def get_customer_packages(customer_id):
     status = request.args.get('status', 'pending')
     
-    db = get_db()
-    packages = db.execute('''SELECT * FROM packages 
-        WHERE customer_id = ? AND status = ?
-        ORDER BY created_at DESC''',
-        (customer_id, status)).fetchall()
-    db.close()
-    
-    return jsonify([dict(p) for p in packages])
+    return list_packages('customer_id = ? AND status = ?', [customer_id, status], 'created_at',
+        default_limit=MAX_PAGE_SIZE, table='all_packages')
 
 @app.route('/api/pickups/bulk', methods=['POST'])
 def bulk_pickup():
+    """Release several of one customer's pending packages under one pickup record and signature.
+    
+    All or nothing: if any package isn't found, belongs to someone else or is no
+    longer pending, nothing is written and the offending ids are listed.
+    """
     data = request.json
-    package_ids = data.get('package_ids', [])
+    try:
+        with transaction() as db:
+            result = insert_pickup(db, data, lambda: store_signature_image(data.get('pickup_signature', '')))
+    except OperationError as e:
+        return jsonify(dict(e.body, success=False)), e.status
+    
+    get_tracking_cache().invalidate()
+    get_event_bus().publish('pickup.created', {'id': result['pickup_id'], 'customer_id': data.get('customer_id'),
+                                               'package_ids': result['package_ids']})
+    return jsonify({'success': True, 'pickup_id': result['pickup_id'], 'packages_updated': len(result['package_ids'])})
+
+def insert_pickup(db, data, store_signature):
+    """Record a bulk pickup inside the caller's write transaction.
+    
+    store_signature() returns the stored pickup signature's URL; it's only
+    called once the packages check out. Returns {'pickup_id', 'package_ids'};
+    raises OperationError (400, or 409 listing the packages that can't go).
+    """
     customer_id = data.get('customer_id')
     pickup_name = data.get('pickup_name', '')
     pickup_id_type = data.get('pickup_id_type', '')
     pickup_id_number = data.get('pickup_id_number', '')
-    pickup_signature = data.get('pickup_signature', '')
+    try:
+        package_ids = list(dict.fromkeys(int(i) for i in data.get('package_ids', [])))
+    except (TypeError, ValueError):
+        raise OperationError(400, {'message': 'package_ids must be package ids'})
     
     if not package_ids:
-        return jsonify({'success': False, 'message': 'No packages selected'}), 400
-    
-    db = get_db()
+        raise OperationError(400, {'message': 'No packages selected'})
+    if customer_id is None:
+        raise OperationError(400, {'message': 'customer_id is required'})
     
-    cursor = db.execute('''INSERT INTO pickups 
+    placeholders = ','.join('?' * len(package_ids))
+    # Checked inside the write transaction, so a package can't be released twice concurrently
+    found = {row['id']: row for row in db.execute(f'''SELECT id, customer_id, status FROM all_packages
+        WHERE id IN ({placeholders})''', package_ids)}
+    invalid = []
+    for package_id in package_ids:
+        row = found.get(package_id)
+        if row is None:
+            invalid.append({'id': package_id, 'error': 'not found'})
+        elif str(row['customer_id']) != str(customer_id):
+            invalid.append({'id': package_id, 'error': 'belongs to another customer'})
+        elif row['status'] != 'pending':
+            invalid.append({'id': package_id, 'error': f"already {row['status']}"})
+    if invalid:
+        raise OperationError(409, {'message': 'Some packages can\'t be released to this customer',
+                                   'invalid': invalid})
+    
+    pickup_id = db.execute('''INSERT INTO pickups 
         (customer_id, pickup_name, pickup_id_type, pickup_id_number, pickup_signature)
         VALUES (?, ?, ?, ?, ?)''',
-        (customer_id, pickup_name, pickup_id_type, pickup_id_number, pickup_signature))
-    pickup_id = cursor.lastrowid
+        (customer_id, pickup_name, pickup_id_type, pickup_id_number, store_signature())).lastrowid
     
-    placeholders = ','.join('?' * len(package_ids))
+    # The signature stays on the pickup; package reads resolve it through pickup_id
     db.execute(f'''UPDATE packages 
-        SET status = 'signed', 
-        signed_at = CURRENT_TIMESTAMP,
-        signature_image = ?
+        SET status = 'signed', signed_at = CURRENT_TIMESTAMP, pickup_id = ?
         WHERE id IN ({placeholders})''',
-        [pickup_signature] + package_ids)
-    
-    db.commit()
-    db.close()
-    
-    return jsonify({'success': True, 'pickup_id': pickup_id, 'packages_updated': len(package_ids)})
+        [pickup_id] + package_ids)
+    return {'pickup_id': pickup_id, 'package_ids': package_ids}
 
 @app.route('/api/pickups', methods=['GET'])
 def get_pickups():
@@ -607,96 +1351,184 @@ def get_pickups():
     
     return jsonify([dict(p) for p in pickups])
 
+def sync_update(db, data):
+    if not update_package_row(db, data['package_id'], data):
+        raise OperationError(404, {'message': f"Package {data['package_id']} not found"})
+    return {'id': data['package_id']}
+
+def sync_sign(db, data):
+    if not sign_package_row(db, data['package_id'], data.get('signature')):
+        raise OperationError(404, {'message': f"Package {data['package_id']} not found"})
+    return {'id': data['package_id']}
+
+def sync_pickup(db, data):
+    result = insert_pickup(db, data, lambda: data.get('pickup_signature', ''))
+    return dict(result, packages_updated=len(result['package_ids']))
+
+# What each /api/sync operation runs, and the image field it uploads
+SYNC_HANDLERS = {'create': insert_package, 'update': sync_update, 'sign': sync_sign, 'pickup': sync_pickup}
+SYNC_IMAGES = {'create': ('labelImage', store_label_image), 'sign': ('signature', store_signature_image),
+               'pickup': ('pickup_signature', store_signature_image)}
+
+@app.route('/api/sync', methods=['POST'])
+def sync_operations():
+    """Apply a scanning station's queued creates, updates, signatures and pickups in one
+    transaction with a result per operation; resending a batch changes nothing (see batch_sync.py)"""
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': 'Send a JSON object with an operations list'}), 400
+    values = data.get('operations')
+    if not isinstance(values, list) or not values:
+        return jsonify({'success': False, 'message': 'operations must be a non-empty list'}), 400
+    if len(values) > SYNC_MAX_OPERATIONS:
+        return jsonify({'success': False, 'message': f'At most {SYNC_MAX_OPERATIONS} operations per sync'}), 413
+    operations = [batch_sync.Operation(value) for value in values]
+    
+    # Images are stored before the write lock is taken, and not at all for operations already applied
+    db = get_db()
+    applied = batch_sync.applied_keys(db, operations)
+    db.close()
+    for operation in operations:
+        if operation.op in SYNC_IMAGES and operation.key not in applied:
+            field, store = SYNC_IMAGES[operation.op]
+            if isinstance(operation.data.get(field), str):
+                operation.data[field] = store(operation.data[field])
+    
+    with transaction() as db:
+        results = batch_sync.apply(db, operations, SYNC_HANDLERS)
+    
+    done = [(operation, result) for operation, result in zip(operations, results)
+            if result['status'] == 200 and not result.get('replayed')]
+    if done:
+        get_customer_index().invalidate()
+        get_tracking_cache().invalidate()
+    for operation, result in done:
+        if operation.op == 'pickup':
+            get_event_bus().publish('pickup.created', {'id': result['pickup_id'],
+                'customer_id': operation.data.get('customer_id'), 'package_ids': result['package_ids']})
+        else:
+            event = {'create': 'package.created', 'update': 'package.updated', 'sign': 'package.signed'}
+            publish_package(event[operation.op], result['id'])
+    
+    return jsonify({'success': True, 'results': results})
+
 # GRANDSTREAM UCM6302A INTEGRATION
-@app.route('/api/call/customer/<int:customer_id>', methods=['POST'])
-def call_customer(customer_id):
-    """Trigger automated call to customer via Grandstream UCM6302A"""
-    try:
-        db = get_db()
-        customer = db.execute("SELECT * FROM customers WHERE id = ?", (customer_id,)).fetchone()
-        db.close()
-        
-        if not customer or not customer['phone']:
-            return jsonify({'success': False, 'message': 'Customer or phone not found'}), 404
-        
-        # Clean phone number (remove formatting)
-        phone = re.sub(r'[^0-9]', '', customer['phone'])
-        
-        # Grandstream API call to initiate outbound call with recording
+def get_call_dispatcher():
+    """Start the call dispatcher workers on first use"""
+    global call_dispatcher
+    if call_dispatcher is None:
         # Note: Adjust API endpoint and parameters based on your Grandstream model/firmware
-        api_url = f"http://{GRANDSTREAM_IP}/api/make_call"
-        
-        response = requests.post(
-            api_url,
+        call_dispatcher = CallDispatcher(
+            get_db,
+            f"http://{GRANDSTREAM_IP}/api/make_call",
             auth=(GRANDSTREAM_USERNAME, GRANDSTREAM_PASSWORD),
-            json={
-                'extension': GRANDSTREAM_EXTENSION,
-                'destination': phone,
-                'recording_id': GRANDSTREAM_RECORDING_ID
-            },
-            timeout=10
+            params={'extension': GRANDSTREAM_EXTENSION, 'recording_id': GRANDSTREAM_RECORDING_ID},
+            workers=CALL_WORKERS,
+            min_interval=CALL_MIN_INTERVAL,
+            timeout=CALL_TIMEOUT
         )
-        
-        if response.status_code == 200:
-            return jsonify({'success': True, 'message': f'Call initiated to {customer["name"]}'})
-        else:
-            return jsonify({'success': False, 'message': 'Failed to initiate call', 'error': response.text}), 500
+        if not OCR_SERVICE:
+            call_dispatcher.start()
+    return call_dispatcher
+
+def call_response(call):
+    response = {'call_id': call['id'], 'customer_id': call['customer_id'], 'name': call['name'],
+                'status': call['status'], 'attempts': call['attempts']}
+    if call['error']:
+        response['error'] = call['error']
+    return response
+
+@app.route('/api/call/customer/<int:customer_id>', methods=['POST'])
+def call_customer(customer_id):
+    """Queue an automated call to the customer; poll /api/calls/<call_id> for the outcome"""
+    db = get_db()
+    customer = db.execute("SELECT id, name, phone FROM customers WHERE id = ?", (customer_id,)).fetchone()
+    db.close()
     
-    except requests.exceptions.RequestException as e:
-        return jsonify({'success': False, 'message': 'Connection error to Grandstream', 'error': str(e)}), 500
+    if not customer or not customer['phone']:
+        return jsonify({'success': False, 'message': 'Customer or phone not found'}), 404
+    
+    # Clean phone number (remove formatting)
+    phone = re.sub(r'[^0-9]', '', customer['phone'])
+    call_id, = get_call_dispatcher().enqueue([(customer_id, customer['name'], phone)])
+    
+    return jsonify({'success': True, 'call_id': call_id, 'status': 'queued',
+                    'message': f'Call to {customer["name"]} queued'}), 202
 
 @app.route('/api/call/bulk', methods=['POST'])
 def call_bulk_customers():
-    """Trigger automated calls to multiple customers (after bulk package processing)"""
+    """Queue automated calls to multiple customers (after bulk package processing); poll /api/calls?batch=<batch_id>"""
     data = request.json
     customer_ids = data.get('customer_ids', [])
     
     if not customer_ids:
         return jsonify({'success': False, 'message': 'No customers selected'}), 400
     
-    results = []
     db = get_db()
+    customers = {}
+    for i in range(0, len(customer_ids), 500):
+        chunk = customer_ids[i:i + 500]
+        for row in db.execute(f"SELECT id, name, phone FROM customers WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+            customers[str(row['id'])] = row
+    db.close()
     
-    for customer_id in customer_ids:
-        customer = db.execute("SELECT * FROM customers WHERE id = ?", (customer_id,)).fetchone()
-        
+    calls = []
+    skipped = []
+    for customer_id in dict.fromkeys(customer_ids):
+        customer = customers.get(str(customer_id))
         if customer and customer['phone']:
-            phone = re.sub(r'[^0-9]', '', customer['phone'])
-            
-            try:
-                api_url = f"http://{GRANDSTREAM_IP}/api/make_call"
-                response = requests.post(
-                    api_url,
-                    auth=(GRANDSTREAM_USERNAME, GRANDSTREAM_PASSWORD),
-                    json={
-                        'extension': GRANDSTREAM_EXTENSION,
-                        'destination': phone,
-                        'recording_id': GRANDSTREAM_RECORDING_ID
-                    },
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    results.append({'customer_id': customer_id, 'name': customer['name'], 'success': True})
-                else:
-                    results.append({'customer_id': customer_id, 'name': customer['name'], 'success': False, 'error': 'API error'})
-            
-            except:
-                results.append({'customer_id': customer_id, 'name': customer['name'], 'success': False, 'error': 'Connection error'})
+            calls.append((customer_id, customer['name'], re.sub(r'[^0-9]', '', customer['phone'])))
         else:
-            results.append({'customer_id': customer_id, 'success': False, 'error': 'No phone number'})
+            skipped.append({'customer_id': customer_id, 'error': 'No phone number'})
     
-    db.close()
+    batch_id = secrets.token_hex(8)
+    call_ids = get_call_dispatcher().enqueue(calls, batch_id) if calls else []
     
-    successful = sum(1 for r in results if r.get('success'))
     return jsonify({
         'success': True,
-        'total': len(results),
-        'successful': successful,
-        'failed': len(results) - successful,
-        'results': results
-    })
+        'batch_id': batch_id,
+        'total': len(calls) + len(skipped),
+        'queued': len(calls),
+        'skipped': skipped,
+        'calls': [{'call_id': call_id, 'customer_id': customer_id, 'name': name, 'status': 'queued'}
+                  for call_id, (customer_id, name, _) in zip(call_ids, calls)]
+    }), 202
+
+@app.route('/api/calls', methods=['GET'])
+def get_calls():
+    """Status of every call in a bulk request (?batch=<batch_id>)"""
+    batch_id = request.args.get('batch')
+    if not batch_id:
+        return jsonify({'success': False, 'message': 'batch is required'}), 400
+    
+    calls = get_call_dispatcher().batch(batch_id)
+    counts = {}
+    for call in calls:
+        counts[call['status']] = counts.get(call['status'], 0) + 1
+    return jsonify({'success': True, 'batch_id': batch_id, 'counts': counts,
+                    'calls': [call_response(call) for call in calls]})
+
+@app.route('/api/calls/<call_id>', methods=['GET'])
+def get_call(call_id):
+    """Call status; ?wait=N long-polls up to N seconds (max 30) for it to finish"""
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    call = get_call_dispatcher().get(call_id, wait=wait)
+    
+    if not call:
+        return jsonify({'success': False, 'message': 'Call not found'}), 404
+    return jsonify(dict(call_response(call), success=True))
+
+@app.route('/api/calls/stats', methods=['GET'])
+def get_call_stats():
+    return jsonify(get_call_dispatcher().stats())
 
 if __name__ == '__main__':
+    # Development server; production serving is wsgi.py / gunicorn.conf.py
     init_db()
+    # With the reloader on, only the serving child process should load OCR and run jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ocr_engine.start()
+        get_ocr_jobs()
+        get_call_dispatcher()
+        start_event_server()
     app.run(host='127.0.0.1', port=5000, debug=True)
@@ -0,0 +1,98 @@
+"""Deployment settings from environment variables or a config file.
+
+server.py keeps its defaults as UPPER_CASE module constants (DATABASE,
+GRANDSTREAM_IP, WORKERS, ...). override() replaces them before anything
+is built from them; for each constant the first of these that is set wins:
+
+  1. an environment variable PACKAGES_<NAME>, e.g.
+     PACKAGES_DATABASE=/srv/packages/packages.db
+  2. <name> in the [packages] section of the INI file named by
+     PACKAGES_CONFIG, e.g. grandstream_ip = 192.168.1.20
+     (see packages.example.ini)
+
+Values are converted to the type of the default: int, float, bool (1/0,
+true/false, yes/no, on/off), str, or JSON for dicts such as OCR_OPTIONS.
+A key in the file that isn't a setting, or a value that doesn't convert,
+stops startup with a SettingsError instead of being quietly ignored.
+"""
+import configparser
+import json
+import os
+
+ENV_PREFIX = 'PACKAGES_'
+CONFIG_ENV = 'PACKAGES_CONFIG'
+SECTION = 'packages'
+
+_BOOLEANS = {'1': True, 'true': True, 'yes': True, 'on': True,
+             '0': False, 'false': False, 'no': False, 'off': False}
+
+
+class SettingsError(ValueError):
+    """A setting in the environment or config file that can't be used"""
+
+
+def override(namespace, environ=None):
+    """Replace settings in namespace (a module's globals()) from the config file and environment.
+
+    Returns {name: where the value came from} for each setting replaced.
+    """
+    environ = os.environ if environ is None else environ
+    names = {name for name, value in namespace.items() if _is_setting(name, value)}
+
+    values = {}
+    path = environ.get(CONFIG_ENV)
+    if path:
+        for key, value in read_file(path).items():
+            if key.upper() not in names:
+                raise SettingsError(f'{path}: unknown setting {key!r} in [{SECTION}]')
+            values[key.upper()] = (value, path)
+    for name in names:
+        if ENV_PREFIX + name in environ:
+            values[name] = (environ[ENV_PREFIX + name], ENV_PREFIX + name)
+
+    sources = {}
+    for name, (value, source) in values.items():
+        try:
+            namespace[name] = convert(value, namespace[name])
+        except ValueError as e:
+            raise SettingsError(f'{source}: {name}: {e}') from None
+        sources[name] = source
+    return sources
+
+
+def read_file(path):
+    """The [packages] section of an INI file as {lower-case key: raw value}"""
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        with open(path, encoding='utf-8') as f:
+            parser.read_file(f)
+    except (OSError, configparser.Error) as e:
+        raise SettingsError(f'{path}: {e}') from None
+    return dict(parser[SECTION]) if parser.has_section(SECTION) else {}
+
+
+def convert(value, default):
+    """A raw string as the type of default"""
+    value = value.strip()
+    if isinstance(default, bool):
+        if value.lower() not in _BOOLEANS:
+            raise ValueError(f'expected true or false, got {value!r}')
+        return _BOOLEANS[value.lower()]
+    if isinstance(default, dict):
+        try:
+            parsed = json.loads(value)
+        except json.JSONDecodeError:
+            parsed = None
+        if not isinstance(parsed, dict):
+            raise ValueError(f'expected a JSON object, got {value!r}')
+        return parsed
+    if isinstance(default, (int, float)):
+        try:
+            return type(default)(value)
+        except ValueError:
+            raise ValueError(f'expected a number, got {value!r}') from None
+    return value
+
+
+def _is_setting(name, value):
+    return name.isupper() and not name.startswith('_') and isinstance(value, (bool, int, float, str, dict))
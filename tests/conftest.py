@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server  # noqa: E402
+
+
+# server's lazily started singletons; each test gets its own and the originals are put back after
+SINGLETONS = ('db_pool', 'customer_index', 'tracking_cache', 'event_bus', 'event_server',
+              'image_jobs', 'ocr_jobs', 'ocr_pool', 'call_dispatcher')
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Test client on a fresh packages.db and blob store under tmp_path"""
+    for name in SINGLETONS:
+        monkeypatch.setattr(server, name, None)
+    monkeypatch.setattr(server, 'DATABASE', str(tmp_path / 'packages.db'))
+    monkeypatch.setattr(server.blobs, 'root', str(tmp_path / 'blobs'))
+    server.init_db()
+    yield server.app.test_client()
+    server.shutdown(timeout=5)
+
+
+def add_package(client, tracking, **fields):
+    """POST /api/packages; returns the new package's id"""
+    package = {'courier': 'UPS', 'name': 'Jane Roe', 'tracking': tracking, 'phone': '7055550000',
+               'postal': 'P5A 1X1'}
+    response = client.post('/api/packages', json=dict(package, **fields))
+    assert response.status_code == 200, response.json
+    return response.json['id']
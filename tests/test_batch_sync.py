@@ -0,0 +1,60 @@
+import sqlite3
+
+import server
+
+
+def sync(client, *operations):
+    response = client.post('/api/sync', json={'operations': list(operations)})
+    assert response.status_code == 200, response.json
+    return response.json['results']
+
+
+def create(key, tracking, **fields):
+    return dict({'key': key, 'op': 'create', 'courier': 'UPS', 'name': 'Jane Roe', 'tracking': tracking,
+                 'phone': '7055550000', 'postal': 'P5A 1X1'}, **fields)
+
+
+def test_resent_batch_is_replayed_without_changes(client):
+    operations = [create('st2-1', '1Z0000000001'),
+                  {'key': 'st2-2', 'op': 'sign', 'package_key': 'st2-1', 'signature': ''}]
+    first = sync(client, *operations)
+    assert [r['status'] for r in first] == [200, 200]
+
+    again = sync(client, *operations)
+    assert all(r['replayed'] for r in again)
+    assert again[0]['id'] == first[0]['id']
+    db = sqlite3.connect(server.DATABASE)
+    assert db.execute('SELECT COUNT(*) FROM packages').fetchone()[0] == 1
+    assert db.execute('SELECT COUNT(*) FROM events').fetchone()[0] == 2
+
+
+def test_key_reused_for_a_different_operation_is_refused(client):
+    sync(client, create('st2-1', '1Z0000000001'))
+    result, = sync(client, create('st2-1', '1Z0000000002'))
+    assert result['status'] == 422 and not result['success']
+    db = sqlite3.connect(server.DATABASE)
+    assert db.execute('SELECT tracking FROM packages').fetchall() == [('1Z0000000001',)]
+
+
+def test_failed_operation_can_be_corrected_and_resent(client):
+    sync(client, create('st2-1', '1Z0000000001'))
+    failed, = sync(client, create('st2-2', '1Z0000000001'))
+    assert failed['status'] != 200 and not failed.get('replayed')
+
+    # Resent as is it fails again rather than replaying, and corrected it goes in
+    assert sync(client, create('st2-2', '1Z0000000001'))[0]['status'] == failed['status']
+    corrected, = sync(client, create('st2-2', '1Z0000000002'))
+    assert corrected['status'] == 200 and not corrected.get('replayed')
+
+
+def test_sign_failing_before_its_create_succeeds_once_resent_after_it(client):
+    sign = {'key': 'st2-2', 'op': 'sign', 'package_key': 'st2-1', 'signature': ''}
+    assert sync(client, sign)[0]['status'] == 409
+    assert [r['status'] for r in sync(client, create('st2-1', '1Z0000000001'), sign)] == [200, 200]
+
+
+def test_body_that_isnt_an_object_is_a_bad_request(client):
+    for body in ('[{"key": "st2-1", "op": "create"}]', '"operations"', 'null'):
+        response = client.post('/api/sync', data=body, content_type='application/json')
+        assert response.status_code == 400
+        assert not response.json['success']
@@ -0,0 +1,60 @@
+import bulk_import
+import server
+
+
+def import_packages(client, text):
+    response = client.post('/api/import/packages', data=text.encode(), content_type='text/csv')
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def test_unknown_statuses_are_rejected_and_signed_rows_get_signed_at(client):
+    result = import_packages(client, '''courier,name,tracking,phone,status,created_at,signed_at
+UPS,Ann Lee,T1,7055550001,signed,2024-03-01 10:00:00,
+UPS,Ann Lee,T2,7055550001,Signed,2024-03-02 10:00:00,2024-03-05 09:00:00
+UPS,Ann Lee,T3,7055550001,delivered,2024-03-03 10:00:00,
+UPS,Ann Lee,T4,7055550001,,2024-03-04 10:00:00,
+''')
+    assert (result['imported'], result['skipped']) == (3, 1)
+    assert result['errors'][0]['row'] == 4
+    assert 'delivered' in result['errors'][0]['error']
+
+    db = server.get_db()
+    rows = {row['tracking']: (row['status'], row['signed_at'])
+            for row in db.execute('SELECT tracking, status, signed_at FROM packages')}
+    db.close()
+    assert rows == {'T1': ('signed', '2024-03-01 10:00:00'), 'T2': ('signed', '2024-03-05 09:00:00'),
+                    'T4': ('pending', None)}
+
+
+def test_packages_link_customers_as_create_package_does(client):
+    # A customer on file with a differently written phone, and one known only by name
+    by_phone = client.post('/api/customers', json={'name': 'Marie Tremblay', 'phone': '(705) 555-0101'}).json['id']
+    by_name = client.post('/api/customers', json={'name': 'Luc Gagnon'}).json['id']
+
+    result = import_packages(client, '''courier,name,tracking,phone
+UPS,Marie Tremblay,T1,705-555-0101
+UPS,Luc Gagnon,T2,
+UPS,Sarah Chen,T3,7055550303
+UPS,Sarah Chen,T4,705 555 0303
+''')
+    assert result['imported'] == 4
+    assert result['customers_created'] == 1
+
+    db = server.get_db()
+    customers = dict(db.execute('SELECT tracking, customer_id FROM packages'))
+    db.close()
+    assert customers['T1'] == by_phone
+    assert customers['T2'] == by_name
+    assert customers['T3'] == customers['T4'] not in (None, by_phone, by_name)
+
+
+def test_batches_share_customers_by_phone_digits(client, monkeypatch):
+    monkeypatch.setattr(bulk_import, 'BATCH_SIZE', 1)
+    # Loaded just now, as on a running server, so it isn't reread between the batches
+    server.get_customer_index().customers()
+    result = import_packages(client, '''courier,name,tracking,phone
+UPS,Sarah Chen,T1,705-555-0303
+UPS,S. Chen,T2,(705) 555-0303
+''')
+    assert (result['imported'], result['customers_created']) == (2, 1)
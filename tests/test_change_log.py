@@ -0,0 +1,41 @@
+import sqlite3
+
+import change_log
+import server
+from customer_cache import CustomerIndex
+from tracking_cache import TrackingCache
+
+
+def test_caches_follow_writes_from_another_connection(client):
+    customers = CustomerIndex(server.get_db)
+    tracking = TrackingCache(server.get_db)
+    assert customers.get_by_phone('7055550000') is None
+    assert tracking.lookup('1Z0000000001', server.load_tracking)[0] is None
+
+    db = sqlite3.connect(server.DATABASE)
+    db.execute("INSERT INTO customers (name, phone) VALUES ('Jane Roe', '7055550000')")
+    db.execute("""INSERT INTO packages (courier, name, tracking, postal, status)
+        VALUES ('UPS', 'Jane Roe', '1Z0000000001', 'P5A 1X1', 'pending')""")
+    db.commit()
+    customers.invalidate()
+    tracking.invalidate()
+    assert customers.get_by_phone('7055550000')['name'] == 'Jane Roe'
+    assert tracking.lookup('1Z0000000001', server.load_tracking)[0]['status'] == 'pending'
+    assert customers.stats()['refreshes'] == 1 and tracking.stats()['version'] > 0
+
+
+def test_reader_trims_the_log_and_starts_over_when_trimmed_past(client, monkeypatch):
+    monkeypatch.setattr(change_log, 'CHANGE_LOG_KEEP', 2)
+    customers = CustomerIndex(server.get_db)
+    customers.customers()
+    db = sqlite3.connect(server.DATABASE)
+    for i in range(6):
+        db.execute('INSERT INTO customers (name, phone) VALUES (?, ?)', (f'Customer {i}', f'70555500{i:02d}'))
+    db.commit()
+
+    other = CustomerIndex(server.get_db)
+    other.customers()
+    assert db.execute('SELECT COUNT(*) FROM customer_changes').fetchone()[0] == 2
+    customers.invalidate()
+    assert len(customers.customers()) == 6
+    assert customers.stats()['reloads'] == 2
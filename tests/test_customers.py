@@ -0,0 +1,23 @@
+import sqlite3
+
+import server
+from conftest import add_package
+
+
+def customer_of(package_id):
+    db = sqlite3.connect(server.DATABASE)
+    return db.execute('SELECT customer_id FROM packages WHERE id = ?', (package_id,)).fetchone()[0]
+
+
+def test_saving_links_customers_by_exact_name_or_phone_only(client):
+    margaret = customer_of(add_package(client, '1Z0000000001', name='Margaret Wilkinson', phone='7055550000'))
+    assert customer_of(add_package(client, '1Z0000000002', name='margaret wilkinson', phone='')) == margaret
+    assert customer_of(add_package(client, '1Z0000000003', name='Someone Else', phone='705-555-0000')) == margaret
+    # Close enough for the fuzzy matcher to auto-fill, but a different person
+    assert customer_of(add_package(client, '1Z0000000004', name='Margarete Wilkinson', phone='')) != margaret
+
+
+def test_fuzzy_matches_only_suggest_auto_fill(client):
+    add_package(client, '1Z0000000001', name='Margaret Wilkinson', phone='7055550000')
+    assert server.lookup_customer_by_name('Margaret Wi1kinson') is None
+    assert server.suggest_customer_by_name('Margaret Wi1kinson')['phone'] == '7055550000'
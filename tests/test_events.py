@@ -0,0 +1,76 @@
+import socket
+import threading
+import time
+
+import server
+from conftest import add_package
+
+
+def read_until(sock, text, timeout=5, data=b''):
+    """Text received on sock (after data) until text shows up"""
+    sock.settimeout(timeout)
+    while text.encode() not in data:
+        chunk = sock.recv(65536)
+        assert chunk, data
+        data += chunk
+    return data.decode()
+
+
+def subscribe(port, last_event_id=None):
+    """(socket, text received so far) of a new stream"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    header = f'Last-Event-ID: {last_event_id}\r\n' if last_event_id is not None else ''
+    sock.sendall(f'GET /api/events HTTP/1.1\r\nHost: localhost\r\n{header}\r\n'.encode())
+    received = read_until(sock, 'retry: ')
+    assert received.startswith('HTTP/1.1 200 OK')
+    return sock, received
+
+
+def test_one_thread_serves_every_stream(client, monkeypatch):
+    monkeypatch.setattr(server, 'EVENTS_BIND', '127.0.0.1:0')
+    events = server.start_event_server()
+    try:
+        port = events.listener.getsockname()[1]
+        threads = len([t for t in threading.enumerate() if t.name == 'event-server'])
+        streams = [subscribe(port) for _ in range(50)]
+        assert server.get_event_bus().subscribers == 50
+
+        add_package(client, '1Z0000000001')
+        for stream, received in streams:
+            assert 'event: package.created' in read_until(stream, '1Z0000000001', data=received.encode())
+        assert len([t for t in threading.enumerate() if t.name == 'event-server']) == threads
+
+        # A reconnecting client gets what it missed
+        reconnected, received = subscribe(port, last_event_id=0)
+        assert 'id: 1\n' in read_until(reconnected, '1Z0000000001', data=received.encode())
+
+        for stream, _ in streams:
+            stream.close()
+        deadline = time.monotonic() + 5
+        while server.get_event_bus().subscribers > 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert server.get_event_bus().subscribers == 1
+        reconnected.close()
+    finally:
+        server.close_event_streams()
+
+
+def test_app_redirects_to_the_event_listener(client, monkeypatch):
+    monkeypatch.setattr(server, 'EVENTS_BIND', '0.0.0.0:5001')
+    response = client.get('/api/events?last_event_id=7')
+    assert response.status_code == 307
+    assert response.headers['Location'] == 'http://localhost:5001/api/events?last_event_id=7'
+
+    monkeypatch.setattr(server, 'EVENTS_URL', 'https://packages.example/api/events')
+    assert client.get('/api/events').headers['Location'] == 'https://packages.example/api/events'
+
+
+def test_other_paths_are_not_found(client, monkeypatch):
+    monkeypatch.setattr(server, 'EVENTS_BIND', '127.0.0.1:0')
+    events = server.start_event_server()
+    try:
+        sock = socket.create_connection(('127.0.0.1', events.listener.getsockname()[1]))
+        sock.sendall(b'GET /api/packages HTTP/1.1\r\n\r\n')
+        assert read_until(sock, 'Not Found').startswith('HTTP/1.1 404')
+    finally:
+        server.close_event_streams()
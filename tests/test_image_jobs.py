@@ -0,0 +1,48 @@
+import base64
+import hashlib
+import sqlite3
+
+import cv2
+import numpy as np
+
+import server
+from conftest import add_package
+
+
+def data_url(img, ext, mimetype):
+    return f'data:{mimetype};base64,' + base64.b64encode(cv2.imencode(ext, img)[1].tobytes()).decode('ascii')
+
+
+def test_uploads_are_stored_as_sent_and_re_encoded_in_the_background(client):
+    label = np.full((2400, 1800, 3), 255, np.uint8)
+    cv2.putText(label, 'SHIP TO JANE ROE', (100, 400), cv2.FONT_HERSHEY_SIMPLEX, 4, (0, 0, 0), 8)
+    package_id = add_package(client, '1Z0000000001', labelImage=data_url(label, '.png', 'image/png'))
+    uploaded_url = '/api/blobs/' + hashlib.sha256(cv2.imencode('.png', label)[1].tobytes()).hexdigest()
+    signature = np.zeros((200, 800, 4), np.uint8)
+    cv2.line(signature, (100, 100), (600, 120), (0, 0, 0, 255), 3)
+    client.post(f'/api/packages/{package_id}/sign', json={'signature': data_url(signature, '.png', 'image/png')})
+
+    assert server.get_image_jobs().wait(60)
+    package = client.get('/api/packages/archived?fields=all').json[0]
+    label_url, signature_url = package['label_image'], package['signature_image']
+    assert label_url.startswith('/api/blobs/') and signature_url.startswith('/api/blobs/')
+
+    # The re-encoding is a blob of its own, and the upload's URL leads to it
+    assert label_url != uploaded_url
+    response = client.get(label_url)
+    assert response.mimetype == 'image/webp'
+    assert hashlib.sha256(response.data).hexdigest() == response.headers['ETag'].strip('"') == label_url.rsplit('/', 1)[1]
+    assert client.get(uploaded_url).headers['Location'].endswith(label_url)
+    assert client.get(uploaded_url + '/thumbnail').headers['Location'].endswith(label_url + '/thumbnail')
+    assert max(server.image_pipeline.decode(response.data).shape[:2]) == server.IMAGE_OPTIONS['label_max_side']
+    signature = server.image_pipeline.decode(client.get(signature_url).data)
+    assert signature.shape[0] < 200 and signature.shape[1] < 800
+    assert server.thumbnail_path(label_url.rsplit('/', 1)[1]) is not None
+
+    # The original upload still finds its blob, and isn't queued again
+    done = server.get_image_jobs().stats()['done']
+    other = add_package(client, '1Z0000000002', labelImage=data_url(label, '.png', 'image/png'))
+    db = sqlite3.connect(server.DATABASE)
+    assert db.execute('SELECT label_image FROM packages WHERE id = ?', (other,)).fetchone()[0] == label_url
+    assert server.get_image_jobs().wait(60)
+    assert server.get_image_jobs().stats()['done'] == done
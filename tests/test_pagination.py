@@ -0,0 +1,54 @@
+import sqlite3
+
+import migrations
+import server
+from conftest import add_package
+
+
+def pages(client, url):
+    """Ids of every package in a paginated list, following X-Next-Cursor"""
+    ids, cursor = [], None
+    while True:
+        response = client.get(url, query_string={'limit': 2, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids += [p['id'] for p in response.json]
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return ids
+
+
+def test_archive_pages_include_packages_signed_every_way(client):
+    ids = [add_package(client, f'1Z{i:010d}') for i in range(7)]
+    client.post(f'/api/packages/{ids[0]}/sign', json={'signature': ''})
+    client.post(f'/api/packages/{ids[1]}/sign', json={'signature': ''})
+    client.put(f'/api/packages/{ids[2]}', json={'courier': 'UPS', 'name': 'Jane Roe', 'tracking': '1Z0000000002',
+                                                 'postal': 'P5A 1X1', 'status': 'signed'})
+    client.post('/api/packages/bulk-status', json={'package_ids': [ids[3], ids[4]], 'status': 'signed'})
+    client.post('/api/pickups/bulk', json={'customer_id': 1, 'package_ids': [ids[5]]})
+
+    assert sorted(pages(client, '/api/packages/archived')) == ids[:6]
+
+
+def test_signed_at_kept_when_a_signed_package_is_edited(client):
+    package_id = add_package(client, '1Z0000000001')
+    client.post(f'/api/packages/{package_id}/sign', json={'signature': ''})
+    db = sqlite3.connect(server.DATABASE)
+    db.execute("UPDATE packages SET signed_at = '2020-01-01 10:00:00'")
+    db.commit()
+    client.put(f'/api/packages/{package_id}', json={'courier': 'UPS', 'name': 'Jane Roe',
+                                                    'tracking': '1Z0000000001', 'postal': 'P5A 1X1', 'status': 'signed'})
+    assert db.execute('SELECT signed_at FROM packages').fetchone()[0] == '2020-01-01 10:00:00'
+    db.close()
+
+
+def test_migration_backfills_signed_packages_without_signed_at(client):
+    ids = [add_package(client, f'1Z{i:010d}') for i in range(5)]
+    db = sqlite3.connect(server.DATABASE)
+    db.execute("UPDATE packages SET status = 'signed', signed_at = CASE WHEN id % 2 THEN signed_at ELSE "
+               "CURRENT_TIMESTAMP END")
+    db.commit()
+    migrations._backfill_signed_at(db)
+    db.commit()
+    db.close()
+
+    assert sorted(pages(client, '/api/packages/archived')) == ids
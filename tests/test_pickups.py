@@ -0,0 +1,36 @@
+import sqlite3
+
+import migrations
+import server
+from conftest import add_package
+
+
+def test_bulk_pickups_link_the_packages_they_released(client):
+    first = [add_package(client, '1Z0000000001'), add_package(client, '1Z0000000002')]
+    second = [add_package(client, '1Z0000000003')]
+    db = sqlite3.connect(server.DATABASE)
+    customer_id = db.execute('SELECT customer_id FROM packages WHERE id = ?', (first[0],)).fetchone()[0]
+    # Two pickups with the same (empty) signature
+    pickups = [client.post('/api/pickups/bulk', json={'customer_id': customer_id, 'package_ids': ids,
+                                                      'pickup_signature': ''}).json['pickup_id']
+               for ids in (first, second)]
+    for pickup_id, ids in zip(pickups, (first, second)):
+        placeholders = ','.join('?' * len(ids))
+        assert db.execute(f'SELECT DISTINCT pickup_id FROM packages WHERE id IN ({placeholders})',
+                          ids).fetchall() == [(pickup_id,)]
+
+
+def test_pickup_reference_leaves_earlier_pickups_unlinked(tmp_path, monkeypatch):
+    db = sqlite3.connect(str(tmp_path / 'packages.db'))
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:9])
+    migrations.migrate(db)
+    db.execute("INSERT INTO customers (id, name, phone) VALUES (1, 'Jane Roe', '7055550000')")
+    # Two earlier pickups that happen to share a signature, each copied onto its package
+    db.executemany("INSERT INTO pickups (id, customer_id, pickup_signature) VALUES (?, 1, 'sig')", [(1,), (2,)])
+    db.executemany('''INSERT INTO packages (courier, name, tracking, postal, customer_id, status, signature_image)
+        VALUES ('UPS', 'Jane Roe', ?, 'P5A 1X1', 1, 'signed', 'sig')''', [('1Z0000000001',), ('1Z0000000002',)])
+    db.commit()
+
+    monkeypatch.undo()
+    migrations.migrate(db)
+    assert db.execute('SELECT pickup_id, signature_image FROM packages').fetchall() == [(None, 'sig')] * 2
@@ -0,0 +1,103 @@
+"""In-process cache of /api/track lookups.
+
+customer_tracking.html polls /api/track/<tracking> on every refresh, so
+the answer for each tracking number is kept in a bounded LRU with an
+ETag and Last-Modified; a browser that sends them back gets a 304 without
+the database being touched. Triggers on packages append the tracking
+number of every insert, delete and visible change to tracking_changes
+(see migrations.py), and the cache drops those entries before answering,
+so status changes from this process, other worker processes and other
+tools all show up (see change_log.py). Entries also expire after max_age
+seconds in case the log was trimmed past them.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from change_log import ChangeLogReader
+
+
+def etag(package):
+    """Strong validator for a tracking response body, or None for a not-found"""
+    if package is None:
+        return None
+    body = json.dumps(package, sort_keys=True, default=str)
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:20]
+
+
+class TrackingCache:
+    def __init__(self, connect, max_entries=10000, max_age=300):
+        """connect() returns a sqlite3 connection"""
+        self.connect = connect
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # tracking -> (package dict or None, etag, last_modified, loaded at)
+        self._entries = OrderedDict()
+        self._log = ChangeLogReader(connect, 'tracking_changes', 'tracking')
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, tracking, load):
+        """(package or None, etag, last_modified) for tracking; load(tracking) reads it on a miss.
+
+        The package dict is shared with other requests and must not be modified.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._log.poll(self._reload, self._apply_changes)
+            entry = self._entries.get(tracking)
+            if entry is not None and now - entry[3] < self.max_age:
+                self._entries.move_to_end(tracking)
+                self.hits += 1
+                return entry[:3]
+            self.misses += 1
+            version = self._log.version
+
+        package = load(tracking)
+        entry = (package, etag(package), datetime.now(timezone.utc).replace(microsecond=0), now)
+        with self._lock:
+            # Skip caching if the log moved on while this was loading: the change may have
+            # committed after the read, and its invalidation has already been applied
+            if version == self._log.version:
+                self._entries[tracking] = entry
+                self._entries.move_to_end(tracking)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return entry[:3]
+
+    def invalidate(self):
+        """Check the change log on the next lookup instead of waiting for CHECK_INTERVAL"""
+        self._log.invalidate()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'version': self._log.version,
+            }
+
+    def _reload(self, db):
+        self._entries.clear()
+
+    def _apply_changes(self, db, changed):
+        for tracking in changed:
+            if self._entries.pop(tracking, None) is not None:
+                self.invalidations += 1
@@ -0,0 +1,75 @@
+"""Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app    Linux/macOS: WORKERS processes (see gunicorn.conf.py)
+    python wsgi.py                           any OS, Windows included: waitress, one process
+
+`python server.py` stays the development server (debugger and reloader on).
+Settings (BIND, THREADS, DATABASE, GRANDSTREAM_IP, ...) come from PACKAGES_*
+environment variables or the PACKAGES_CONFIG file; see settings.py.
+
+Under waitress everything runs in one process with THREADS request
+threads, and /api/events streams are served on EVENTS_BIND by one more
+(see event_server.py): one PaddleOCR model, loaded in the background at startup, serves
+them all, and the OCR jobs and calls run alongside (with OCR_SERVICE on
+they're left to a separate ocr_service.py).
+
+Ctrl-C or SIGTERM stops accepting connections, ends the /api/events
+streams, waits up to GRACEFUL_TIMEOUT seconds for the requests in flight
+to be answered, then lets the OCR job and calls in progress finish.
+"""
+import signal
+import threading
+import time
+
+import server
+
+app = server.app
+
+
+def serve():
+    from waitress.channel import HTTPChannel
+    from waitress.server import create_server
+
+    server.init_db()
+    if not server.OCR_SERVICE:
+        server.ocr_engine.start()
+        server.get_ocr_jobs()
+        server.get_call_dispatcher()
+
+    stopping = threading.Event()
+    for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: stopping.set())
+
+    channels = {}
+    httpd = create_server(app, map=channels, listen=server.BIND, threads=server.THREADS)
+    # The server loop runs in a thread so this one can take signals and drain it on shutdown
+    threading.Thread(target=httpd.run, name='waitress', daemon=True).start()
+    server.start_event_server()
+    print(f'Serving on http://{server.BIND} ({server.THREADS} threads), '
+          f'events on http://{server.EVENTS_BIND}', flush=True)
+
+    while not stopping.wait(1):
+        pass
+
+    # Stop accepting; requests already received still run and their responses are sent
+    httpd.accepting = False
+    server.close_event_streams()
+    deadline = time.monotonic() + server.GRACEFUL_TIMEOUT
+    while time.monotonic() < deadline and _in_flight(channels, HTTPChannel):
+        time.sleep(0.1)
+    httpd.task_dispatcher.shutdown(timeout=1)
+    server.shutdown()
+
+
+def _in_flight(channels, channel_class):
+    """Whether any connection has a request being handled or a response not yet sent"""
+    try:
+        open_channels = list(channels.values())
+    except RuntimeError:  # a connection came or went mid-copy
+        return True
+    return any(isinstance(c, channel_class) and (c.requests or c.total_outbufs_len) for c in open_channels)
+
+
+if __name__ == '__main__':
+    serve()